@@ -0,0 +1,99 @@
+# Simulation of GC with a single fixed frequency MF input (fixed MF input/nm_model_{wt,ko}_fixed_freq_v4.ipf) with
+# the NumPy model in gc_iaf_model.py
+# STIMNO MF spikes at 100-300 Hz from STIMSTART, with stochastic release (BINOMIAL_N sites), for a GC held at
+# -100 to -70 mV. All holding potentials x frequencies x SIMULATIONS are built and integrated as one batch, and
+# GC rate and first spike delay (CalcSpikeDelay; SD as calculate_sd_of_spike_delay.ipf) are measured from
+# STIMSTART to 10 ms after the end of the train. VRE is the van Rossum distance (tau 10 ms) between the MF train and
+# the GC spikes during the train, as GetVanRossumError (waves of DURATION), averaged over the simulations.
+# Results are saved as results_fixed_freq_{condition}.txt (tab-delimited, one row per frequency and holding
+# potential).
+# run as python fixed_mf_input.py
+
+import numpy as np
+from datetime import datetime
+from gc_iaf_model import cell_params, fixed_spike_trains, synaptic_conductances, simulate, rates_and_delays, summary
+from van_rossum import van_rossum_distance
+
+# Cell parameters that differ from the random MF input simulations
+CONDITIONS = {'WT': {'e_leak': -110.},
+              'KO': {'e_leak': -100.}}
+
+COLUMNS = ['V_hold', 'MF_Freq', 'GC_Freq', 'GC_Freq_SD', 'Fano', 'VRE', 'Delay', 'Delay_SD']
+
+
+def run(condition, mf_freq, voltages, simulations=20, stimstart=50., stimno=10, duration=200., timestep=0.05,
+        binomial_n=10, seed=0, vr_tau=10.):
+    """
+    Simulates all holding potentials, MF frequencies and trials of a condition at once.
+
+    :param condition: 'WT' or 'KO'
+    :param mf_freq: MF frequencies (Hz)
+    :param voltages: holding potentials (mV)
+    :param simulations: number of simulations per frequency and holding potential
+    :param stimstart: time of the first MF spike (ms)
+    :param stimno: number of MF spikes
+    :param duration: simulation time (ms)
+    :param timestep: time step (ms)
+    :param binomial_n: number of release sites
+    :param seed: random seed of the release
+    :param vr_tau: kernel time constant(s) of the van Rossum distance (ms)
+    :return: dict with summary of rate and delay (frequencies x holding potentials, see gc_iaf_model.summary), mean
+             van Rossum distance (vre, frequencies x holding potentials (x taus if vr_tau has several values)), the
+             first spike delay of every simulation (frequencies x holding potentials x simulations) and GC spikes
+    """
+    mf_freq = np.asarray(mf_freq, float)
+    voltages = np.asarray(voltages, float)
+    shape = (len(mf_freq), len(voltages), simulations)
+    n_steps = int(round(duration / timestep)) + 1
+
+    freq = np.broadcast_to(mf_freq[:, None, None], shape).ravel()
+    trains = fixed_spike_trains(freq, stimstart, stimno)[:, None, :]
+    rng = np.random.RandomState(seed)
+    g_ampa, g_nmda = synaptic_conductances(trains, condition, condition, n_steps, timestep, binomial_n, rng)
+    p = cell_params(condition, v_rest=np.broadcast_to(voltages[None, :, None], shape).ravel(), temperature=25.,
+                    ap_refrac=1.5, **CONDITIONS[condition])
+    spikes = simulate(g_ampa, g_nmda, p, timestep)
+    gc_rates, delays = rates_and_delays(spikes, stimstart, stimstart + stimno * 1000. / freq + 10.)
+
+    results = summary(gc_rates.reshape(shape), delays.reshape(shape))
+    t_train = stimstart + stimno * 1000. / freq
+    gc = [s[(s >= stimstart) & (s <= t_train[k])] for k, s in enumerate(spikes)]
+    vre = van_rossum_distance(trains[:, 0, :], gc, vr_tau, duration)
+    results['vre'] = vre.reshape(shape + vre.shape[1:]).mean(axis=2)
+    results['MF_Freq'] = mf_freq
+    results['V_hold'] = voltages
+    results['delays'] = delays.reshape(shape)
+    results['trains'] = trains.reshape(shape + (stimno,))
+    results['spikes'] = [[spikes[(i * len(voltages) + j) * simulations:(i * len(voltages) + j + 1) * simulations]
+                          for j in range(len(voltages))] for i in range(len(mf_freq))]
+
+    return results
+
+
+def results_table(results):
+    """
+    Results as a table with the columns of COLUMNS, one row per frequency and holding potential.
+    """
+    V, F = np.meshgrid(results['V_hold'], results['MF_Freq'])
+
+    return np.column_stack([V.ravel(), F.ravel()] + [results[k].ravel() for k in
+                                                       ['rate', 'rate_sd', 'fano', 'vre', 'delay', 'delay_sd']])
+
+
+if __name__ == '__main__':
+
+    conditions = ['WT', 'KO']
+    mf_freq = np.array([100., 200., 300.])  # Hz
+    voltages = np.array([-100., -90., -80., -70.])  # mV
+    simulations = 20
+    seed = 0
+
+    for condition in conditions:
+        startTime = datetime.now()
+        results = run(condition, mf_freq, voltages, simulations, seed=seed)
+        print('{}: {}'.format(condition, datetime.now() - startTime))
+        for row in results_table(results):
+            print('{:4.0f} mV, {:3.0f} Hz: GC {:.2f} +- {:.2f} Hz, Fano {:.3f}, VRE {:.3f}, '
+                  'delay {:.2f} +- {:.2f} ms'.format(*row))
+        np.savetxt('results_fixed_freq_{}.txt'.format(condition), results_table(results), fmt='%.5f',
+                   delimiter='\t', header='\t'.join(COLUMNS), comments='')
@@ -0,0 +1,335 @@
+# Single-compartment GC integrate-and-fire model (NeuroMatic IAF_AdEx) with MF-GC conductance waves, in NumPy
+# All simulations (e.g. frequencies x trials) are integrated at once as one batch.
+#   cell: sphere of diameter DIAMETER (Cm = 1 uF/cm2 * pi * d^2), leak (GLEAK, ELEAK) and tonic GABA conductance
+#   (GTONIC, EGABA), holding current that keeps V at VMEM, spike-triggered adaptation current w (W_A, W_B, W_Tau)
+#   and threshold/reset/refractory period as set in Set_model of the .ipf files
+#   synapses: every MF spike adds a pulse amp * (exp(-t/tau_decay) - exp(-t/tau_rise)) per decay component
+#   (pulse=exp with amp1=-1, amp2=1 in the .ipf files), scaled by R*P of the RP plasticity model of its train
+#   NMDA: Mg block GC_Schwartz2012 (Rothman 2009 block as in MF_GC_network_model/grc_lemsDefinitions)
+# Units: ms, mV, nS, pA, pF
+# SYNAPSES and CELLS hold the parameter blocks of the WT and KO .ipf files.
+
+import numpy as np
+from scipy.signal import lfilter
+
+FARADAY = 96485.3365  # C/mol
+GAS_CONSTANT = 8.3144621  # J/(K mol)
+
+# Conductance waves (NMPulseExp) and RP plasticity (NMPulseTrainRP) of the WT_ and KO_ functions
+SYNAPSES = {
+    'WT': {
+        'ampa_direct': {'tau_rise': 0.3274, 'amp': [1.4, 0.55], 'tau_decay': [0.5, 4.],
+                        'Rinf': 1., 'Rmin': 0., 'tauR': 85., 'Pinf': 0.45, 'Pmax': np.inf, 'tauP': -1, 'Pscale': 0.},
+        'ampa_spill': {'tau_rise': 0.9, 'amp': [0.1, 0.25, 0.15], 'tau_decay': [0.8, 4., 30.],
+                       'Rinf': 1., 'Rmin': 0., 'tauR': 25., 'Pinf': 0.45, 'Pmax': np.inf, 'tauP': -1, 'Pscale': 0.},
+        'nmda': {'tau_rise': 2.5, 'amp': [0.3, 0.14], 'tau_decay': [30., 70.],
+                 'Rinf': 1., 'Rmin': 0., 'tauR': 50., 'Pinf': 0.45, 'Pmax': np.inf, 'tauP': 15., 'Pscale': 0.2}},
+    'KO': {
+        'ampa_direct': {'tau_rise': 0.45, 'amp': [0.196, 0.077], 'tau_decay': [0.9, 7.2],
+                        'Rinf': 1., 'Rmin': 0., 'tauR': 57., 'Pinf': 0.4, 'Pmax': np.inf, 'tauP': -1, 'Pscale': 0.},
+        'ampa_spill': {'tau_rise': 1.1, 'amp': [0.014, 0.035, 0.021], 'tau_decay': [1.44, 7.2, 54.],
+                       'Rinf': 1., 'Rmin': 0., 'tauR': 17., 'Pinf': 0.4, 'Pmax': np.inf, 'tauP': -1, 'Pscale': 0.},
+        'nmda': {'tau_rise': 2.5, 'amp': [0.45, 0.21], 'tau_decay': [30., 70.],
+                 'Rinf': 1., 'Rmin': 0., 'tauR': 50., 'Pinf': 0.45, 'Pmax': np.inf, 'tauP': 15., 'Pscale': 0.2}}}
+
+# Leak and tonic GABA conductance (nS) of the WT and KO models
+CELLS = {'WT': {'g_tonic': 0.16, 'g_leak': 0.366},
+         'KO': {'g_tonic': 0., 'g_leak': 0.333}}
+
+# IAF_AdEx parameters common to all simulations (Set_model)
+CELL_DEFAULTS = {'diameter': 11.7, 'e_gaba': -65., 'e_leak': -110., 'v_rest': -80., 'e_ampa': 0., 'e_nmda': 0.,
+                 'temperature': 37., 'ap_threshold': -45., 'ap_peak': 32., 'ap_reset': -75., 'ap_refrac': 0.75,
+                 'w_tau': 75., 'w_a': 0., 'w_b': 0.35, 'delta_t': 0.}
+
+
+def cell_params(condition='WT', **kwargs):
+    """
+    Cell parameters of the WT or KO model.
+
+    :param condition: 'WT' or 'KO' (leak and tonic GABA conductance)
+    :param kwargs: parameters that differ from CELL_DEFAULTS (e.g. e_leak, v_rest, ap_refrac, temperature)
+    :return: dict of cell parameters
+    """
+    p = dict(CELL_DEFAULTS)
+    p.update(CELLS[condition])
+    p.update(kwargs)
+
+    return p
+
+
+def capacitance(diameter):
+    """
+    Membrane capacitance (pF) of a sphere of the given diameter (um), 1 uF/cm2.
+    """
+    return 0.01 * np.pi * diameter ** 2
+
+
+def holding_current(p):
+    """
+    Holding current (pA) that keeps the cell at v_rest (iClampAmp in Set_model).
+    """
+    return p['g_tonic'] * (p['v_rest'] - p['e_gaba']) + p['g_leak'] * (p['v_rest'] - p['e_leak'])
+
+
+def nmda_block(v, temperature, mg=1.):
+    """
+    Mg block of NMDA receptors of GCs (GC_Schwartz2012; Rothman et al. 2009 parameters).
+
+    :param v: membrane potential (mV)
+    :param temperature: temperature (deg C)
+    :param mg: extracellular Mg concentration (mM)
+    :return: fraction of unblocked conductance
+    """
+    theta = 2. * FARADAY / (GAS_CONSTANT * (temperature + 273.15)) * 1e-3  # per mV
+    a = 2.07 * np.exp(0.35 * theta * v) + 0.015 * np.exp(-0.53 * theta * v)
+
+    return a / (a + mg * np.exp(-0.35 * theta * v))
+
+
+def random_spike_trains(rates, tbgn, tend, refrac, rng=np.random):
+    """
+    Poisson spike trains with a refractory period (train=random of NMPulseTrainRandomTimes).
+
+    ISIs are refrac plus an exponential interval, so that the mean ISI is 1/rate.
+
+    :param rates: firing rate of each train (Hz), any shape
+    :param tbgn: first possible spike time (ms)
+    :param tend: last possible spike time (ms)
+    :param refrac: minimum ISI (ms)
+    :param rng: random number generator (np.random or a RandomState)
+    :return: spike times (rates.shape x max. number of spikes), padded with inf
+    """
+    rates = np.asarray(rates, float)
+    mean_isi = 1000. / rates[..., None]
+    n = int(np.ceil((tend - tbgn) * rates.max() / 1000. * 1.2)) + 10
+    t = tbgn + np.cumsum(refrac + rng.exponential(size=rates.shape + (n,)) * (mean_isi - refrac), axis=-1)
+    while np.any(t[..., -1] <= tend):
+        t = np.concatenate([t, t[..., -1:] + np.cumsum(refrac + rng.exponential(size=rates.shape + (n,)) *
+                                                      (mean_isi - refrac), axis=-1)], axis=-1)
+    t[t > tend] = np.inf
+    n_max = np.isfinite(t).sum(axis=-1).max()
+
+    return t[..., :n_max]
+
+
+def fixed_spike_trains(frequencies, tbgn, n_spikes):
+    """
+    Spike trains at fixed frequencies (train=fixed), n_spikes per train starting at tbgn.
+
+    :param frequencies: frequency of each train (Hz), any shape
+    :return: spike times (frequencies.shape x n_spikes)
+    """
+    frequencies = np.asarray(frequencies, float)
+
+    return tbgn + np.arange(n_spikes) * 1000. / frequencies[..., None]
+
+
+def release_scale(spike_times, syn):
+    """
+    Amplitude scale R*P of every pulse of the RP plasticity model (NMPulseTrainRP).
+
+    Between spikes R and P relax exponentially to Rinf (tauR) and Pinf (tauP; tauP < 0 keeps P at Pinf).
+    At every spike the pulse is scaled by R*P, R is depleted to max(R*(1-P), Rmin) and P facilitates to
+    min(P*(1+Pscale), Pmax).
+
+    :param spike_times: spike times (... x spikes), sorted along the last axis and padded with inf
+    :param syn: synapse parameter dict (see SYNAPSES)
+    :return: R*P for every spike (same shape as spike_times, 0 for padding)
+    """
+    spike_times = np.asarray(spike_times, float)
+    scale = np.zeros(spike_times.shape)
+    R = syn['Rinf'] * np.ones(spike_times.shape[:-1])
+    P = syn['Pinf'] * np.ones(spike_times.shape[:-1])
+    t_last = np.full(spike_times.shape[:-1], -np.inf)
+    for k in range(spike_times.shape[-1]):
+        t = spike_times[..., k]
+        valid = np.isfinite(t)
+        isi = np.where(valid, t - t_last, 0.)
+        R = syn['Rinf'] + (R - syn['Rinf']) * np.exp(-isi / syn['tauR'])
+        if syn['tauP'] > 0:
+            P = syn['Pinf'] + (P - syn['Pinf']) * np.exp(-isi / syn['tauP'])
+            P_next = np.minimum(P * (1. + syn['Pscale']), syn['Pmax'])
+        else:
+            P_next = P
+        scale[..., k] = np.where(valid, R * P, 0.)
+        R = np.where(valid, np.maximum(R * (1. - P), syn['Rmin']), R)
+        P = np.where(valid, P_next, P)
+        t_last = np.where(valid, t, t_last)
+
+    return scale
+
+
+def binomial_release(scale, binomial_n, rng=np.random):
+    """
+    Stochastic pulse amplitudes (binomialN of NMPulseConfigAdd): every pulse releases Binomial(binomial_n, R*P)
+    quanta of 1/binomial_n of the amplitude, so that the mean amplitude is R*P.
+
+    :param scale: R*P of every pulse (see release_scale)
+    :param binomial_n: number of release sites
+    :return: pulse amplitude factors (same shape as scale)
+    """
+    return rng.binomial(binomial_n, np.clip(scale, 0., 1.)) * 1. / binomial_n
+
+
+def conductance(spike_times, syn, n_steps, dt, weights=None):
+    """
+    Conductance waves of a synapse type, summed over the inputs of every simulation.
+
+    Pulses are sampled on the time grid: a spike at t_j contributes exp(-(n*dt - t_j)/tau) at every grid point
+    n*dt >= t_j, so that each exponential is an exactly sampled first order filter of the spike train.
+
+    :param spike_times: spike times (simulations x inputs x spikes), padded with inf
+    :param syn: synapse parameter dict (see SYNAPSES)
+    :param n_steps: number of time points
+    :param dt: time step (ms)
+    :param weights: pulse amplitude factors (same shape as spike_times), default R*P of release_scale
+    :return: conductance (n_steps x simulations), nS
+    """
+    spike_times = np.asarray(spike_times, float)
+    if weights is None:
+        weights = release_scale(spike_times, syn)
+    n_sim = spike_times.shape[0]
+    sim = np.broadcast_to(np.arange(n_sim).reshape((n_sim,) + (1,) * (spike_times.ndim - 1)), spike_times.shape)
+    valid = np.isfinite(spike_times) & (spike_times < n_steps * dt)
+    t, sim, w = spike_times[valid], sim[valid], weights[valid]
+    step = np.ceil(t / dt - 1e-9).astype(int)
+    valid = step < n_steps
+    t, sim, w, step = t[valid], sim[valid], w[valid], step[valid]
+
+    taus = [syn['tau_rise']] + list(syn['tau_decay'])
+    amps = [-np.sum(syn['amp'])] + list(syn['amp'])
+    g = np.zeros((n_steps, n_sim))
+    for tau, amp in zip(taus, amps):
+        x = np.zeros((n_steps, n_sim))
+        np.add.at(x, (step, sim), amp * w * np.exp(-(step * dt - t) / tau))
+        g += lfilter([1.], [1., -np.exp(-dt / tau)], x, axis=0)
+
+    return g
+
+
+def synaptic_conductances(spike_times, ampa, nmda, n_steps, dt, binomial_n=None, rng=np.random):
+    """
+    AMPA (direct + spillover) and NMDA conductance waves.
+
+    :param spike_times: spike times (simulations x inputs x spikes), padded with inf
+    :param ampa: synapse parameter dicts of the AMPA component ('WT' or 'KO', or a dict as in SYNAPSES)
+    :param nmda: synapse parameter dicts of the NMDA component
+    :param binomial_n: number of release sites for stochastic release (default: deterministic amplitudes R*P)
+    :param rng: random number generator for stochastic release
+    :return: g_ampa, g_nmda (n_steps x simulations), nS
+    """
+    ampa = SYNAPSES[ampa] if isinstance(ampa, str) else ampa
+    nmda = SYNAPSES[nmda] if isinstance(nmda, str) else nmda
+    g = []
+    for syns in [[ampa['ampa_direct'], ampa['ampa_spill']], [nmda['nmda']]]:
+        g_syn = np.zeros((n_steps, spike_times.shape[0]))
+        for syn in syns:
+            if binomial_n is None:
+                g_syn += conductance(spike_times, syn, n_steps, dt)
+                continue
+            # Every decay component is a separate pulse configuration, with its own release
+            scale = release_scale(spike_times, syn)
+            for amp, tau_decay in zip(syn['amp'], syn['tau_decay']):
+                g_syn += conductance(spike_times, dict(syn, amp=[amp], tau_decay=[tau_decay]), n_steps, dt,
+                                     binomial_release(scale, binomial_n, rng))
+        g.append(g_syn)
+
+    return g[0], g[1]
+
+
+def simulate(g_ampa, g_nmda, p, dt, record_v=False):
+    """
+    Integrates the IAF_AdEx model (forward Euler) for all simulations at once.
+
+    C dV/dt = I_hold - g_leak (V - e_leak) - g_tonic (V - e_gaba) - g_ampa (V - e_ampa)
+              - g_nmda B(V) (V - e_nmda) - w [+ g_leak delta_t exp((V - ap_threshold) / delta_t)]
+    w_tau dw/dt = w_a (V - e_leak) - w
+    A spike is fired when V reaches ap_threshold (ap_peak if delta_t > 0); V is then set to ap_peak for one time
+    step and held at ap_reset for ap_refrac, and w is incremented by w_b.
+
+    :param g_ampa: AMPA conductance (n_steps x simulations), nS
+    :param g_nmda: NMDA conductance before Mg block (n_steps x simulations), nS
+    :param p: cell parameter dict (see cell_params); parameters can also be arrays with a value per simulation
+    :param dt: time step (ms)
+    :param record_v: return membrane potential as well (default=False)
+    :return: spike times of every simulation (list of arrays, ms), and V (n_steps x simulations) if record_v
+    """
+    n_steps, n_sim = g_ampa.shape
+    C = capacitance(p['diameter'])
+    i_hold = holding_current(p)
+    v_spike = p['ap_peak'] if p['delta_t'] > 0 else p['ap_threshold']
+    v = p['v_rest'] * np.ones(n_sim)
+    w = np.zeros(n_sim)
+    refractory_until = -np.ones(n_sim)
+    spike_sim, spike_t = [], []
+    if record_v:
+        v_rec = np.zeros((n_steps, n_sim))
+        v_rec[0] = v
+
+    for step in range(n_steps - 1):
+        t = step * dt
+        i = i_hold - p['g_leak'] * (v - p['e_leak']) - p['g_tonic'] * (v - p['e_gaba']) - \
+            g_ampa[step] * (v - p['e_ampa']) - g_nmda[step] * nmda_block(v, p['temperature']) * (v - p['e_nmda']) - w
+        if p['delta_t'] > 0:
+            i += p['g_leak'] * p['delta_t'] * np.exp(np.minimum((v - p['ap_threshold']) / p['delta_t'], 50.))
+        w += dt * (p['w_a'] * (v - p['e_leak']) - w) / p['w_tau']
+        refractory = t + dt <= refractory_until
+        v = np.where(refractory, p['ap_reset'], v + dt * i / C)
+        fired = v >= v_spike
+        if fired.any():
+            spike_sim.append(np.where(fired)[0])
+            spike_t.append((t + dt) * np.ones(fired.sum()))
+            w[fired] += p['w_b']
+            refractory_until[fired] = t + dt + p['ap_refrac']
+        if record_v:
+            v_rec[step + 1] = np.where(fired, p['ap_peak'], v)
+        v[fired] = p['ap_reset']
+
+    if len(spike_sim) > 0:
+        spike_sim, spike_t = np.concatenate(spike_sim), np.concatenate(spike_t)
+    spikes = [spike_t[spike_sim == k] for k in range(n_sim)] if len(spike_sim) > 0 else \
+        [np.zeros(0) for k in range(n_sim)]
+    if record_v:
+        return spikes, v_rec
+
+    return spikes
+
+
+def rates_and_delays(spikes, tbgn, tend):
+    """
+    Firing rate in [tbgn, tend) and delay of the first spike in that window from tbgn, for every simulation.
+
+    :param spikes: spike times of every simulation (list of arrays, ms)
+    :param tbgn: start of the window (ms), scalar or one value per simulation
+    :param tend: end of the window (ms), scalar or one value per simulation
+    :return: rates (Hz), delays (ms, NaN for simulations without spikes)
+    """
+    tbgn = np.broadcast_to(tbgn, (len(spikes),))
+    tend = np.broadcast_to(tend, (len(spikes),))
+    rates = np.zeros(len(spikes))
+    delays = np.nan * np.ones(len(spikes))
+    for k, s in enumerate(spikes):
+        s = s[(s >= tbgn[k]) & (s < tend[k])]
+        rates[k] = len(s) * 1000. / (tend[k] - tbgn[k])
+        if len(s) > 0:
+            delays[k] = s[0] - tbgn[k]
+
+    return rates, delays
+
+
+def summary(rates, delays):
+    """
+    Mean and SD (over trials, last axis) of rate and first spike delay, and Fano factor (SD^2 / rate), as
+    wOut of run_model in the .ipf files.
+
+    :return: dict of rate, rate_sd, fano, delay and delay_sd
+    """
+    rate, rate_sd = rates.mean(axis=-1), rates.std(axis=-1, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fano = rate_sd ** 2 / rate
+    n = np.sum(np.isfinite(delays), axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delay = np.nansum(delays, axis=-1) / n
+        delay_sd = np.where(n > 1, np.sqrt(np.nansum((delays - delay[..., None]) ** 2, axis=-1) / (n - 1.)), np.nan)
+
+    return {'rate': rate, 'rate_sd': rate_sd, 'fano': fano, 'delay': delay, 'delay_sd': delay_sd}
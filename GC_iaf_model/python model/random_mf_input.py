@@ -0,0 +1,123 @@
+# Simulation of GC with 4 Poisson MF inputs (random MF input/*.ipf) with the NumPy model in gc_iaf_model.py
+# All MF frequencies x SIMULATIONS random trains of a variant are simulated as one batch.
+# MF_Freq is the summed frequency of the 4 MFs, each MF fires at MF_Freq/4 with a refractory period of 0.6 ms
+# between STIMSTART and DURATION - STIMSTART. GC rate and first spike delay are measured in the same window.
+# Variants: model of the cell (leak/tonic GABA), AMPA and NMDA conductances
+#   WT, KO; KO_inhib (KO synapses with WT tonic inhibition), KO_wtNMDA (KO with WT NMDA conductance),
+#   KO_inhib_and_WT_nmda
+# Sweeps: low_freq (20-320 Hz, 1300 ms) and high_freq (50-1000 Hz, 1200 ms)
+# VRE is the van Rossum distance (tau 10 ms) between the combined MF trains and the GC spikes from 200 to 1200 ms,
+# as GetVanRossumError (waves of 1500 ms), averaged over the trains.
+# Results are saved as results_{sweep}_{variant}.txt (tab-delimited, columns as the table of run() in Igor).
+# run as python random_mf_input.py
+
+import numpy as np
+import os
+from datetime import datetime
+from gc_iaf_model import cell_params, random_spike_trains, synaptic_conductances, simulate, rates_and_delays, summary
+from van_rossum import van_rossum_distance
+
+VARIANTS = {'WT': ('WT', 'WT', 'WT'),
+            'KO': ('KO', 'KO', 'KO'),
+            'KO_inhib': ('WT', 'KO', 'KO'),
+            'KO_wtNMDA': ('KO', 'KO', 'WT'),
+            'KO_inhib_and_WT_nmda': ('WT', 'KO', 'WT')}
+
+SWEEPS = {'low_freq': {'duration': 1300., 'freq_inc': 20., 'num_freq': 16},
+          'high_freq': {'duration': 1200., 'freq_inc': 50., 'num_freq': 20}}
+
+COLUMNS = ['MF_Freq', 'GC_Freq', 'GC_Freq_SD', 'Fano', 'VRE', 'Delay', 'Delay_SD']
+
+
+def run(variant, mf_freq, duration, simulations=10, stimstart=100., timestep=0.05, num_mf=4, refrac=0.6, seed=0,
+        vr_tau=10., vr_window=(200., 1200.), vr_length=1500.):
+    """
+    Simulates all MF frequencies and trials of a variant at once.
+
+    :param variant: key of VARIANTS
+    :param mf_freq: summed MF frequencies (Hz)
+    :param duration: simulation time (ms)
+    :param simulations: number of random trains per frequency
+    :param stimstart: start of stimulation (ms)
+    :param timestep: time step (ms)
+    :param num_mf: number of MF inputs
+    :param refrac: minimum MF ISI (ms)
+    :param seed: random seed of the MF trains
+    :param vr_tau: kernel time constant(s) of the van Rossum distance (ms)
+    :param vr_window: GC spikes compared with the MF trains (ms)
+    :param vr_length: end of the van Rossum integral (ms)
+    :return: dict with summary of rate and delay per frequency (see gc_iaf_model.summary), mean van Rossum
+             distance per frequency (vre, frequencies x taus if vr_tau has several values), MF trains
+             (frequencies x simulations x MFs x spikes) and GC spikes (frequencies x simulations lists)
+    """
+    cell, ampa, nmda = VARIANTS[variant]
+    mf_freq = np.asarray(mf_freq, float)
+    n_steps = int(round(duration / timestep)) + 1
+    tbgn, tend = stimstart, duration - stimstart
+
+    rng = np.random.RandomState(seed)
+    rates = np.ones((len(mf_freq), simulations, num_mf)) * mf_freq[:, None, None] / num_mf
+    trains = random_spike_trains(rates, tbgn, tend, refrac, rng)
+    g_ampa, g_nmda = synaptic_conductances(trains.reshape((-1,) + trains.shape[2:]), ampa, nmda, n_steps, timestep)
+    spikes = simulate(g_ampa, g_nmda, cell_params(cell), timestep)
+    gc_rates, delays = rates_and_delays(spikes, tbgn, tend)
+
+    results = summary(gc_rates.reshape(len(mf_freq), simulations), delays.reshape(len(mf_freq), simulations))
+    mf = np.sort(trains.reshape(len(spikes), -1), axis=-1)
+    gc = [s[(s >= vr_window[0]) & (s <= vr_window[1])] for s in spikes]
+    vre = van_rossum_distance(mf, gc, vr_tau, vr_length)
+    results['vre'] = vre.reshape((len(mf_freq), simulations) + vre.shape[1:]).mean(axis=1)
+    results['MF_Freq'] = mf_freq
+    results['trains'] = trains
+    results['spikes'] = [spikes[k * simulations:(k + 1) * simulations] for k in range(len(mf_freq))]
+
+    return results
+
+
+def results_table(results):
+    """
+    Results as a table with the columns of COLUMNS (frequencies x columns).
+    """
+    return np.column_stack([results[k] for k in ['MF_Freq', 'rate', 'rate_sd', 'fano', 'vre', 'delay', 'delay_sd']])
+
+
+def compare_igor(results, filename):
+    """
+    Compares results with the table of an Igor run, saved as tab-delimited text with wave names as column labels
+    (Save/J/W MF_Freq, GC_Freq, ...).
+
+    :return: dict with the difference (Python - Igor) of every column found in the file
+    """
+    igor = np.genfromtxt(filename, delimiter='\t', names=True)
+    table = results_table(results)
+    differences = {}
+    for k, name in enumerate(COLUMNS):
+        if name in igor.dtype.names:
+            differences[name] = table[:, k] - igor[name]
+            print('{}: max. abs. difference {:.4f}'.format(name, np.nanmax(np.abs(differences[name]))))
+
+    return differences
+
+
+if __name__ == '__main__':
+
+    sweeps = ['low_freq', 'high_freq']
+    variants = ['WT', 'KO', 'KO_inhib', 'KO_wtNMDA', 'KO_inhib_and_WT_nmda']
+    simulations = 10  # number of random trains per frequency
+    seed = 0
+    igor_dir = None  # folder with Igor result tables {sweep}_{variant}.txt to compare with, if available
+
+    for sweep in sweeps:
+        s = SWEEPS[sweep]
+        mf_freq = s['freq_inc'] + np.arange(s['num_freq']) * s['freq_inc']
+        for variant in variants:
+            startTime = datetime.now()
+            results = run(variant, mf_freq, s['duration'], simulations, seed=seed)
+            print('{} {}: {}'.format(sweep, variant, datetime.now() - startTime))
+            for row in results_table(results):
+                print('{:6.0f} Hz: GC {:.2f} +- {:.2f} Hz, Fano {:.3f}, VRE {:.3f}, '
+                      'delay {:.2f} +- {:.2f} ms'.format(*row))
+            np.savetxt('results_{}_{}.txt'.format(sweep, variant), results_table(results), fmt='%.5f',
+                       delimiter='\t', header='\t'.join(COLUMNS), comments='')
+            if igor_dir is not None and os.path.exists(os.path.join(igor_dir, '{}_{}.txt'.format(sweep, variant))):
+                compare_igor(results, os.path.join(igor_dir, '{}_{}.txt'.format(sweep, variant)))
@@ -0,0 +1,102 @@
+# Van Rossum distance between spike trains, computed exactly from the spike times
+# As van_rossum in analysis routines/van_rossum_error.ipf, every spike train is convolved with exp(-t/tau) and
+# D^2 = 1/tau * integral (f - g)^2 dt. For exponential kernels the integral is a sum over spike pairs,
+#   D^2 = 1/2 * (sum_ij exp(-|t_i - t_j|/tau) + sum_ij exp(-|s_i - s_j|/tau) - 2 sum_ij exp(-|t_i - s_j|/tau)),
+# which is accumulated in one pass over the merged, sorted spikes of both trains (O(n + m) per pair).
+# With t_end, the integral ends at t_end as in Igor (waves of 1500 ms), which subtracts
+# 1/2 * (sum_i exp(-(t_end - t_i)/tau) - sum_j exp(-(t_end - s_j)/tau))^2.
+# All pairs of trains and kernel time constants are computed at once.
+
+import numpy as np
+
+
+def van_rossum_distance(trains1, trains2, tau=10., t_end=None):
+    """
+    Van Rossum distance between pairs of spike trains, for one or several kernel time constants.
+
+    :param trains1: spike times (ms) of the first train of every pair (pairs x spikes, any leading shape), padded
+                    with inf or NaN; a 1D array is a single train
+    :param trains2: spike times of the second train of every pair (leading shape broadcastable with trains1)
+    :param tau: kernel time constant(s) (ms)
+    :param t_end: end of the integration (ms), default infinity; spikes after t_end are ignored
+    :return: distances (pairs x taus, without the axes of scalar pairs or tau)
+    """
+    trains1, trains2 = _as_trains(trains1), _as_trains(trains2)
+    taus = np.atleast_1d(np.asarray(tau, float))
+    if t_end is not None:
+        trains1 = np.where(trains1 <= t_end, trains1, np.inf)
+        trains2 = np.where(trains2 <= t_end, trains2, np.inf)
+    shape = np.broadcast(trains1[..., 0], trains2[..., 0]).shape
+    trains1 = np.broadcast_to(trains1, shape + trains1.shape[-1:])
+    trains2 = np.broadcast_to(trains2, shape + trains2.shape[-1:])
+
+    # Merge both trains of every pair (label True for spikes of the first train)
+    times = np.concatenate([trains1, trains2], axis=-1)
+    labels = np.concatenate([np.ones(trains1.shape, bool), np.zeros(trains2.shape, bool)], axis=-1)
+    order = np.argsort(times, axis=-1, kind='mergesort')
+    times = np.take_along_axis(times, order, axis=-1)[..., None]
+    labels = np.take_along_axis(labels, order, axis=-1)[..., None]
+
+    # Kernel sums of both trains at the current spike, and the pair sums
+    m1, m2 = np.zeros(shape + taus.shape), np.zeros(shape + taus.shape)
+    self1, self2, cross = np.zeros(shape + taus.shape), np.zeros(shape + taus.shape), np.zeros(shape + taus.shape)
+    t_last = np.full(shape + (1,), -np.inf)
+    n_spikes = np.isfinite(times).sum(axis=-2).max() if times.size > 0 else 0
+    for k in range(n_spikes):
+        t, is1 = times[..., k, :], labels[..., k, :]
+        valid = np.isfinite(t)
+        decay = np.exp(-np.where(valid, t - t_last, 0.) / taus)
+        m1 *= decay
+        m2 *= decay
+        self1 += np.where(valid & is1, 2. * m1 + 1., 0.)
+        self2 += np.where(valid & ~is1, 2. * m2 + 1., 0.)
+        cross += np.where(valid, np.where(is1, m2, m1), 0.)
+        m1 += valid & is1
+        m2 += valid & ~is1
+        t_last = np.where(valid, t, t_last)
+    d2 = 0.5 * (self1 + self2 - 2. * cross)
+
+    if t_end is not None:
+        tail = np.zeros(shape + taus.shape)
+        for trains, sign in [(trains1, 1.), (trains2, -1.)]:
+            t = np.where(np.isfinite(trains), trains, -np.inf)[..., None]
+            tail += sign * np.exp(-(t_end - t) / taus).sum(axis=-2)
+        d2 -= 0.5 * tail ** 2
+
+    d = np.sqrt(np.maximum(d2, 0.))
+    if np.ndim(tau) == 0:
+        d = d[..., 0]
+
+    return d
+
+
+def _as_trains(trains):
+    # Spike trains as float array (... x spikes) with inf for padding
+    if not isinstance(trains, np.ndarray) and len(trains) > 0 and np.ndim(trains[0]) > 0:
+        n = max(len(t) for t in trains)
+        trains = np.array([np.concatenate([np.asarray(t, float), np.inf * np.ones(n - len(t))]) for t in trains])
+    trains = np.array(trains, float, ndmin=1)
+    trains[np.isnan(trains)] = np.inf
+    if trains.shape[-1] == 0:
+        trains = np.inf * np.ones(trains.shape[:-1] + (1,))
+
+    return trains
+
+
+def van_rossum_wave(train1, train2, tau=10., length=1500., dx=1. / 200):
+    """
+    Van Rossum distance as computed in van_rossum_error.ipf (spike waves sampled at dx, convolved with a kernel
+    of length/10 and integrated up to length), for comparison with van_rossum_distance.
+    """
+    n = int(round(length / dx))
+    kernel = np.exp(-np.arange(n // 10) * dx / tau)
+    waves = []
+    for train in [train1, train2]:
+        w = np.zeros(n)
+        train = np.asarray(train, float)
+        w[np.round(train[train < length] / dx).astype(int)] = 1.
+        waves.append(np.convolve(w, kernel)[:n])
+    difference = (waves[1] - waves[0]) ** 2
+    area = (difference.sum() - 0.5 * (difference[0] + difference[-1])) * dx
+
+    return np.sqrt(area / tau)
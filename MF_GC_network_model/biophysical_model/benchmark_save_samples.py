@@ -0,0 +1,79 @@
+# Compares the spike counting of save_samples_as_txt.py with the previous per-cell loop and np.loadtxt
+# on a synthetic results directory of random .dat spike files
+# run as python benchmark_save_samples.py [basedir] [n_runs] [n_processes]
+# basedir (default benchmark_samples) is created if needed and filled with 2 x n_runs .dat files
+
+import numpy as np
+import os
+import sys
+from datetime import datetime
+from multiprocessing import Pool, cpu_count
+from functools import partial
+import save_samples_as_txt as save_samples
+
+
+def get_spike_counts_loop(data, N):
+	# Spike counting of save_samples_as_txt.py before vectorization, as reference
+	x = np.zeros(N)
+	if len(data) > 0:
+		for i in range(N):
+			if len(data.shape) == 1:
+				data = data.reshape(1, 2)
+			ixs = np.where(data[:, 0] == i)[0]
+			# Number of spikes after 150 ms 'burn in' period
+			x[i] = len(np.where(data[ixs, :][:, 1] >= 0.150)[0])
+
+	return x
+
+
+def write_synthetic_runs(basedir, n_runs, N_mf=187, N_grc=487, rate_mf=50., rate_grc=20., duration=0.18):
+	# Random spike files in the jNeuroML format (cell index, time in s), named as N_syn_f_mf_pattern
+	end_filenames = ['4_0.50_'+str(kk) for kk in range(n_runs)]
+	for end_filename in end_filenames:
+		for population, N, rate in [('MF', N_mf, rate_mf), ('GrC', N_grc, rate_grc)]:
+			n_spikes = np.random.poisson(N * rate * duration)
+			data = np.column_stack((np.random.randint(N, size=n_spikes), np.sort(np.random.rand(n_spikes) * duration)))
+			np.savetxt(basedir+'/'+population+'_spikes_'+end_filename+'.dat', data, fmt=['%d', '%.5f'], delimiter='\t')
+
+	return end_filenames
+
+
+if __name__ == '__main__':
+
+	basedir = sys.argv[1] if len(sys.argv) > 1 else 'benchmark_samples'
+	n_runs = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+	n_processes = int(sys.argv[3]) if len(sys.argv) > 3 else cpu_count()
+	N_mf = 187
+	N_grc = 487
+
+	if not os.path.isdir(basedir):
+		os.makedirs(basedir)
+	np.random.seed(0)
+	end_filenames = write_synthetic_runs(basedir, n_runs, N_mf, N_grc)
+
+	# Previous script: np.loadtxt and per-cell loop, one run after the other
+	startTime = datetime.now()
+	samples_loop = np.column_stack([np.concatenate((
+		get_spike_counts_loop(np.loadtxt(basedir+'/MF_spikes_'+end_filename+'.dat'), N_mf),
+		get_spike_counts_loop(np.loadtxt(basedir+'/GrC_spikes_'+end_filename+'.dat'), N_grc)))
+		for end_filename in end_filenames])
+	t_loop = (datetime.now() - startTime).total_seconds()
+
+	# Vectorized counting and bulk parsing, one process
+	startTime = datetime.now()
+	samples = np.column_stack([np.concatenate(save_samples.count_run(basedir, end_filename, N_mf, N_grc))
+							   for end_filename in end_filenames])
+	t_vec = (datetime.now() - startTime).total_seconds()
+
+	# Vectorized counting and bulk parsing, process pool
+	startTime = datetime.now()
+	pool = Pool(n_processes)
+	counts = pool.map(partial(save_samples.count_run, basedir, N_mf=N_mf, N_grc=N_grc), end_filenames, chunksize=16)
+	pool.close()
+	pool.join()
+	samples_pool = np.column_stack([np.concatenate(x) for x in counts])
+	t_pool = (datetime.now() - startTime).total_seconds()
+
+	assert (np.array_equal(samples, samples_loop) and np.array_equal(samples_pool, samples_loop)), 'Spike counts differ.'
+	print('{} runs: loop {:.2f} s, vectorized {:.2f} s ({:.1f}x), vectorized with {} processes {:.2f} s ({:.1f}x)'.format(
+		n_runs, t_loop, t_vec, t_loop / t_vec, n_processes, t_pool, t_loop / t_pool))
@@ -1,7 +1,11 @@
 # Get population sparseness, variance & covariance
+# Statistics are computed by population_statistics.py; get_spar and get_var_cov below are the previous
+# per-pattern loop and general eigensolver versions, kept to check results (set check to True)
 
 import numpy as np
 import sys
+import sample_store
+import population_statistics as stats
 
 
 def get_spar(x):
@@ -35,17 +39,26 @@ if __name__ == '__main__':
 	N_syn = 4
 	f_mf = np.linspace(0.1, 0.9, 9)
 
+	# set to True to compare with get_spar and get_var_cov
+	check = False
+
 	spar_mf, spar_gc, active_mf, active_gc = (np.zeros(len(f_mf), float) for i in range(4))
 	var_mf, cov_mf, var_gc, cov_gc = (np.zeros(len(f_mf), float) for i in range(4))
 
 	print(N_syn)
 	for k in range(len(f_mf)):
-		samples_mf = np.loadtxt(basedir + '/MF_samples_{:.0f}_{:.2f}.txt'.format(N_syn, f_mf[k]))
-		samples_gc = np.loadtxt(basedir + '/GrC_samples_{:.0f}_{:.2f}.txt'.format(N_syn, f_mf[k]))
-		spar_mf[k], active_mf[k] = get_spar(samples_mf)
-		spar_gc[k], active_gc[k] = get_spar(samples_gc)
-		var_mf[k], cov_mf[k] = get_var_cov(samples_mf)
-		var_gc[k], cov_gc[k] = get_var_cov(samples_gc)
+		samples_mf = sample_store.load_samples(basedir, 'MF', N_syn, f_mf[k])
+		samples_gc = sample_store.load_samples(basedir, 'GrC', N_syn, f_mf[k])
+		spar_mf[k], active_mf[k] = stats.get_spar(samples_mf)
+		spar_gc[k], active_gc[k] = stats.get_spar(samples_gc)
+		var_mf[k], cov_mf[k] = stats.get_var_cov(samples_mf)
+		var_gc[k], cov_gc[k] = stats.get_var_cov(samples_gc)
+		if check:
+			for samples in [samples_mf, samples_gc]:
+				assert np.allclose(stats.get_spar(samples), get_spar(samples), rtol=1e-10, atol=0), 'Sparseness differs.'
+				# (with more cells than patterns, get_var_cov also sums square roots of eigenvalues that are zero
+				# up to rounding errors, which can shift the covariance measure by about 1e-7 relative)
+				assert np.allclose(stats.get_var_cov(samples), get_var_cov(samples), rtol=1e-6, atol=0), 'Variance/covariance differs.'
 
 	filename1 = 'gc_spar_biophys_' + basedir.split('_')[-1][:-1] + '.txt'
 	np.savetxt(basedir + filename1, np.transpose([spar_mf, spar_gc, active_mf, active_gc]), delimiter='\t')
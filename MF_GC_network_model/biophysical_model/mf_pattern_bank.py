@@ -0,0 +1,140 @@
+# Precomputes the MF activation patterns (active/inactive MFs) of all runs for all correlation radii
+# Run as: python mf_pattern_bank.py (after initialize_network_params.py), creates mf_pattern_bank.npz
+# run_mf_grc_network.py then looks up the pattern of each run instead of drawing it.
+#
+# Patterns are identical to those drawn run by run in run_mf_grc_network.select_mf_pattern:
+# random patterns (correlation radius 0) use random.sample after random.seed(runID), correlated patterns
+# threshold np.dot(R.T, randn(N_mf)) after np.random.seed(runID). The Gaussian draws are shared by all
+# radii, so each radius only needs one matrix multiply per fraction of active MFs.
+# Patterns are stored bit-packed (np.packbits), one row per runID.
+
+import numpy as np
+import pickle as pkl
+import random
+import scipy.io as io
+
+
+def draw_gaussian_inputs(runIDs, N_mf):
+    """
+    Gaussian input vectors of the correlated MF patterns, seeded with runID as in run_mf_grc_network.
+
+    :param runIDs: list of runIDs
+    :param N_mf: number of MFs
+    :return: array (runs x N_mf)
+    """
+    Z = np.zeros((len(runIDs), N_mf))
+    for k, runID in enumerate(runIDs):
+        np.random.seed(runID)
+        Z[k] = np.random.randn(N_mf)
+
+    return Z
+
+
+def random_patterns(runIDs, f_mf, N_mf):
+    """
+    Random MF patterns (correlation radius 0).
+
+    :param runIDs: list of runIDs
+    :param f_mf: fraction of active MFs of each run
+    :param N_mf: number of MFs
+    :return: boolean array (runs x N_mf), True for active MFs
+    """
+    S = np.zeros((len(runIDs), N_mf), bool)
+    for k, runID in enumerate(runIDs):
+        random.seed(runID)
+        S[k, random.sample(range(N_mf), int(N_mf * f_mf[k]))] = True
+
+    return S
+
+
+def correlated_patterns(Z, f_mf, mf_patterns):
+    """
+    Spatially correlated MF patterns for one correlation radius.
+
+    :param Z: Gaussian input vectors (runs x N_mf), see draw_gaussian_inputs
+    :param f_mf: fraction of active MFs of each run
+    :param mf_patterns: contents of mf_patterns_r*.mat (Rs, gs)
+    :return: boolean array (runs x N_mf), True for active MFs
+    """
+    f_mf_range = np.linspace(.05, .95, 19)
+    S = np.zeros(Z.shape, bool)
+    for f in np.unique(f_mf):
+        f_mf_ix = np.where(np.isclose(f_mf_range, f))[0][0]
+        runs = np.where(f_mf == f)[0]
+        R = mf_patterns['Rs'][:, :, f_mf_ix]
+        g = mf_patterns['gs'][f_mf_ix]
+        S[runs] = np.dot(Z[runs], R) > -g
+
+    return S
+
+
+def generate_pattern_bank(p, N_mf, correlationRadii, input_dir='../input_statistics/'):
+    """
+    Generates the MF patterns of all runs in params_file.pkl for the given correlation radii.
+
+    :param p: run parameters (contents of params_file.pkl)
+    :param N_mf: number of MFs
+    :param correlationRadii: MF correlation radii, out of [0,5,10,15,20,25,30]
+    :param input_dir: folder containing mf_patterns_r*.mat
+    :return: dict with run parameters and bit-packed patterns per radius ('patterns_r*')
+    """
+    runIDs = range(len(p['f_mf']))
+    bank = {'N_syn': p['N_syn'], 'f_mf': p['f_mf'], 'run_num': p['run_num'],
+            'N_mf': N_mf, 'radii': np.array(correlationRadii)}
+    Z = None
+    for correlationRadius in correlationRadii:
+        if correlationRadius == 0:
+            S = random_patterns(runIDs, p['f_mf'], N_mf)
+        else:
+            if Z is None:
+                Z = draw_gaussian_inputs(runIDs, N_mf)
+            mf_patterns = io.loadmat(input_dir + 'mf_patterns_r{:.0f}.mat'.format(correlationRadius))
+            S = correlated_patterns(Z, p['f_mf'], mf_patterns)
+        bank['patterns_r{}'.format(correlationRadius)] = np.packbits(S, axis=1)
+
+    return bank
+
+
+def is_current(bank, p):
+    """
+    Checks that a pattern bank was generated for the run parameters p.
+    """
+    return all(np.array_equal(bank[key], p[key]) for key in ['N_syn', 'f_mf', 'run_num'])
+
+
+def lookup(bank, correlationRadius, runID):
+    """
+    Indices of active MFs of a run.
+
+    :param bank: pattern bank as returned by generate_pattern_bank or np.load
+    :param correlationRadius: MF correlation radius
+    :param runID: ID number of the run (=pattern)
+    :return: sorted array of indices of active MFs
+    """
+    row = bank['patterns_r{}'.format(correlationRadius)][int(runID)]
+
+    return np.where(np.unpackbits(row)[:int(bank['N_mf'])])[0]
+
+
+if __name__ == '__main__':
+
+    import sys
+    sys.path.append('../network_structures')
+    import connectivity
+
+    correlations = [0, 5, 10, 15, 20, 25, 30]
+
+    file = open('params_file.pkl', 'rb')
+    p = pkl.load(file)
+    file.close()
+
+    # Number of MFs from the connectivity used by the runs
+    N_mf = []
+    for N_syn in np.unique(p['N_syn']):
+        N_mf.append(connectivity.load_connectivity(
+            connectivity.connectivity_file(N_syn, '../network_structures'))['conn_mat'].shape[0])
+    assert (len(np.unique(N_mf)) == 1), 'Connectivity files differ in number of MFs.'
+
+    bank = generate_pattern_bank(p, N_mf[0], correlations)
+    np.savez_compressed('mf_pattern_bank.npz', **bank)
+    print('{} patterns for correlation radii {}'.format(len(p['f_mf']), correlations))
@@ -0,0 +1,143 @@
+# Population sparseness, variance and covariance of activity patterns (cells x patterns)
+# Same measures as get_spar and get_var_cov in get_spar_cov.py, computed for all patterns at once:
+#   sparseness: (N - (sum x)^2 / sum x^2) / (N - 1) per pattern, averaged over patterns
+#   active fraction: fraction of cells with x > 0 per pattern, averaged over patterns
+#   variance: total variance, the trace of the covariance matrix (= sum of its eigenvalues)
+#   covariance: (max(sqrt(L)) / sum(sqrt(L)) - 1/N) / (1 - 1/N) for the eigenvalues L of the covariance matrix
+# The eigenvalues are computed with a symmetric solver from the smaller of the covariance matrix (N x N) and the
+# Gram matrix of the patterns (patterns x patterns), which share their non-zero eigenvalues.
+# StreamingStatistics accumulates the same measures while patterns are added one at a time.
+
+import numpy as np
+
+
+def get_spar(x):
+    """
+    Population sparseness and fraction of active cells, averaged over patterns.
+
+    :param x: activity patterns (cells x patterns)
+    :return: sparseness, active fraction
+    """
+    x = np.asarray(x, float)
+    N = x.shape[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sptemp = (N - np.sum(x, axis=0) ** 2. / np.sum(x ** 2., axis=0)) / (N - 1.)
+    sptemp2 = np.sum(x > 0, axis=0) * 1. / N
+    spar = np.nanmean(sptemp)
+    active = np.nanmean(sptemp2)
+
+    return spar, active
+
+
+def covariance_eigenvalues(x):
+    """
+    Eigenvalues of the covariance matrix of x (cells x patterns) that can be non-zero; negative rounding errors are
+    set to zero.
+    """
+    x = np.asarray(x, float)
+    x_c = (x - x.mean(axis=1)[:, None]) / np.sqrt(x.shape[1] - 1.)
+    if x.shape[0] <= x.shape[1]:
+        L = np.linalg.eigvalsh(np.dot(x_c, x_c.T))
+    else:
+        L = np.linalg.eigvalsh(np.dot(x_c.T, x_c))
+
+    return np.maximum(L, 0.)
+
+
+def get_var_cov(x):
+    """
+    Total variance and population covariance measure.
+
+    :param x: activity patterns (cells x patterns)
+    :return: variance, covariance
+    """
+    x = np.asarray(x, float)
+    N = x.shape[0]
+    var_x = np.sum(np.var(x, axis=1, ddof=1))
+    L = np.sqrt(covariance_eigenvalues(x))
+    cov_x = (np.max(L) / np.sum(L) - 1. / N) / (1. - 1. / N)
+
+    return var_x, cov_x
+
+
+class StreamingStatistics(object):
+    """
+    Population statistics of activity patterns that are added one or a few at a time, e.g. while spike counts are
+    ingested, with memory independent of the number of patterns.
+
+    Sparseness and active fraction are accumulated per pattern. Mean and covariance of the cells are updated
+    for chunks of patterns by merging the chunk's mean and sum of squared deviations (chunked Welford update).
+    """
+
+    def __init__(self, N, chunk_size=64):
+        """
+        :param N: number of cells
+        :param chunk_size: number of patterns buffered before updating mean and covariance (default=64)
+        """
+        self.N = N
+        self.chunk_size = chunk_size
+        self.n = 0
+        self.mean = np.zeros(N)
+        self.M2 = np.zeros((N, N))
+        self.spar_sum, self.spar_count, self.active_sum, self.n_patterns = 0., 0, 0., 0
+        self.buffer = []
+
+    def add(self, x):
+        """
+        Adds activity patterns.
+
+        :param x: activity pattern (cells) or patterns (cells x patterns)
+        """
+        x = np.asarray(x, float).reshape(self.N, -1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sptemp = (self.N - np.sum(x, axis=0) ** 2. / np.sum(x ** 2., axis=0)) / (self.N - 1.)
+        self.spar_sum += np.sum(sptemp[~np.isnan(sptemp)])
+        self.spar_count += np.sum(~np.isnan(sptemp))
+        self.active_sum += np.sum(x > 0) * 1. / self.N
+        self.n_patterns += x.shape[1]
+        self.buffer.append(x)
+        if sum(b.shape[1] for b in self.buffer) >= self.chunk_size:
+            self._update()
+
+    def _update(self):
+        if len(self.buffer) == 0:
+            return
+        x = np.hstack(self.buffer)
+        self.buffer = []
+        n_b = x.shape[1]
+        mean_b = x.mean(axis=1)
+        x_c = x - mean_b[:, None]
+        M2_b = np.dot(x_c, x_c.T)
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.M2 += M2_b + np.outer(delta, delta) * self.n * n_b / n
+        self.mean += delta * n_b / n
+        self.n = n
+
+    def get_spar(self):
+        """
+        :return: sparseness, active fraction (as get_spar)
+        """
+        spar = self.spar_sum / self.spar_count if self.spar_count > 0 else np.nan
+        active = self.active_sum / self.n_patterns if self.n_patterns > 0 else np.nan
+
+        return spar, active
+
+    def get_cov_matrix(self):
+        """
+        :return: covariance matrix of the cells (as np.cov)
+        """
+        self._update()
+
+        return self.M2 / (self.n - 1.)
+
+    def get_var_cov(self):
+        """
+        :return: variance, covariance (as get_var_cov)
+        """
+        C = self.get_cov_matrix()
+        var_x = np.trace(C)
+        L = np.sqrt(np.maximum(np.linalg.eigvalsh(C), 0.))
+        cov_x = (np.max(L) / np.sum(L) - 1. / self.N) / (1. - 1. / self.N)
+
+        return var_x, cov_x
@@ -5,71 +5,142 @@ from datetime import datetime
 from multiprocessing import Pool
 from functools import partial
 import sys
+import sample_store
+
+
+cutoff = 0.2   # cutoff value for learning speed estimation
 
 
 def get_learning_speed(loss_curve):
-    cutoff = 0.2   # cutoff value for learning speed estimation
     temp = np.where(np.array(loss_curve) <= cutoff)
     speed = 1. / (temp[0][0] + 1) if len(temp[0]) > 0 else 0
 
     return speed
 
 
-def backprop_step_nohid(w_out, gamma, training_pattern, target_pattern):
-    # Dynamics of units
-    s = lambda x: 1. / (1. + np.exp(-x))
-    ds = lambda s: s * (1. - s)  # sigmoidal
-    #####################################
-    # First step: feedforward propagation
-    o_in = training_pattern
-    o_out = s(np.dot(np.append(o_in, 1), w_out))
-    # Second step: output layer backpropagation
-    diag = np.diag(ds(o_out))
-    err = o_out - target_pattern
-    err_d = np.prod((target_pattern == target_pattern.max()) == (o_out == o_out.max()))
-    delta_out = np.dot(diag, err)
-    dw_out = - gamma * np.outer(np.append(o_in, 1), delta_out)
-    # Third step: update weights
-    w_out = w_out + dw_out
-    
-    return err, err_d, w_out
+def get_final_error(loss_curve):
+    # Error of the last trained epoch (epochs not trained after early stopping are NaN)
+    loss_curve = np.array(loss_curve)
 
+    return loss_curve[~np.isnan(loss_curve)][-1]
 
-def backprop_nohid(training_set, target, n_epochs, gamma):
-    
-    n_in = training_set.shape[0]
+
+def sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+def backprop_nohid(training_set, target, n_epochs, gamma, batch_size=1, plateau=None, checkpoint=None,
+                   resume=False):
+    """
+    Trains a single layer network (no hidden layer) with backpropagation.
+
+    Patterns are processed in batches as matrix products, with a preallocated bias column. With batch_size=1
+    (default), weights are updated after every pattern, as in the original pattern-by-pattern implementation,
+    and error curves are identical to it for the same random seed. Larger batches update weights with
+    the error gradient averaged over the batch, so fewer updates per epoch are made and more epochs are needed;
+    batch_size=None uses the full training set as one batch.
+
+    :param training_set: input patterns (n_in x patterns)
+    :param target: target patterns (n_out x patterns)
+    :param n_epochs: number of training epochs
+    :param gamma: learning rate
+    :param batch_size: number of patterns per weight update (default=1)
+    :param plateau: (window, tol) to stop early, once the RMS error is below the learning speed cutoff and has
+                    decreased by less than tol over the last window epochs (default=None: train for n_epochs)
+    :param checkpoint: .npz file the training state (weights, epoch, errors, random state) is saved to when
+                       training ends (default=None)
+    :param resume: continue training from checkpoint up to n_epochs (default=False); together with the saved
+                   random state, a stopped and resumed run gives the same errors as an uninterrupted one
+    :return: RMS error and discrimination error per epoch (NaN for epochs not trained), final weights
+    """
+    n_in, n_patterns = training_set.shape
     n_out = target.shape[0]
-    w_out = np.random.uniform(-1., 1., size=(n_in + 1, n_out)) * 1. / (n_in + 1)
-    # Shuffle order of training set
-    temp = range(training_set.shape[1])
-    np.random.shuffle(temp)
-    training_set = training_set[:, temp]
-    target = target[:, temp]
-    
-    errors_rms = np.zeros(n_epochs, float)
-    errors_discrim = np.zeros(n_epochs, float)
-    for ep in range(n_epochs):
-        errors_temp = np.zeros(target.shape[1], float)
-        errors_d_temp = np.zeros(target.shape[1], float)
-        for k in range(target.shape[1]):
-            # Backpropagation step
-            err, err_d, w_out = backprop_step_nohid(w_out, gamma, training_set[:, k], target[:, k])
-            # Record errors
-            errors_temp[k] = np.sqrt(np.mean(err ** 2))  # RMS error
-            errors_d_temp[k] = err_d  # Discrimination error
+    if batch_size is None:
+        batch_size = n_patterns
+    # Patterns as rows, with bias column
+    inputs = np.ones((n_patterns, n_in + 1))
+    inputs[:, :n_in] = training_set.T
+    targets = np.ascontiguousarray(target.T)
+
+    errors_rms = np.nan * np.ones(n_epochs)
+    errors_discrim = np.nan * np.ones(n_epochs)
+    if resume:
+        state = np.load(checkpoint)
+        w_out = state['w_out']
+        order = state['order']
+        ep_start = int(state['epoch'])
+        errors_rms[:ep_start] = state['errors_rms'][:ep_start]
+        errors_discrim[:ep_start] = state['errors_discrim'][:ep_start]
+        np.random.set_state(('MT19937', state['rng_keys'], int(state['rng_pos']), int(state['rng_has_gauss']),
+                             float(state['rng_cached_gaussian'])))
+    else:
+        w_out = np.random.uniform(-1., 1., size=(n_in + 1, n_out)) * 1. / (n_in + 1)
+        # Shuffle order of training set
+        order = np.arange(n_patterns)
+        np.random.shuffle(order)
+        ep_start = 0
+
+    errors_temp = np.zeros(n_patterns, float)
+    errors_d_temp = np.zeros(n_patterns, float)
+    ep = ep_start - 1
+    for ep in range(ep_start, n_epochs):
+        x_epoch = inputs[order]
+        t_epoch = targets[order]
+        if batch_size == 1:
+            for k in range(n_patterns):
+                # Feedforward propagation, output layer backpropagation and weight update
+                o_out = sigmoid(np.dot(x_epoch[k], w_out))
+                err = o_out - t_epoch[k]
+                delta_out = o_out * (1. - o_out) * err
+                dw_out = - gamma * np.outer(x_epoch[k], delta_out)
+                w_out = w_out + dw_out
+                # Record errors
+                errors_temp[k] = np.sqrt(np.mean(err ** 2))  # RMS error
+                errors_d_temp[k] = np.prod((t_epoch[k] == t_epoch[k].max()) == (o_out == o_out.max()))  # Discrimination error
+        else:
+            for k in range(0, n_patterns, batch_size):
+                x = x_epoch[k:k + batch_size]
+                t = t_epoch[k:k + batch_size]
+                o_out = sigmoid(np.dot(x, w_out))
+                err = o_out - t
+                delta_out = o_out * (1. - o_out) * err
+                dw_out = - gamma * np.dot(x.T, delta_out) / len(x)
+                w_out = w_out + dw_out
+                # Record errors (before the update, as for single patterns)
+                errors_temp[k:k + batch_size] = np.sqrt(np.mean(err ** 2, axis=1))
+                errors_d_temp[k:k + batch_size] = np.all((t == t.max(axis=1)[:, None]) ==
+                                                         (o_out == o_out.max(axis=1)[:, None]), axis=1)
         # Record average error for the epoch
         errors_rms[ep] = errors_temp.mean()
         errors_discrim[ep] = errors_d_temp.mean()
         # Reshuffle order of training data
-        temp = range(training_set.shape[1])
+        temp = np.arange(n_patterns)
         np.random.shuffle(temp)
-        training_set = training_set[:, temp]
-        target = target[:, temp]
-    
+        order = order[temp]
+        # Stop once learned and converged
+        if plateau is not None and ep >= plateau[0] and errors_rms[ep] <= cutoff and \
+                errors_rms[ep - plateau[0]] - errors_rms[ep] < plateau[1]:
+            break
+
+    if checkpoint is not None:
+        rng_state = np.random.get_state()
+        np.savez(checkpoint, w_out=w_out, order=order, epoch=ep + 1, errors_rms=errors_rms,
+                 errors_discrim=errors_discrim, rng_keys=rng_state[1], rng_pos=rng_state[2],
+                 rng_has_gauss=rng_state[3], rng_cached_gaussian=rng_state[4])
+
     return errors_rms, errors_discrim, w_out
 
 
-def analyse_learning(basedir, f_mf):
+def get_targets(c, num_patterns):
+    # Random classification of patterns into c classes (one-hot, classes x patterns)
+    target = np.zeros((c, num_patterns))
+    for k in range(num_patterns):
+        target[np.random.choice(c), k] = 1
+
+    return target
+
+
+def analyse_learning(basedir, f_mf, batch_size=1, plateau=None):
     
     # Network parameters
     n_syn = 4
@@ -84,15 +155,20 @@ def analyse_learning(basedir, f_mf):
     err_grc = np.zeros(n_epochs, float)
     err_rms_grc = np.zeros(n_epochs, float)
     
-    samples_mf = np.loadtxt(basedir + '/MF_samples_' + str(n_syn) + '_' + '{:.2f}'.format(f_mf) + '.txt')
-    samples_grc = np.loadtxt(basedir + '/GrC_samples_' + str(n_syn) + '_' + '{:.2f}'.format(f_mf) + '.txt')
+    samples_mf = sample_store.load_samples(basedir, 'MF', n_syn, f_mf)
+    samples_grc = sample_store.load_samples(basedir, 'GrC', n_syn, f_mf)
     # Get pattern classifications
-    target = np.zeros((c, num_patterns))
-    for k in range(num_patterns):
-        target[np.random.choice(c), k] = 1
-    # Single layer backpropagation
-    err_rms_mf[:], err_mf[:], w_mf = backprop_nohid(samples_mf, target, n_epochs, gamma)
-    err_rms_grc[:], err_grc[:], w_grc = backprop_nohid(samples_grc, target, n_epochs, gamma)
+    target = get_targets(c, num_patterns)
+    # Single layer backpropagation; when stopping early, the training state is saved to resume later
+    if plateau is None:
+        checkpoint_mf, checkpoint_grc = None, None
+    else:
+        checkpoint_mf = basedir + '/checkpoint_MF_' + '{:.2f}'.format(f_mf) + '.npz'
+        checkpoint_grc = basedir + '/checkpoint_GrC_' + '{:.2f}'.format(f_mf) + '.npz'
+    err_rms_mf[:], err_mf[:], w_mf = backprop_nohid(samples_mf, target, n_epochs, gamma, batch_size, plateau,
+                                                    checkpoint_mf)
+    err_rms_grc[:], err_grc[:], w_grc = backprop_nohid(samples_grc, target, n_epochs, gamma, batch_size, plateau,
+                                                       checkpoint_grc)
     
     # File name to save
     filename = 'grc_bp_biophys_' + '{:.2f}'.format(f_mf) + '_' + basedir.split('_')[-1][:-1] + '.txt'
@@ -102,9 +178,208 @@ def analyse_learning(basedir, f_mf):
     mf_learning_speed = get_learning_speed(err_rms_mf)
     grc_learning_speed = get_learning_speed(err_rms_grc)
     
-    print(basedir, f_mf, mf_learning_speed, grc_learning_speed, err_rms_mf[-1], err_rms_grc[-1])
+    print(basedir, f_mf, mf_learning_speed, grc_learning_speed, get_final_error(err_rms_mf), get_final_error(err_rms_grc))
+    if plateau is not None:
+        print('epochs trained: MF {}, GC {}'.format(np.sum(~np.isnan(err_rms_mf)), np.sum(~np.isnan(err_rms_grc))))
     
-    return mf_learning_speed, grc_learning_speed, err_rms_mf[-1], err_rms_grc[-1]
+    return mf_learning_speed, grc_learning_speed, get_final_error(err_rms_mf), get_final_error(err_rms_grc)
+
+
+def compare_early_stopping(basedir, f_mf, plateau=(100, 1e-3), batch_size=1, seed=0):
+    """
+    Compares early stopped with full-length training, for MF and GC patterns.
+
+    Early stopped runs are resumed from their checkpoint to the full number of epochs, which continues the same
+    random sequence and so gives the full-length run; learning speeds of both agree whenever training stopped
+    after reaching the cutoff.
+
+    :param basedir: folder of the MF and GC samples
+    :param f_mf: fraction of active MFs
+    :param plateau: (window, tol) stopping criterion, see backprop_nohid
+    :param batch_size: number of patterns per weight update (default=1)
+    :param seed: random seed of pattern classification and training (default=0)
+    :return: array (MF, GC) of epochs trained, learning speed early and full, final error early and full,
+             run time early and full (s)
+    """
+    # Network parameters
+    n_syn = 4
+    # Backprop parameters
+    n_epochs = 5000
+    gamma = 0.01
+    c = 10
+    num_patterns = 64 * c
+
+    report = np.zeros((2, 7))
+    np.random.seed(seed)
+    target = get_targets(c, num_patterns)
+    for i, population in enumerate(['MF', 'GrC']):
+        samples = sample_store.load_samples(basedir, population, n_syn, f_mf)
+        checkpoint = basedir + '/checkpoint_' + population + '_' + '{:.2f}'.format(f_mf) + '.npz'
+        startTime = datetime.now()
+        err_early, _, _ = backprop_nohid(samples, target, n_epochs, gamma, batch_size, plateau, checkpoint)
+        t_early = (datetime.now() - startTime).total_seconds()
+        startTime = datetime.now()
+        err_full, _, _ = backprop_nohid(samples, target, n_epochs, gamma, batch_size, checkpoint=checkpoint,
+                                        resume=True)
+        t_full = t_early + (datetime.now() - startTime).total_seconds()
+        report[i] = [np.sum(~np.isnan(err_early)), get_learning_speed(err_early), get_learning_speed(err_full),
+                     get_final_error(err_early), get_final_error(err_full), t_early, t_full]
+        print(basedir, f_mf, population, report[i])
+
+    return report
+
+
+def backprop_nohid_stacked(training_sets, targets, input_ix, target_ix, rngs, n_epochs, gamma, batch_size=1):
+    """
+    Trains many independent single layer networks in lockstep, with their weights stacked in one tensor
+    (problems x inputs + 1 x outputs).
+
+    Training sets with fewer inputs are padded with zero inputs, which leave outputs and updates unchanged. Each
+    problem draws initial weights and shuffles its patterns with its own random state, in the same order as
+    backprop_nohid draws from np.random, so that a problem gives the same errors as backprop_nohid after
+    np.random.seed with the same seed (up to rounding of the stacked products).
+
+    :param training_sets: list of input pattern sets (n_in x patterns), n_in may differ between sets
+    :param targets: list of target pattern sets (n_out x patterns)
+    :param input_ix: index of the training set of each problem
+    :param target_ix: index of the target set of each problem
+    :param rngs: np.random.RandomState of each problem
+    :param n_epochs: number of training epochs
+    :param gamma: learning rate
+    :param batch_size: number of patterns per weight update (default=1), None for the full training set
+    :return: RMS error and discrimination error per problem and epoch (problems x epochs), final weights per problem
+    """
+    n_problems = len(input_ix)
+    n_patterns = training_sets[0].shape[1]
+    n_out = targets[0].shape[0]
+    n_max = max(training_set.shape[0] for training_set in training_sets)
+    if batch_size is None:
+        batch_size = n_patterns
+    # Patterns as rows, padded to n_max inputs, with bias column
+    inputs = np.zeros((len(training_sets), n_patterns, n_max + 1))
+    for u, training_set in enumerate(training_sets):
+        inputs[u, :, :training_set.shape[0]] = training_set.T
+    inputs[:, :, n_max] = 1.
+    outputs = np.array([target.T for target in targets])
+    n_in = np.array([training_sets[u].shape[0] for u in input_ix])
+
+    w_out = np.zeros((n_problems, n_max + 1, n_out))
+    order = np.zeros((n_problems, n_patterns), int)
+    for p in range(n_problems):
+        w = rngs[p].uniform(-1., 1., size=(n_in[p] + 1, n_out)) * 1. / (n_in[p] + 1)
+        w_out[p, :n_in[p]] = w[:-1]
+        w_out[p, n_max] = w[-1]
+        temp = np.arange(n_patterns)
+        rngs[p].shuffle(temp)
+        order[p] = temp
+
+    problems = np.arange(n_problems)[:, None]
+    errors_rms = np.zeros((n_problems, n_epochs), float)
+    errors_discrim = np.zeros((n_problems, n_epochs), float)
+    errors_temp = np.zeros((n_problems, n_patterns), float)
+    errors_d_temp = np.zeros((n_problems, n_patterns), float)
+    for ep in range(n_epochs):
+        for k in range(0, n_patterns, batch_size):
+            # Patterns of this step for all problems (problems x batch x inputs + 1)
+            x = inputs[np.asarray(input_ix)[:, None], order[:, k:k + batch_size]]
+            t = outputs[np.asarray(target_ix)[:, None], order[:, k:k + batch_size]]
+            o_out = sigmoid(np.matmul(x, w_out))
+            err = o_out - t
+            delta_out = o_out * (1. - o_out) * err
+            dw_out = - gamma * np.matmul(x.transpose(0, 2, 1), delta_out) / x.shape[1]
+            w_out = w_out + dw_out
+            # Record errors
+            errors_temp[:, k:k + batch_size] = np.sqrt(np.mean(err ** 2, axis=2))
+            errors_d_temp[:, k:k + batch_size] = np.all((t == t.max(axis=2)[:, :, None]) ==
+                                                        (o_out == o_out.max(axis=2)[:, :, None]), axis=2)
+        # Record average error for the epoch
+        errors_rms[:, ep] = errors_temp.mean(axis=1)
+        errors_discrim[:, ep] = errors_d_temp.mean(axis=1)
+        # Reshuffle order of training data
+        for p in range(n_problems):
+            temp = np.arange(n_patterns)
+            rngs[p].shuffle(temp)
+            order[p] = order[p, temp]
+
+    weights = [np.vstack((w_out[p, :n_in[p]], w_out[p, n_max:])) for p in range(n_problems)]
+
+    return errors_rms, errors_discrim, weights
+
+
+def analyse_learning_stacked(basedirs, f_mf, label_seeds=[0], batch_size=1):
+    """
+    Runs the analysis of analyse_learning for MF and GC patterns of all basedirs, f_mf values and label seeds
+    at once, with backprop_nohid_stacked.
+
+    For each label seed, the random pattern classification is drawn after np.random.seed(label_seed); MF and GC
+    networks are then trained from the random state that follows. Results are saved per basedir as by
+    analyse_learning (grc_bp_biophys_*.txt, learning_results.txt); with more than one label seed, the files of
+    each seed get a '_seed{label_seed}' suffix and learning_results.txt holds the mean over seeds, with standard
+    deviations in learning_results_sd.txt.
+
+    :param basedirs: folders of the MF and GC samples (e.g. results/orig_data_r0/)
+    :param f_mf: fractions of active MFs
+    :param label_seeds: random seeds of the pattern classifications (default=[0])
+    :param batch_size: number of patterns per weight update (default=1), None for the full training set
+    :return: array of (MF learning speed, GC learning speed, MF final error, GC final error) per basedir, f_mf
+             and label seed
+    """
+    # Network parameters
+    n_syn = 4
+    # Backprop parameters
+    n_epochs = 5000
+    gamma = 0.01
+    c = 10
+    num_patterns = 64 * c
+
+    training_sets, targets, input_ix, target_ix, rngs = [], [], [], [], []
+    for basedir in basedirs:
+        for f in f_mf:
+            for population in ['MF', 'GrC']:
+                training_sets.append(sample_store.load_samples(basedir, population, n_syn, f))
+            for label_seed in label_seeds:
+                # Get pattern classifications
+                rng = np.random.RandomState(label_seed)
+                target = np.zeros((c, num_patterns))
+                for k in range(num_patterns):
+                    target[rng.choice(c), k] = 1
+                targets.append(target)
+                # MF and GC problems, trained from the same random state
+                for u in [len(training_sets) - 2, len(training_sets) - 1]:
+                    input_ix.append(u)
+                    target_ix.append(len(targets) - 1)
+                    state = np.random.RandomState()
+                    state.set_state(rng.get_state())
+                    rngs.append(state)
+
+    err_rms, err, _ = backprop_nohid_stacked(training_sets, targets, input_ix, target_ix, rngs, n_epochs, gamma,
+                                             batch_size)
+
+    # Save results; problems are ordered by basedir, f_mf, label seed and MF/GC
+    err_rms = err_rms.reshape(len(basedirs), len(f_mf), len(label_seeds), 2, n_epochs)
+    err = err.reshape(len(basedirs), len(f_mf), len(label_seeds), 2, n_epochs)
+    results = np.zeros((len(basedirs), len(f_mf), len(label_seeds), 4))
+    for i, basedir in enumerate(basedirs):
+        for j, f in enumerate(f_mf):
+            for k, label_seed in enumerate(label_seeds):
+                err_rms_mf, err_rms_grc = err_rms[i, j, k]
+                err_mf, err_grc = err[i, j, k]
+                suffix = '' if len(label_seeds) == 1 else '_seed{}'.format(label_seed)
+                # File name to save
+                filename = 'grc_bp_biophys_' + '{:.2f}'.format(f) + '_' + basedir.split('_')[-1][:-1] + suffix + '.txt'
+                np.savetxt(basedir + filename, np.transpose([err_rms_mf, err_rms_grc, err_mf, err_grc]), delimiter='\t')
+                results[i, j, k] = [get_learning_speed(err_rms_mf), get_learning_speed(err_rms_grc),
+                                    err_rms_mf[-1], err_rms_grc[-1]]
+                print(basedir, f, label_seed, results[i, j, k, 0], results[i, j, k, 1], results[i, j, k, 2], results[i, j, k, 3])
+        if len(label_seeds) == 1:
+            np.savetxt(basedir + '/learning_results.txt', results[i, :, 0], delimiter='\t')
+        else:
+            for k, label_seed in enumerate(label_seeds):
+                np.savetxt(basedir + '/learning_results_seed{}.txt'.format(label_seed), results[i, :, k], delimiter='\t')
+            np.savetxt(basedir + '/learning_results.txt', results[i].mean(axis=1), delimiter='\t')
+            np.savetxt(basedir + '/learning_results_sd.txt', results[i].std(axis=1), delimiter='\t')
+
+    return results
 
 
 if __name__ == '__main__':
@@ -116,10 +391,43 @@ if __name__ == '__main__':
     
     f_mf = np.linspace(0.1, 0.9, 9)
 
+    # patterns per weight update: 1 for per-pattern learning as in the original analysis, None for full batch
+    batch_size = 1
+
+    # stop training once the RMS error is below the cutoff and has decreased by less than tol over window epochs,
+    # (window, tol) or None to always train for all epochs; the training state is saved to checkpoint files
+    plateau = None
+
+    # set to True to compare early stopping with full-length training instead (writes early_stopping_report.txt)
+    early_stopping_report = False
+
+    # set to True to train all networks of the folders given as arguments (e.g. results/orig_data_r0/
+    # results/ko_data_r0/) in one stacked computation, for each of the label seeds
+    stacked = False
+    label_seeds = [0, 1, 2, 3, 4]
+
+    if stacked:
+        analyse_learning_stacked(sys.argv[1:], f_mf, label_seeds, batch_size)
+        print(datetime.now() - startTime)
+        sys.exit()
+
     pool = Pool()
+
+    if early_stopping_report:
+        fun = partial(compare_early_stopping,
+                      basedir, plateau=plateau or (100, 1e-3), batch_size=batch_size)
+        report = pool.map(fun, f_mf)
+        pool.close()
+        pool.join()
+        # One row per f_mf and MF/GC: f_mf, GC (0/1), epochs trained, learning speed early and full,
+        # final error early and full, run time early and full (s)
+        np.savetxt(basedir + '/early_stopping_report.txt',
+                   [[f, i] + list(r[i]) for f, r in zip(f_mf, report) for i in range(2)], delimiter='\t')
+        print(datetime.now() - startTime)
+        sys.exit()
     
     fun = partial(analyse_learning,
-                  basedir)
+                  basedir, batch_size=batch_size, plateau=plateau)
     results = pool.map(fun, f_mf)
     
     pool.close()
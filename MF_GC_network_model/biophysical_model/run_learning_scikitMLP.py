@@ -2,6 +2,7 @@ import numpy as np
 from sklearn.neural_network import MLPClassifier
 from datetime import datetime
 import sys
+import sample_store
 
 
 def get_learning_speed(loss_curve):
@@ -45,8 +46,8 @@ if __name__ == '__main__':
     gc_results = np.zeros((len(f_mf), 4))
 
     for i, fraction in enumerate(f_mf):
-        mf_samples = np.loadtxt(basedir + '/MF_samples_{}_{:.2f}.txt'.format(n_syn, fraction)).T
-        gc_samples = np.loadtxt(basedir + '/GrC_samples_{}_{:.2f}.txt'.format(n_syn, fraction)).T
+        mf_samples = sample_store.load_samples(basedir, 'MF', n_syn, fraction).T
+        gc_samples = sample_store.load_samples(basedir, 'GrC', n_syn, fraction).T
 
         y = np.random.choice(n_classes, mf_samples.shape[0], replace=True)
 
@@ -2,16 +2,20 @@
 # Designed to write files to be run in parallel on a server or cluster, 
 # but can also be used to run individually
 # python run_mf_grc_network.py
-# Generates xml and nml files for model, saved in tempdata folder
+# Generates xml and nml files for model, saved in tempdata folder (the network file is shared by all runs of a
+# condition and N_syn, each run writes the LEMS file and the rates of its ON and OFF MFs)
 # To simulate, switch run to True, spike times are saved as .dat
+# or, with output = 'store', in one binary spike store per results folder (spike_store.py)
 
 # Flow for biophysical model:
 # python initialize_network_params.py to generate params_file.pkl for a specific correlation radius (sigma)
+# optionally, python mf_pattern_bank.py to precompute the MF patterns of all runs
 # python run_mf_grc_network.py
 # python save_samples_as_txt.py basedir to convert .dat files of spiketimes to .txt files of activity patterns
 # Then can run run_learning.py, get_spar_cov.py, etc.
 
 import neuroml as nml
+from neuroml.writers import NeuroMLHdf5Writer
 from pyneuroml import pynml
 from pyneuroml.lems.LEMSSimulation import LEMSSimulation
 import lems.api as lems
@@ -20,57 +24,231 @@ import os
 import pickle as pkl
 import scipy.io as io
 import random
+import resource
+import sys
 from datetime import datetime
-from multiprocessing import Condition, Pool
+from multiprocessing import Condition, Pool, cpu_count
 from functools import partial
+import simulate_mf_grc_network as sim
+import mf_pattern_bank
+import spike_store
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../network_structures'))
+import connectivity
 
 
-def generate_grc_layer_network(runID, correlationRadius, duration=180.0, dt=0.05,
-                               minimumISI=2.0, ONRate=50.0, OFFRate=0.0, condition='orig', run=False):
+# Static inputs (parameters, connectivity, MF pattern statistics, model definitions) are loaded once per
+# process and shared read-only by all runs; init_worker preloads them in each worker of the Pool.
+_static_inputs = {}
+
+
+def _load_once(key, load):
+    if key not in _static_inputs:
+        _static_inputs[key] = load()
+    return _static_inputs[key]
+
+
+def _load_pickle(filename):
+    file = open(filename, 'rb')
+    p = pkl.load(file)
+    file.close()
+    return p
+
+
+def load_params():
     """
-    Creates GrC layer network and runs LEMS simulation.
+    Parameters of all runs (N_syn, f_mf, run_num), from params_file.pkl.
+    """
+    return _load_once('params', lambda: _load_pickle('../params_file.pkl'))
 
-    :param runID: ID number of the run (=pattern)
+
+def load_connectivity(N_syn):
+    """
+    MF-GC connectivity matrix for N_syn dendrites per GC, as sparse (CSR) matrix (see connectivity.py).
+    """
+    def load():
+        conn_mat = connectivity.load_connectivity(
+            connectivity.connectivity_file(N_syn, '../../network_structures'))['conn_mat']
+        assert (np.all(np.bincount(conn_mat.indices, minlength=conn_mat.shape[1]) == N_syn)), \
+            'Connectivity matrix is incorrect.'
+        return conn_mat
+
+    return _load_once(('connectivity', N_syn), load)
+
+
+def load_mf_patterns(correlationRadius):
+    """
+    Statistics of spatially correlated MF patterns (Rs, gs) for a correlation radius.
+    """
+    return _load_once(('mf_patterns', correlationRadius),
+                      lambda: io.loadmat('../../input_statistics/mf_patterns_r{:.0f}.mat'.format(correlationRadius)))
+
+
+def load_lems_definitions(condition):
+    """
+    Spike generator, IaF GC and synapse definitions, as read by pyNeuroML.
+
+    :return: spike generator doc, IaF GC doc, AMPA synapse doc, NMDA synapse doc
+    """
+    return _load_once(('lems', condition), lambda: (
+        pynml.read_lems_file("../../grc_lemsDefinitions/spikeGenerators.xml"),
+        pynml.read_neuroml2_file('../../grc_lemsDefinitions/IaF_GrC_{}.nml'.format(condition)),
+        pynml.read_lems_file("../../grc_lemsDefinitions/MFGrC_AMPA_{}.xml".format(condition)),
+        pynml.read_lems_file("../../grc_lemsDefinitions/MFGrC_NMDA_{}.xml".format(condition))))
+
+
+def load_connection_pairs(N_syn):
+    """
+    MF and GC index of every MF-GC connection (ordered by MF), for N_syn dendrites per GC.
+    """
+    return _load_once(('pairs', N_syn), lambda: load_connectivity(N_syn).nonzero())
+
+
+def load_pattern_bank():
+    """
+    Precomputed MF patterns (see mf_pattern_bank.py), or None if mf_pattern_bank.npz does not exist
+    or was generated for different run parameters.
+    """
+    def load():
+        if not os.path.exists('../mf_pattern_bank.npz'):
+            return None
+        bank = dict(np.load('../mf_pattern_bank.npz'))
+        return bank if mf_pattern_bank.is_current(bank, load_params()) else None
+
+    return _load_once('pattern_bank', load)
+
+
+def load_model_params(condition):
+    """
+    Model parameters for the numpy backend (see simulate_mf_grc_network.load_model_params).
+    """
+    return _load_once(('model', condition), lambda: sim.load_model_params(condition))
+
+
+def init_worker(correlationRadii, conditions, backend='jnml'):
+    """
+    Initializer for the multiprocessing Pool: loads all static inputs once per worker.
+
+    :param correlationRadii: MF correlation radii that will be simulated
+    :param conditions: simulations that will be run (list out of 'orig', 'ko')
+    :param backend: simulator to use ('jnml' or 'numpy', default='jnml')
+    """
+    p = load_params()
+    for N_syn in np.unique(p['N_syn']):
+        load_connectivity(N_syn)
+    bank = load_pattern_bank()
+    for correlationRadius in correlationRadii:
+        if correlationRadius > 0 and (bank is None or correlationRadius not in bank['radii']):
+            load_mf_patterns(correlationRadius)
+    for condition in conditions:
+        if backend == 'numpy':
+            load_model_params(condition)
+        else:
+            load_lems_definitions(condition)
+
+
+def time_setup(runIDs, correlationRadius, condition='orig', backend='jnml'):
+    """
+    Measures the per-run setup cost (loading inputs and selecting the MF pattern) without and with preloading.
+
+    Without preloading, all static inputs are read again for every run, as before the per-worker cache.
+
+    :param runIDs: list of runIDs to time
     :param correlationRadius: MF correlation radius, out of [0,5,10,15,20,25,30]
-    :param duration: total duration of the simulation (default=180ms)
-    :param dt: simulation time step (default=0.05ms)
-    :param minimumISI: minimum ISI for MF (ms, default=2.0)
-    :param ONRate: rate of active MFs (Hz, default=50.0)
-    :param OFFRate: rate of inactive MFs (Hz, default=0.0)
     :param condition: which simulation to run ('orig' or 'ko', default='orig')
-    :param run: boolean (default=False)
-    :return: boolean (success)
+    :param backend: simulator to use ('jnml' or 'numpy', default='jnml')
+    :return: mean setup time per run (s) without and with preloading
     """
+    def setup(runID):
+        select_mf_pattern(runID, correlationRadius)
+        if backend == 'numpy':
+            load_model_params(condition)
+        else:
+            load_lems_definitions(condition)
 
-    # Load parameters for this run from file
-    file = open('../params_file.pkl', 'r')
-    p = pkl.load(file)
+    times = np.zeros((2, len(runIDs)))
+    for k, runID in enumerate(runIDs):
+        _static_inputs.clear()
+        startTime = datetime.now()
+        setup(runID)
+        times[0, k] = (datetime.now() - startTime).total_seconds()
+
+    init_worker([correlationRadius], [condition], backend)
+    for k, runID in enumerate(runIDs):
+        startTime = datetime.now()
+        setup(runID)
+        times[1, k] = (datetime.now() - startTime).total_seconds()
+
+    print('Setup time per run: {:.4f} s without preloading, {:.4f} s with preloading'.format(*times.mean(axis=1)))
+
+    return times.mean(axis=1)
+
+
+def benchmark_jnml_batch(runIDs, correlationRadius, condition='orig', Ks=[1, 2, 4, 8, 16, 32], **kwargs):
+    """
+    Measures jNeuroML wall time per pattern when K patterns are packed into one LEMS simulation.
+
+    :param runIDs: list of runIDs to simulate for each K (at least max(Ks))
+    :param correlationRadius: MF correlation radius, out of [0,5,10,15,20,25,30]
+    :param condition: which simulation to run ('orig' or 'ko', default='orig')
+    :param Ks: numbers of patterns per jNeuroML run to compare
+    :param kwargs: simulation parameters passed on to generate_grc_layer_network
+    :return: array of wall time per pattern (s) for each K
+    """
+    basedir = kwargs.get('basedir')
+    if basedir is not None and not os.path.isdir(basedir):
+        os.makedirs(basedir)
+    seconds = np.zeros(len(Ks))
+    for i, K in enumerate(Ks):
+        startTime = datetime.now()
+        for k in range(0, len(runIDs) - K + 1, K):
+            generate_grc_layer_network(runIDs[k:k + K], correlationRadius, condition=condition, run=True, **kwargs)
+        seconds[i] = (datetime.now() - startTime).total_seconds() / (len(runIDs) // K * K)
+        print('K = {}: {:.2f} s per pattern'.format(K, seconds[i]))
+
+    return seconds
+
+
+def select_mf_pattern(runID, correlationRadius):
+    """
+    Loads parameters and connectivity of a run and selects the active MFs.
+    Seeds the random number generators with runID, so the MF spike trains drawn afterwards are reproducible.
+
+    :param runID: ID number of the run (=pattern)
+    :param correlationRadius: MF correlation radius, out of [0,5,10,15,20,25,30]
+    :return: N_syn, f_mf, run_num, conn_mat, indices of active MFs, indices of inactive MFs
+    """
+
+    # Load parameters for this run
+    p = load_params()
     N_syn = p['N_syn'][int(runID)]
     f_mf = p['f_mf'][int(runID)]
     run_num = p['run_num'][int(runID)]
-    file.close()
 
     # set the random number generator seed
     np.random.seed(runID)
     random.seed(runID)
  
-    # get connectivity matrix between cells from file
-    file = open('../../network_structures/GCLconnectivity_{:.0f}.pkl'.format(N_syn))
-    p = pkl.load(file)
-    file.close()
-    conn_mat = p['conn_mat']
+    # get connectivity matrix between cells
+    conn_mat = load_connectivity(N_syn)
     N_mf, N_grc = conn_mat.shape
-    assert (np.all(conn_mat.sum(axis=0) == N_syn)), 'Connectivity matrix is incorrect.'
 
     # turn fraction of MFs off
-    if correlationRadius == 0:  # Activate MFs randomly
+    bank = load_pattern_bank()
+    if bank is not None and correlationRadius in bank['radii']:  # Precomputed pattern
+        assert (bank['N_mf'] == N_mf), 'Pattern bank does not match connectivity.'
+        mf_indices_ON = mf_pattern_bank.lookup(bank, correlationRadius, runID)
+        N_mf_ON = len(mf_indices_ON)
+        if correlationRadius > 0:
+            # advance the random number generator as if the pattern had been drawn here
+            np.random.randn(N_mf)
+    elif correlationRadius == 0:  # Activate MFs randomly
         N_mf_ON = int(N_mf * f_mf)
         mf_indices_ON = random.sample(range(N_mf), N_mf_ON)
         mf_indices_ON.sort()
     elif correlationRadius > 0:  # Spatially correlated MFs
         f_mf_range = np.linspace(.05, .95, 19)
         f_mf_ix = np.where(np.isclose(f_mf_range, f_mf))[0][0]
-        p = io.loadmat('../../input_statistics/mf_patterns_r{:.0f}.mat'.format(correlationRadius))
+        p = load_mf_patterns(correlationRadius)
         R = p['Rs'][:, :, f_mf_ix]
         g = p['gs'][f_mf_ix]
         t = np.dot(R.transpose(), np.random.randn(N_mf))
@@ -78,99 +256,187 @@ def generate_grc_layer_network(runID, correlationRadius, duration=180.0, dt=0.05
         mf_indices_ON = np.where(S)[0]
         N_mf_ON = len(mf_indices_ON)
 
-    N_mf_OFF = N_mf - N_mf_ON
-    mf_indices_OFF = [x for x in range(N_mf) if x not in mf_indices_ON]
-    mf_indices_OFF.sort()
+    is_ON = np.zeros(N_mf, bool)
+    is_ON[mf_indices_ON] = True
+    mf_indices_OFF = np.where(~is_ON)[0]
 
-    # load NeuroML components, LEMS components and LEMS componentTypes from external files
-    # Spike generator (for Poisson MF spiking)
-    spike_generator_file_name = "../../grc_lemsDefinitions/spikeGenerators.xml"
-    spike_generator_doc = pynml.read_lems_file(spike_generator_file_name)
+    return N_syn, f_mf, run_num, conn_mat, mf_indices_ON, mf_indices_OFF
 
-    # Integrate-and-fire GC model
-    iaf_nml2_file_name = '../../grc_lemsDefinitions/IaF_GrC_{}.nml'.format(condition)
-    iaF_GrC_doc = pynml.read_neuroml2_file(iaf_nml2_file_name)
+
+def add_mf_projections(net, N_syn, mf_pops, grc_pop, synapses):
+    """
+    Connects every MF to the GCs it innervates, with one projection per MF and synapse type.
+
+    :param net: NeuroML network
+    :param N_syn: number of dendrites per GC (selects the connectivity matrix)
+    :param mf_pops: population of each MF (one cell each), in the order of the connectivity matrix
+    :param grc_pop: GC population
+    :param synapses: ids of the synapses of each connection
+    """
+    mf, grc = load_connection_pairs(N_syn)
+    offsets = np.searchsorted(mf, np.arange(len(mf_pops) + 1))
+    for i, mf_pop in enumerate(mf_pops):
+        post_cells = ['../{}[{}]'.format(grc_pop.id, j) for j in grc[offsets[i]:offsets[i + 1]]]
+        for synapse in synapses:
+            projection = nml.Projection(id='{}_{}_{}'.format(mf_pop.id, grc_pop.id, synapse),
+                                        presynaptic_population=mf_pop.id,
+                                        postsynaptic_population=grc_pop.id,
+                                        synapse=synapse)
+            projection.connections.extend([nml.Connection(id=k, pre_cell_id='../{}[0]'.format(mf_pop.id),
+                                                          post_cell_id=post)
+                                           for k, post in enumerate(post_cells)])
+            net.projections.append(projection)
+
+
+def write_network_file(condition, N_syns, network_format='xml'):
+    """
+    Writes the network (populations and MF-GC projections) for one or several copies, once per condition and
+    N_syn of each copy; later runs reuse the file.
+
+    Every MF is a population of one cell whose spike generator component (mossySpiker{i}) is defined in the
+    LEMS instances file of each run, so the network does not depend on the ON/OFF split of the pattern.
+
+    :param condition: which simulation to run ('orig' or 'ko')
+    :param N_syns: number of dendrites per GC of each copy of the network
+    :param network_format: 'xml' (.net.nml) or 'hdf5' (.net.nml.h5, with connections stored as binary arrays)
+    :return: file name of the network, and for each copy the ids of the MF populations and the GC population
+    """
+    spike_generator_doc, iaF_GrC_doc, rothmanMFToGrCAMPA_doc, rothmanMFToGrCNMDA_doc = load_lems_definitions(condition)
     iaF_GrC = iaF_GrC_doc.iaf_ref_cells[0]
+    # MF-GC connectivity with AMPAR and NMDAR mediated synapses
+    synapses = [rothmanMFToGrCAMPA_doc.components['RothmanMFToGrCAMPA'].id,
+                rothmanMFToGrCNMDA_doc.components['RothmanMFToGrCNMDA'].id]
+
+    net = nml.Network(id="network")
+    net_doc = nml.NeuroMLDocument(id=net.id)
+    net_doc.networks.append(net)
+    copies = []
+    for k, N_syn in enumerate(N_syns):
+        suffix = '' if len(N_syns) == 1 else '_{}'.format(k)
+        N_mf, N_grc = load_connectivity(N_syn).shape
+        GrCPop = nml.Population(id="GrCPop" + suffix, component=iaF_GrC.id, size=N_grc)
+        mossySpikersPops = [nml.Population(id="mossySpikerPop{}{}".format(i, suffix),
+                                           component="mossySpiker{}{}".format(i, suffix), size=1)
+                            for i in range(N_mf)]
+        net.populations.append(GrCPop)
+        net.populations.extend(mossySpikersPops)
+        add_mf_projections(net, N_syn, mossySpikersPops, GrCPop, synapses)
+        copies.append(([pop.id for pop in mossySpikersPops], GrCPop))
+
+    # Networks of equal N_syn are named by N_syn and number of copies
+    if len(set(N_syns)) == 1:
+        name = '{}_{}x{}'.format(condition, N_syns[0], len(N_syns))
+    else:
+        name = '{}_{}'.format(condition, '-'.join(str(N_syn) for N_syn in N_syns))
+    net_file_name = 'network_{}.net.nml'.format(name) + ('.h5' if network_format == 'hdf5' else '')
+    if not os.path.exists(net_file_name):
+        # Written under a temporary name first, as other workers may need the same file
+        tmp_file_name = 'tmp{}_{}'.format(os.getpid(), net_file_name)
+        if network_format == 'hdf5':
+            NeuroMLHdf5Writer.write(net_doc, tmp_file_name)
+        else:
+            pynml.write_neuroml2_file(net_doc, tmp_file_name, validate=False)
+        os.rename(tmp_file_name, net_file_name)
+
+    return net_file_name, copies
+
+
+def generate_grc_layer_network(runID, correlationRadius, duration=180.0, dt=0.05,
+                               minimumISI=2.0, ONRate=50.0, OFFRate=0.0, condition='orig', run=False,
+                               backend='jnml', basedir=None, max_memory="8G", network_format='xml',
+                               output='dat'):
+    """
+    Creates GrC layer network and runs LEMS simulation.
 
-    # AMPAR and NMDAR mediated synapses
+    If a list of runIDs is given, all patterns are packed into one LEMS simulation as independent copies of
+    the network (own MF and GC populations and spike time files per copy), so jNeuroML starts once per list.
+
+    :param runID: ID number of the run (=pattern), or list of runIDs to simulate together
+    :param correlationRadius: MF correlation radius, out of [0,5,10,15,20,25,30]
+    :param duration: total duration of the simulation (default=180ms)
+    :param dt: simulation time step (default=0.05ms)
+    :param minimumISI: minimum ISI for MF (ms, default=2.0)
+    :param ONRate: rate of active MFs (Hz, default=50.0)
+    :param OFFRate: rate of inactive MFs (Hz, default=0.0)
+    :param condition: which simulation to run ('orig' or 'ko', default='orig')
+    :param run: boolean (default=False)
+    :param backend: simulator to use ('jnml' or 'numpy', default='jnml'); the numpy backend
+                    simulates in-process and ignores run
+    :param basedir: folder for spike time files (default='../results/{condition}_data_r{correlationRadius}/')
+    :param max_memory: maximum JVM heap size for jNeuroML (default="8G")
+    :param network_format: file format of the network, 'xml' (.net.nml) or 'hdf5' (.net.nml.h5, with connections
+                           stored as binary arrays; default='xml'); the network is written once per condition and
+                           N_syn (see write_network_file), each run only writes the rates of its MFs
+    :param output: where spike times are saved, 'dat' (one text file per run and population) or 'store'
+                   (binary spike store of basedir, see spike_store.py; default='dat')
+    :return: boolean (success)
+    """
+
+    runIDs = list(runID) if np.ndim(runID) > 0 else [runID]
+
+    # Details for saving output files
+    if basedir is None:
+        basedir = '../results/{}_data_r{}/'.format(condition, correlationRadius)
+
+    if backend == 'numpy':
+        if len(runIDs) > 1:
+            return simulate_grc_layer_network_block(runIDs, correlationRadius, duration, dt, minimumISI,
+                                                    ONRate, OFFRate, condition, basedir, output)
+        N_syn, f_mf, run_num, conn_mat, mf_indices_ON, mf_indices_OFF = select_mf_pattern(runIDs[0], correlationRadius)
+        # Add parameter values to spike time filename
+        end_filename = '{}_{:.2f}_{}'.format(N_syn, f_mf, run_num)
+        params = load_model_params(condition)
+        mf_ix, mf_t, grc_ix, grc_t = sim.run_pattern(conn_mat, mf_indices_ON, params, duration, dt,
+                                                     minimumISI, ONRate, OFFRate)
+        if output == 'store':
+            spike_store.write_part(basedir, [(runIDs[0], end_filename, mf_ix, mf_t, grc_ix, grc_t)])
+        else:
+            sim.write_spike_file(basedir + "MF_spikes_" + end_filename + ".dat", mf_ix, mf_t)
+            sim.write_spike_file(basedir + "GrC_spikes_" + end_filename + ".dat", grc_ix, grc_t)
+
+        return True
+
+    # NeuroML components, LEMS components and LEMS componentTypes from external files
+    # Spike generator (for Poisson MF spiking), integrate-and-fire GC model, AMPAR and NMDAR mediated synapses
+    spike_generator_file_name = "../../grc_lemsDefinitions/spikeGenerators.xml"
+    iaf_nml2_file_name = '../../grc_lemsDefinitions/IaF_GrC_{}.nml'.format(condition)
     ampa_syn_filename = "../../grc_lemsDefinitions/MFGrC_AMPA_{}.xml".format(condition)
     nmda_syn_filename = "../../grc_lemsDefinitions/MFGrC_NMDA_{}.xml".format(condition)
-    rothmanMFToGrCAMPA_doc = pynml.read_lems_file(ampa_syn_filename)
-    rothmanMFToGrCNMDA_doc = pynml.read_lems_file(nmda_syn_filename)
-    
-    # Define components from the componentTypes we just loaded
-    # Refractory poisson input -- representing active MF
+    spike_generator_doc = load_lems_definitions(condition)[0]
+
+    # One copy of the network per pattern; population and component ids of copies are suffixed with the copy number
+    patterns = [select_mf_pattern(runID_k, correlationRadius) for runID_k in runIDs]
+    net_file_name, copies = write_network_file(condition, [pattern[0] for pattern in patterns], network_format)
+
+    # Refractory poisson input of each MF -- ON rate for active MFs, OFF rate for silent MFs
     spike_generator_ref_poisson_type = spike_generator_doc.component_types['MyspikeGeneratorRefPoisson']
     lems_instances_doc = lems.Model()
-    spike_generator_on = lems.Component("mossySpikerON", spike_generator_ref_poisson_type.name)
-    spike_generator_on.set_parameter("minimumISI", "%s ms" % minimumISI)
-    spike_generator_on.set_parameter("averageRate", "%s Hz" % ONRate)
-    lems_instances_doc.add(spike_generator_on)
-
-    # Refractory poisson input -- representing silent MF
-    spike_generator_off = lems.Component("mossySpikerOFF", spike_generator_ref_poisson_type.name)
-    spike_generator_off.set_parameter("minimumISI", "%s ms" % minimumISI)
-    spike_generator_off.set_parameter("averageRate", "%s Hz" % OFFRate)
-    lems_instances_doc.add(spike_generator_off)
-
-    # Synapses
-    rothmanMFToGrCAMPA = rothmanMFToGrCAMPA_doc.components['RothmanMFToGrCAMPA'].id
-    rothmanMFToGrCNMDA = rothmanMFToGrCNMDA_doc.components['RothmanMFToGrCNMDA'].id
-    
-    # Create ON MF, OFF MF, and GC populations
-    GrCPop = nml.Population(id="GrCPop", component=iaF_GrC.id, size=N_grc)
-    mossySpikersPopON = nml.Population(id=spike_generator_on.id + "Pop", component=spike_generator_on.id, size=N_mf_ON)
-    mossySpikersPopOFF = nml.Population(id=spike_generator_off.id + "Pop", component=spike_generator_off.id,
-                                        size=N_mf_OFF)
-    
-    # Create network and add populations
-    net = nml.Network(id="network")
-    net_doc = nml.NeuroMLDocument(id=net.id)
-    net_doc.networks.append(net)
-    net.populations.append(GrCPop)
-    net.populations.append(mossySpikersPopON)
-    net.populations.append(mossySpikersPopOFF)
-    
-    # MF-GC connectivity
-    # First connect ON MFs to GCs
-    for mf_ix_ON in range(N_mf_ON):
-        mf_ix = mf_indices_ON[mf_ix_ON]
-        # Find which GCs are neighbors
-        innervated_grcs = np.where(conn_mat[mf_ix, :] == 1)[0]
-        for grc_ix in innervated_grcs:
-            # Add AMPAR and NMDAR mediated synapses
-            for synapse in [rothmanMFToGrCAMPA, rothmanMFToGrCNMDA]:
-                connection = nml.SynapticConnection(from_='{}[{}]'.format(mossySpikersPopON.id, mf_ix_ON),
-                                                    synapse=synapse,
-                                                    to='GrCPop[{}]'.format(grc_ix))
-                net.synaptic_connections.append(connection)
-    
-    # Now connect OFF MFs to GCs
-    for mf_ix_OFF in range(N_mf_OFF):
-        mf_ix = mf_indices_OFF[mf_ix_OFF]
-        # Find which GCs are neighbors
-        innervated_grcs = np.where(conn_mat[mf_ix, :] == 1)[0]
-        for grc_ix in innervated_grcs:
-            # Add AMPAR and NMDAR mediated synapses
-            for synapse in [rothmanMFToGrCAMPA, rothmanMFToGrCNMDA]:
-                connection = nml.SynapticConnection(from_='{}[{}]'.format(mossySpikersPopOFF.id, mf_ix_OFF),
-                                                    synapse=synapse,
-                                                    to='GrCPop[{}]'.format(grc_ix))
-                net.synaptic_connections.append(connection)
-    
-    # Write network to file
-    net_file_name = 'generated_network_{}.net.nml'.format(runID)
-    pynml.write_neuroml2_file(net_doc, net_file_name, validate=False)
+    end_filenames = []
+    for k, (N_syn, f_mf, run_num, conn_mat, mf_indices_ON, mf_indices_OFF) in enumerate(patterns):
+        suffix = '' if len(runIDs) == 1 else '_{}'.format(k)
+        is_ON = np.zeros(conn_mat.shape[0], bool)
+        is_ON[mf_indices_ON] = True
+        for i in range(conn_mat.shape[0]):
+            spike_generator = lems.Component("mossySpiker{}{}".format(i, suffix), spike_generator_ref_poisson_type.name)
+            spike_generator.set_parameter("minimumISI", "%s ms" % minimumISI)
+            spike_generator.set_parameter("averageRate", "%s Hz" % (ONRate if is_ON[i] else OFFRate))
+            lems_instances_doc.add(spike_generator)
+
+        # Add parameter values to spike time filename
+        end_filenames.append('{}_{:.2f}_{}'.format(N_syn, f_mf, run_num))
+
+    # File and simulation names: runID, or first runID and number of packed patterns
+    sim_name = '{}'.format(runIDs[0]) if len(runIDs) == 1 else '{}x{}'.format(runIDs[0], len(runIDs))
 
     # Write LEMS instances to file
-    lems_instances_file_name = 'instances_{}.xml'.format(runID)
+    lems_instances_file_name = 'instances_{}.xml'.format(sim_name)
     pynml.write_lems_file(lems_instances_doc, lems_instances_file_name, validate=False)
 
     # Create a LEMSSimulation to manage creation of LEMS file
-    ls = LEMSSimulation('sim_{}'.format(runID), duration, dt)
+    ls = LEMSSimulation('sim_{}'.format(sim_name), duration, dt)
 
     # Point to network as target of simulation
-    ls.assign_simulation_target(net.id)
+    ls.assign_simulation_target("network")
 
     # Include generated/existing NeuroML2 files
     ls.include_neuroml2_file(iaf_nml2_file_name)
@@ -180,41 +446,399 @@ def generate_grc_layer_network(runID, correlationRadius, duration=180.0, dt=0.05
     ls.include_lems_file(nmda_syn_filename, include_included=False)
     ls.include_neuroml2_file(net_file_name)
 
-    # Specify Displays and Output Files
-    # Details for saving output files
-    basedir = '../results/{}_data_r{}/'.format(condition, correlationRadius)
-
-    # Add parameter values to spike time filename
-    end_filename = '{}_{:.2f}_{}'.format(N_syn, f_mf, run_num)
-
-    # Save MF spike times under basedir + MF_spikes_ + end_filename
-    eof0 = 'MFspikes_file'
-    ls.create_event_output_file(eof0, basedir + "MF_spikes_" + end_filename + ".dat")
-    # ON MFs
-    for i in range(mossySpikersPopON.size):
-        ls.add_selection_to_event_output_file(eof0, mf_indices_ON[i], "%s[%i]" % (mossySpikersPopON.id, i), 'spike')
-    # OFF MFs
-    for i in range(mossySpikersPopOFF.size):
-        ls.add_selection_to_event_output_file(eof0, mf_indices_OFF[i], "%s[%i]" % (mossySpikersPopOFF.id, i), 'spike')
-    
-    # Save GC spike times under basedir + GrC_spikes_ + end_filename
-    eof1 = 'GrCspikes_file'
-    ls.create_event_output_file(eof1, basedir + "GrC_spikes_" + end_filename + ".dat")
-    for i in range(GrCPop.size):
-        ls.add_selection_to_event_output_file(eof1, i, "%s[%i]" % (GrCPop.id, i), 'spike')
+    # Specify Displays and Output Files, separately for each copy of the network
+    for k, (end_filename, (mf_pop_ids, GrCPop)) in enumerate(zip(end_filenames, copies)):
+        suffix = '' if len(runIDs) == 1 else '_{}'.format(k)
+        # Save MF spike times under basedir + MF_spikes_ + end_filename
+        eof0 = 'MFspikes_file' + suffix
+        ls.create_event_output_file(eof0, basedir + "MF_spikes_" + end_filename + ".dat")
+        for i, mf_pop_id in enumerate(mf_pop_ids):
+            ls.add_selection_to_event_output_file(eof0, i, "%s[0]" % mf_pop_id, 'spike')
+
+        # Save GC spike times under basedir + GrC_spikes_ + end_filename
+        eof1 = 'GrCspikes_file' + suffix
+        ls.create_event_output_file(eof1, basedir + "GrC_spikes_" + end_filename + ".dat")
+        for i in range(GrCPop.size):
+            ls.add_selection_to_event_output_file(eof1, i, "%s[%i]" % (GrCPop.id, i), 'spike')
     
     lems_file_name = ls.save_to_file()
     
     if run:
         results = pynml.run_lems_with_jneuroml(lems_file_name,
-                                               max_memory="8G",
+                                               max_memory=max_memory,
                                                nogui=True,
                                                load_saved_data=False,
-                                               plot=False)
+                                               plot=False,
+                                               exit_on_fail=False)
+        # Move the spike time files written by jNeuroML into the spike store
+        if results and output == 'store':
+            spike_store.pack_dat_files(basedir, list(zip(runIDs, end_filenames)))
 
         return results
 
 
+def simulate_grc_layer_network_block(runIDs, correlationRadius, duration=180.0, dt=0.05,
+                                     minimumISI=2.0, ONRate=50.0, OFFRate=0.0, condition='orig', basedir=None,
+                                     output='dat'):
+    """
+    Simulates a block of runs together with the numpy backend.
+
+    Input patterns and MF spike trains are drawn per runID exactly as in generate_grc_layer_network, then all
+    runs sharing a connectivity are integrated in one array pass (simulate_mf_grc_network.simulate_network_batch).
+    Spike time files are identical to those of the same runIDs simulated one at a time with backend='numpy'.
+
+    :param runIDs: list of runIDs (=patterns)
+    :param correlationRadius: MF correlation radius, out of [0,5,10,15,20,25,30]
+    :param duration: total duration of the simulation (default=180ms)
+    :param dt: simulation time step (default=0.05ms)
+    :param minimumISI: minimum ISI for MF (ms, default=2.0)
+    :param ONRate: rate of active MFs (Hz, default=50.0)
+    :param OFFRate: rate of inactive MFs (Hz, default=0.0)
+    :param condition: which simulation to run ('orig' or 'ko', default='orig')
+    :param basedir: folder for spike time files (default='../results/{condition}_data_r{correlationRadius}/')
+    :param output: where spike times are saved, 'dat' or 'store' (default='dat')
+    :return: boolean (success)
+    """
+    if basedir is None:
+        basedir = '../results/{}_data_r{}/'.format(condition, correlationRadius)
+    params = load_model_params(condition)
+
+    # Draw input patterns and MF spike trains, grouped by connectivity
+    blocks = {}
+    for runID in runIDs:
+        N_syn, f_mf, run_num, conn_mat, mf_indices_ON, mf_indices_OFF = select_mf_pattern(runID, correlationRadius)
+        mf_raster = sim.generate_mf_spike_steps(sim.mf_rates(conn_mat.shape[0], mf_indices_ON, ONRate, OFFRate),
+                                                duration, dt, minimumISI)
+        block = blocks.setdefault(N_syn, {'conn_mat': conn_mat, 'mf_raster': [], 'end_filename': [], 'runID': []})
+        block['mf_raster'].append(mf_raster)
+        block['end_filename'].append('{}_{:.2f}_{}'.format(N_syn, f_mf, run_num))
+        block['runID'].append(runID)
+
+    spikes = []
+    for N_syn, block in blocks.items():
+        mf_raster = np.stack(block['mf_raster'], axis=1)
+        del block['mf_raster']
+        grc_spikes = sim.simulate_network_batch(block['conn_mat'], mf_raster, params, dt)
+        for k, end_filename in enumerate(block['end_filename']):
+            mf_ix, mf_t = sim.raster_to_spikes(mf_raster[:, k, :], dt)
+            if output == 'store':
+                spikes.append((block['runID'][k], end_filename, mf_ix, mf_t) + tuple(grc_spikes[k]))
+            else:
+                sim.write_spike_file(basedir + "MF_spikes_" + end_filename + ".dat", mf_ix, mf_t)
+                sim.write_spike_file(basedir + "GrC_spikes_" + end_filename + ".dat", *grc_spikes[k])
+    if output == 'store':
+        spike_store.write_part(basedir, spikes)
+
+    return True
+
+
+def spike_files(runID, correlationRadius, condition='orig', basedir=None):
+    """
+    Names of the MF and GC spike time files written by a run.
+    """
+    p = load_params()
+    if basedir is None:
+        basedir = '../results/{}_data_r{}/'.format(condition, correlationRadius)
+    end_filename = '{}_{:.2f}_{}'.format(p['N_syn'][int(runID)], p['f_mf'][int(runID)], p['run_num'][int(runID)])
+
+    return basedir + "MF_spikes_" + end_filename + ".dat", basedir + "GrC_spikes_" + end_filename + ".dat"
+
+
+def build_manifest(conditions, correlationRadii, runIDs):
+    """
+    Lists all (condition, correlationRadius, runID) tasks of a sweep whose spikes are neither in spike time files
+    nor in the spike store yet.
+
+    :param conditions: simulations to run (list out of 'orig', 'ko')
+    :param correlationRadii: MF correlation radii, out of [0,5,10,15,20,25,30]
+    :param runIDs: list of runIDs
+    :return: list of tasks still to be run, number of completed tasks skipped
+    """
+    tasks = []
+    skipped = 0
+    for condition in conditions:
+        for correlationRadius in correlationRadii:
+            stored = spike_store.completed_runs('../results/{}_data_r{}/'.format(condition, correlationRadius))
+            for runID in runIDs:
+                if runID in stored or all(os.path.exists(f) for f in spike_files(runID, correlationRadius, condition)):
+                    skipped += 1
+                else:
+                    tasks.append((condition, correlationRadius, runID))
+
+    return tasks, skipped
+
+
+def make_chunks(tasks, chunk_size):
+    """
+    Splits tasks into chunks of runIDs that share condition and correlation radius.
+
+    :return: list of (condition, correlationRadius, list of runIDs)
+    """
+    groups = {}
+    for condition, correlationRadius, runID in tasks:
+        groups.setdefault((condition, correlationRadius), []).append(runID)
+
+    return [(condition, correlationRadius, runIDs[k:k + chunk_size])
+            for (condition, correlationRadius), runIDs in sorted(groups.items())
+            for k in range(0, len(runIDs), chunk_size)]
+
+
+def run_with_peak_memory(function, *args, **kwargs):
+    """
+    Runs a function in a forked child process and measures the peak memory of the run.
+
+    The peak resident set size covers the child and all processes it waited for (e.g. the JVM started by
+    jNeuroML). Where os.fork is not available, the function runs in the calling process and the peak memory
+    is not measured.
+
+    :param function: function to run; a true return value counts as success
+    :return: boolean (success), peak memory (MB, nan if not measured)
+    """
+    if not hasattr(os, 'fork'):
+        return bool(function(*args, **kwargs)), np.nan
+
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 1
+        try:
+            exit_code = 0 if function(*args, **kwargs) else 1
+        finally:
+            sys.stdout.flush()
+            os._exit(exit_code)
+    pid, exit_status, usage = os.wait4(pid, 0)
+    # ru_maxrss is given in bytes on macOS and in kB on Linux
+    peak_mb = usage.ru_maxrss / (1024. ** 2 if sys.platform == 'darwin' else 1024.)
+
+    return exit_status == 0, peak_mb
+
+
+def run_chunk(chunk, backend='jnml', patterns_per_jvm=1, **kwargs):
+    """
+    Runs a chunk of tasks in a worker; failures are reported instead of raised.
+
+    jNeuroML runs are executed in forked processes to record their peak memory, with patterns_per_jvm
+    patterns packed into each LEMS simulation. For the numpy backend, the chunk is simulated as one block
+    and the peak memory of the worker is recorded.
+
+    :param chunk: (condition, correlationRadius, list of runIDs)
+    :param backend: simulator to use ('jnml' or 'numpy', default='jnml')
+    :param patterns_per_jvm: number of patterns simulated in one jNeuroML run (default=1)
+    :param kwargs: simulation parameters passed on to generate_grc_layer_network
+    :return: list of (condition, correlationRadius, runID, success, error message, peak memory (MB), run time (s))
+    """
+    condition, correlationRadius, runIDs = chunk
+    if backend == 'numpy':
+        startTime = datetime.now()
+        try:
+            simulate_grc_layer_network_block(runIDs, correlationRadius, condition=condition, **kwargs)
+            success, message = True, ''
+        except Exception as e:
+            success, message = False, repr(e)
+        seconds = (datetime.now() - startTime).total_seconds() / len(runIDs)
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024. ** 2 if sys.platform == 'darwin' else 1024.)
+        return [(condition, correlationRadius, runID, success, message, peak_mb, seconds) for runID in runIDs]
+
+    status = []
+    for k in range(0, len(runIDs), patterns_per_jvm):
+        packed = runIDs[k:k + patterns_per_jvm]
+        startTime = datetime.now()
+        try:
+            success, peak_mb = run_with_peak_memory(generate_grc_layer_network, packed, correlationRadius,
+                                                    condition=condition, run=True, **kwargs)
+            message = '' if success else 'jNeuroML run failed'
+        except Exception as e:
+            success, message, peak_mb = False, repr(e), np.nan
+        seconds = (datetime.now() - startTime).total_seconds() / len(packed)
+        status.extend([(condition, correlationRadius, runID, success, message, peak_mb, seconds)
+                       for runID in packed])
+
+    return status
+
+
+def available_memory_mb():
+    """
+    Memory available for new processes (MB), from /proc/meminfo (MemAvailable) or else the free physical pages.
+    """
+    if os.path.exists('/proc/meminfo'):
+        for line in open('/proc/meminfo'):
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) / 1024.
+
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES') / 1024. ** 2
+
+
+def plan_workers(peak_mb, available_mb=None, safety=1.5, reserve_mb=1024.):
+    """
+    Sets the number of parallel jNeuroML runs and the JVM heap size from measured peak memory.
+
+    Each run is granted safety times the largest measured peak as JVM heap; as many runs as fit into the
+    available memory (minus a reserve) run in parallel, but not more than the number of cores.
+
+    :param peak_mb: peak memory of sample runs (MB)
+    :param available_mb: available memory (MB, default: measured with available_memory_mb)
+    :param safety: factor applied to the largest measured peak memory (default=1.5)
+    :param reserve_mb: memory kept free for the system and the main process (MB, default=1024)
+    :return: number of workers, JVM max_memory string (e.g. '750M')
+    """
+    if not np.any(np.isfinite(peak_mb)):
+        raise ValueError('No peak memory measured, all sample runs failed.')
+    if available_mb is None:
+        available_mb = available_memory_mb()
+    per_run_mb = int(np.ceil(safety * np.nanmax(peak_mb)))
+    n_workers = int(max(1, min(cpu_count(), (available_mb - reserve_mb) // per_run_mb)))
+
+    return n_workers, '{}M'.format(per_run_mb)
+
+
+def measure_peak_memory(tasks, n_processes=2, log_file='run_log.txt', patterns_per_jvm=1, **kwargs):
+    """
+    Runs a sample of jNeuroML tasks with few processes and returns their peak memory.
+
+    :param tasks: list of (condition, correlationRadius, runID) to sample
+    :param n_processes: number of runs in parallel while sampling (default=2)
+    :param log_file: run log the sample runs are appended to (default='run_log.txt')
+    :param patterns_per_jvm: number of patterns simulated in one jNeuroML run (default=1)
+    :param kwargs: simulation parameters passed on to generate_grc_layer_network
+    :return: array of peak memory per successful sample jNeuroML run (MB), list of the sampled tasks that succeeded
+    """
+    conditions = sorted(set(task[0] for task in tasks))
+    correlationRadii = sorted(set(task[1] for task in tasks))
+    pool = Pool(n_processes, initializer=init_worker, initargs=(correlationRadii, conditions, 'jnml'))
+    chunk_status = list(pool.imap_unordered(partial(run_chunk, backend='jnml',
+                                                    patterns_per_jvm=patterns_per_jvm, **kwargs),
+                                            make_chunks(tasks, patterns_per_jvm)))
+    pool.close()
+    pool.join()
+    write_run_log(log_file, [s for status in chunk_status for s in status])
+    # Each chunk is one jNeuroML run; its packed patterns share the peak memory
+    peak_mb = np.array([status[0][5] for status in chunk_status if status[0][3]])
+    if len(peak_mb) == 0:
+        raise ValueError('All {} sample runs failed, see {}.'.format(len(tasks), log_file))
+    print('Peak memory of {} sample runs: mean {:.0f} MB, max {:.0f} MB'.format(
+        len(peak_mb), np.mean(peak_mb), np.max(peak_mb)))
+    completed = [(s[0], s[1], s[2]) for status in chunk_status for s in status if s[3]]
+
+    return peak_mb, completed
+
+
+def write_run_log(log_file, status):
+    """
+    Appends run status to the run log, one 'condition correlationRadius runID success peak_MB seconds' per line.
+    """
+    file = open(log_file, 'a')
+    for condition, correlationRadius, runID, success, message, peak_mb, seconds in status:
+        file.write('{}\t{}\t{}\t{:d}\t{:.1f}\t{:.3f}\n'.format(condition, correlationRadius, runID, success,
+                                                             peak_mb, seconds))
+    file.close()
+
+
+def run_sweep(tasks, pool, backend='jnml', chunk_size=16, max_retries=2, report_interval=10.,
+              failed_file='failed_runs.txt', log_file='run_log.txt', **kwargs):
+    """
+    Runs all tasks of a sweep, dispatching chunks with imap_unordered across all conditions and radii.
+
+    Reports throughput (runs/s), ETA and failures while running. Failed tasks are retried up to max_retries
+    times; tasks that still fail are written to failed_file, one 'condition correlationRadius runID' per line.
+
+    :param tasks: list of (condition, correlationRadius, runID), see build_manifest
+    :param pool: multiprocessing Pool
+    :param backend: simulator to use ('jnml' or 'numpy', default='jnml')
+    :param chunk_size: number of runs per chunk (default=16); for the numpy backend, runs of a chunk are
+                       simulated together in one block
+    :param max_retries: number of times failed tasks are retried (default=2)
+    :param report_interval: minimum time between progress reports (s, default=10)
+    :param failed_file: file to write the retry list to (default='failed_runs.txt')
+    :param log_file: run log with success, peak memory and run time of every run (default='run_log.txt')
+    :param kwargs: simulation parameters passed on to generate_grc_layer_network
+    :return: list of failed tasks with error messages
+    """
+    failed = []
+    for attempt in range(max_retries + 1):
+        if attempt > 0:
+            if len(failed) == 0:
+                break
+            print('Retrying {} failed runs (attempt {})'.format(len(failed), attempt))
+            tasks = [f[:3] for f in failed]
+        failed = []
+        n_done = 0
+        startTime = datetime.now()
+        last_report = startTime
+        run_this = partial(run_chunk, backend=backend, **kwargs)
+        for status in pool.imap_unordered(run_this, make_chunks(tasks, chunk_size)):
+            n_done += len(status)
+            failed.extend(s for s in status if not s[3])
+            write_run_log(log_file, status)
+            now = datetime.now()
+            if (now - last_report).total_seconds() >= report_interval or n_done == len(tasks):
+                last_report = now
+                rate = n_done / max((now - startTime).total_seconds(), 1e-9)
+                print('{}/{} runs, {:.2f} runs/s, ETA {:.0f} s, {} failed'.format(
+                    n_done, len(tasks), rate, (len(tasks) - n_done) / rate, len(failed)))
+
+    file = open(failed_file, 'w')
+    for condition, correlationRadius, runID, success, message, peak_mb, seconds in failed:
+        file.write('{} {} {} {}\n'.format(condition, correlationRadius, runID, message))
+    file.close()
+
+    return failed
+
+
+def validate_numpy_backend(runIDs, correlationRadius, condition='orig', duration=180.0, dt=0.05,
+                           minimumISI=2.0, ONRate=50.0, OFFRate=0.0, basedir='validation/', rtol=0.1):
+    """
+    Compares the numpy backend against jNeuroML on a subset of runs.
+
+    Each run is simulated with jNeuroML, then the MF spike trains recorded by jNeuroML are replayed
+    through the numpy GC model, so both simulators see identical input. GC spike counts after the
+    150 ms burn-in are compared per cell; population rates of a free-running numpy simulation of the
+    same runID are reported as well.
+
+    :param runIDs: list of runIDs to validate
+    :param correlationRadius: MF correlation radius, out of [0,5,10,15,20,25,30]
+    :param condition: which simulation to run ('orig' or 'ko', default='orig')
+    :param basedir: folder for spike time files of both backends (default='validation/')
+    :param rtol: tolerated relative difference of total GC spike counts (default=0.1)
+    :return: boolean (all runs within tolerance), array of per-run results
+    """
+    p = load_params()
+    params = load_model_params(condition)
+    n_steps = int(round(duration / dt))
+    for folder in [basedir, basedir + 'jnml/', basedir + 'numpy/']:
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+
+    results = np.zeros((len(runIDs), 5))
+    for k, runID in enumerate(runIDs):
+        N_syn = p['N_syn'][int(runID)]
+        conn_mat = load_connectivity(N_syn)
+        N_mf, N_grc = conn_mat.shape
+        end_filename = '{}_{:.2f}_{}'.format(N_syn, p['f_mf'][int(runID)], p['run_num'][int(runID)])
+        kwargs = dict(correlationRadius=correlationRadius, duration=duration, dt=dt, minimumISI=minimumISI,
+                      ONRate=ONRate, OFFRate=OFFRate, condition=condition)
+
+        generate_grc_layer_network(runID, run=True, basedir=basedir + 'jnml/', **kwargs)
+        generate_grc_layer_network(runID, backend='numpy', basedir=basedir + 'numpy/', **kwargs)
+
+        # Replay jNeuroML MF input through the numpy GC model
+        mf_ix, mf_t = sim.read_spike_file(basedir + 'jnml/MF_spikes_' + end_filename + '.dat')
+        grc_ix, grc_t = sim.read_spike_file(basedir + 'jnml/GrC_spikes_' + end_filename + '.dat')
+        replay_ix, replay_t = sim.simulate_network(conn_mat, sim.spikes_to_raster(mf_ix, mf_t, n_steps, N_mf, dt),
+                                                   params, dt)
+        free_ix, free_t = sim.read_spike_file(basedir + 'numpy/GrC_spikes_' + end_filename + '.dat')
+
+        counts_jnml = np.bincount(grc_ix[grc_t >= 150.], minlength=N_grc)
+        counts_replay = np.bincount(replay_ix[replay_t >= 150.], minlength=N_grc)
+        counts_free = np.bincount(free_ix[free_t >= 150.], minlength=N_grc)
+        results[k] = [runID, counts_jnml.sum(), counts_replay.sum(), np.mean(counts_jnml == counts_replay),
+                      counts_free.sum()]
+        print('runID {:.0f}: GC spikes jnml {:.0f}, numpy replay {:.0f} ({:.1%} cells identical), '
+              'numpy free {:.0f}'.format(*results[k]))
+
+    passed = np.all(np.abs(results[:, 2] - results[:, 1]) <= rtol * np.maximum(results[:, 1], 1))
+
+    return passed, results
+
+
 if __name__ == '__main__':
     
     startTime = datetime.now()
@@ -222,6 +846,36 @@ if __name__ == '__main__':
     # type of simulation to run; change this to 'ko' for GluA4_KO model
     sim_type = 'orig' 
 
+    # simulator to use: 'jnml' (NeuroML/jNeuroML) or 'numpy' (in-process, see simulate_mf_grc_network.py)
+    backend = 'jnml'
+
+    # memory available to each worker for batched numpy simulations (bytes); sets the number of patterns per block
+    memory_budget = 2e9
+
+    # number of jNeuroML runs used to measure peak memory before sizing workers and JVM heap
+    n_memory_sample = 8
+
+    # set to True to compare the numpy backend against jNeuroML on a subset of runs instead of running all
+    validate = False
+
+    # set to True to print the per-run setup cost with and without preloading of static inputs instead of running all
+    benchmark_setup = False
+
+    # number of patterns simulated in one jNeuroML run (one JVM start-up and model build per group of patterns);
+    # raise it only after checking with benchmark_batch that packing patterns is faster on the target machine
+    patterns_per_jvm = 1
+
+    # set to True to print jNeuroML wall time per pattern for increasing patterns_per_jvm instead of running all
+    benchmark_batch = False
+
+    # file format of the generated networks for jNeuroML: 'xml' or 'hdf5' (smaller files, faster to write and read)
+    network_format = 'xml'
+
+    # where spike times are saved: 'dat' (two text files per run) or 'store' (one binary spike store per results
+    # folder, see spike_store.py); with 'store', set export_dat to True to also write .dat files from the store
+    output = 'dat'
+    export_dat = False
+
     # total number of simulation runs per correlation radius (= num_patterns * len(f_mf))
     runs = range(5760)
 
@@ -230,22 +884,54 @@ if __name__ == '__main__':
 
     # Move working dir to tempdata to hide xml and nml files
     os.chdir('tempdata')
-    
-    pool = Pool()
-    for i, c in enumerate(corrs):
-        run_this = partial(generate_grc_layer_network,
-                           correlationRadius=c,
-                           duration=180,
-                           dt=0.05,
-                           minimumISI=2,
-                           ONRate=50,
-                           OFFRate=0,
-                           condition=sim_type,
-                           run=True)
-        results = pool.map(run_this, runs)
-    
-    pool.close()
-    pool.join()
+
+    if validate:
+        passed, _ = validate_numpy_backend(runs[::640], correlationRadius=0, condition=sim_type)
+        print('Validation passed: {}'.format(passed))
+    elif benchmark_setup:
+        time_setup(runs[::64], correlationRadius=corrs[-1], condition=sim_type, backend=backend)
+    elif benchmark_batch:
+        benchmark_jnml_batch(runs[:32], correlationRadius=corrs[-1], condition=sim_type,
+                             basedir='benchmark/', network_format=network_format)
+    else:
+        # Build the list of runs still to do (existing spike time files are skipped) and run them in chunks
+        # across all correlation radii; static inputs are loaded once per worker and shared by all its runs
+        tasks, skipped = build_manifest([sim_type], corrs, runs)
+        print('{} runs to do, {} already completed'.format(len(tasks), skipped))
+        sim_params = dict(duration=180, dt=0.05, minimumISI=2, ONRate=50, OFFRate=0, output=output)
+        if backend == 'numpy':
+            # Simulate blocks of patterns in one array pass, spread evenly over the workers
+            n_workers = cpu_count()
+            N_mf, N_grc = load_connectivity(load_params()['N_syn'][0]).shape
+            n_steps = int(round(sim_params['duration'] / sim_params['dt']))
+            chunk_size = min(sim.patterns_per_block(memory_budget, n_steps=n_steps, N_mf=N_mf, N_grc=N_grc),
+                             max(1, -(-len(tasks) // n_workers)))
+        else:
+            sim_params['network_format'] = network_format
+            # Measure peak memory of a few runs, then set the number of workers and JVM heap size to fit memory
+            # (sample runs use the same number of patterns per jNeuroML run as the sweep)
+            n_sample = min(n_memory_sample * patterns_per_jvm, len(tasks))
+            peak_mb, completed = measure_peak_memory(tasks[:n_sample], patterns_per_jvm=patterns_per_jvm,
+                                                     **sim_params)
+            # Failed sample runs are retried in the sweep
+            completed = set(completed)
+            tasks = [task for task in tasks if task not in completed]
+            n_workers, sim_params['max_memory'] = plan_workers(peak_mb)
+            print('Running {} workers with JVM heap {}'.format(n_workers, sim_params['max_memory']))
+            chunk_size = 2 * patterns_per_jvm
+            sim_params['patterns_per_jvm'] = patterns_per_jvm
+        pool = Pool(n_workers, initializer=init_worker, initargs=(corrs, [sim_type], backend))
+        failed = run_sweep(tasks, pool, backend=backend, chunk_size=chunk_size, **sim_params)
+        pool.close()
+        pool.join()
+        print('{} runs failed, see failed_runs.txt'.format(len(failed)))
+        if output == 'store':
+            # Merge the part files written by the workers into one store per results folder
+            for correlationRadius in corrs:
+                basedir = '../results/{}_data_r{}/'.format(sim_type, correlationRadius)
+                spike_store.consolidate(basedir)
+                if export_dat:
+                    spike_store.export_dat(basedir)
     
     print(datetime.now() - startTime)
     
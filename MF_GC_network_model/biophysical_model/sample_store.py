@@ -0,0 +1,44 @@
+# Binary store of MF and GC activity patterns (spike counts, cells x patterns) for the analysis scripts
+# save_samples_as_txt.py writes MF_samples_{N_syn}_{f_mf}.npy and GrC_samples_{N_syn}_{f_mf}.npy next to the .txt
+# files, with the smallest unsigned integer type that holds the counts. load_samples opens them memory-mapped,
+# so that processes reading the same samples (e.g. workers of a Pool) share pages instead of each parsing text.
+# Folders with only .txt files are converted once, on first load.
+
+import numpy as np
+import os
+
+
+def sample_file(basedir, population, N_syn, f_mf, ext='.npy'):
+    """
+    Name of the samples file of a population ('MF' or 'GrC').
+    """
+    return basedir + '/{}_samples_{:.0f}_{:.2f}{}'.format(population, N_syn, f_mf, ext)
+
+
+def save_samples(basedir, population, N_syn, f_mf, samples):
+    """
+    Saves spike counts (cells x patterns) as .npy, with the smallest unsigned integer type that holds them.
+    The file only appears under its name once it is complete.
+    """
+    samples = np.asarray(samples)
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+        if samples.max() <= np.iinfo(dtype).max:
+            break
+    filename = sample_file(basedir, population, N_syn, f_mf)
+    temp_filename = filename + '.{}.tmp'.format(os.getpid())
+    file = open(temp_filename, 'wb')
+    np.save(file, samples.astype(dtype))
+    file.close()
+    os.rename(temp_filename, filename)
+
+
+def load_samples(basedir, population, N_syn, f_mf, mmap_mode='r'):
+    """
+    Spike counts (cells x patterns) of a population ('MF' or 'GrC'), memory-mapped (read-only) by default.
+    The .txt file is converted to .npy if there is no .npy file yet.
+    """
+    filename = sample_file(basedir, population, N_syn, f_mf)
+    if not os.path.exists(filename):
+        save_samples(basedir, population, N_syn, f_mf, np.loadtxt(sample_file(basedir, population, N_syn, f_mf, '.txt')))
+
+    return np.load(filename, mmap_mode=mmap_mode)
@@ -1,30 +1,59 @@
 # After all runs are finished, converts .dat files
 # into .txt files for further analysis
-# run as python save_samples_as_txt.py basedir
+# run as python save_samples_as_txt.py basedir [n_processes]
 # where basedir is desired directory e.g. data_r20
+# Spike files are read and counted in parallel by n_processes (default: number of CPUs)
+# Samples are also saved as .npy files, read by the analysis scripts through sample_store.py
+# Population sparseness, variance and covariance (as get_spar_cov.py) are computed while counts are ingested
+# and saved as gc_spar_biophys_*.txt and gc_cov_biophys_*.txt
 
 import numpy as np
 import pickle as pkl
 import os
 import sys
+import spike_store
+import simulate_mf_grc_network as sim
+import sample_store
+import population_statistics as stats
+from multiprocessing import Pool, cpu_count
+from functools import partial
 
 
-def get_spike_counts(data, N):
-	x = np.zeros(N)
-	if len(data) > 0:
-		for i in range(N):
-			if len(data.shape) == 1:
-				data = data.reshape(1, 2)
-			ixs = np.where(data[:, 0] == i)[0]
-			# Number of spikes after 150 ms 'burn in' period
-			x[i] = len(np.where(data[ixs, :][:, 1] >= 0.150)[0])
+# Spike stores opened by this process, by basedir
+_stores = {}
 
-	return x
+
+def get_spike_counts(ix, t, N):
+	# Number of spikes per cell after 150 ms 'burn in' period
+	x = np.bincount(ix[t >= 150.], minlength=N)[:N]
+
+	return x.astype(float)
+
+
+def load_spikes(basedir, population, end_filename):
+	# Cell indices and spike times (ms) from the spike store of basedir if there is one (see spike_store.py),
+	# else from the .dat file
+	if basedir not in _stores:
+		if os.path.exists(basedir+'/'+spike_store.INDEX_FILE):
+			_stores[basedir] = spike_store.open_store(basedir+'/')
+		else:
+			_stores[basedir] = None
+	store = _stores[basedir]
+	if store is None:
+		return sim.read_spike_file(basedir+'/'+population+'_spikes_'+end_filename+'.dat')
+	return spike_store.read_spikes(store, end_filename, population)
+
+
+def count_run(basedir, end_filename, N_mf, N_grc):
+	# MF and GC spike counts of one run
+	return (get_spike_counts(*load_spikes(basedir, 'MF', end_filename), N=N_mf),
+			get_spike_counts(*load_spikes(basedir, 'GrC', end_filename), N=N_grc))
 
 
 if __name__ == '__main__':
 	
 	basedir = sys.argv[1]
+	n_processes = int(sys.argv[2]) if len(sys.argv) > 2 else cpu_count()
 
 	file = open('params_file.pkl','rb')
 	p = pkl.load(file)
@@ -33,27 +62,60 @@ if __name__ == '__main__':
 	# Network parameters
 	N_mf = 187
 	N_grc = 487
-	N_patt = len(np.unique(p['run_num'])) / (len(np.unique(p['N_syn'])) * len(np.unique(p['f_mf'])))
+	N_patt = len(np.unique(p['run_num'])) // (len(np.unique(p['N_syn'])) * len(np.unique(p['f_mf'])))
 
 	N_syn = np.unique(p['N_syn'])
 	p_mf_ON = np.unique(p['f_mf'])
 
+	# Population statistics for the N_syn and f_mf values of get_spar_cov.py
+	N_syn_stats = 4
+	f_mf_stats = np.linspace(0.1, 0.9, 9)
+	statistics = {}
+	for f in f_mf_stats:
+		statistics[('MF', '{:.2f}'.format(f))] = stats.StreamingStatistics(N_mf)
+		statistics[('GrC', '{:.2f}'.format(f))] = stats.StreamingStatistics(N_grc)
+
+	# Count spikes of all runs in parallel, in order of N_syn, f_mf and pattern
+	end_filenames = [str(N_syn[ii])+'_'+'{:.2f}'.format(p_mf_ON[jj])+'_'+str(kk)
+					 for ii in range(len(N_syn)) for jj in range(len(p_mf_ON)) for kk in range(N_patt)]
+	pool = Pool(n_processes)
+	counts = pool.imap(partial(count_run, basedir, N_mf=N_mf, N_grc=N_grc), end_filenames, chunksize=16)
+
 	for ii in range(len(N_syn)):
 		for jj in range(len(p_mf_ON)):
 			print(ii, jj)
 			samples_mf = np.zeros((N_mf, N_patt))
 			samples_grc = np.zeros((N_grc, N_patt))
 			for kk in range(N_patt):
-				# Get MF spike counts
-				data = np.loadtxt(basedir+'/'+'MF_spikes_'+str(N_syn[ii])+'_'+'{:.2f}'.format(p_mf_ON[jj])+'_'+str(kk)+'.dat')
-				samples_mf[:, kk] = get_spike_counts(data, N_mf)
-				# Get GC spike counts
-				data = np.loadtxt(basedir+'/'+'GrC_spikes_'+str(N_syn[ii])+'_'+'{:.2f}'.format(p_mf_ON[jj])+'_'+str(kk)+'.dat')
-				samples_grc[:, kk] = get_spike_counts(data, N_grc)
+				samples_mf[:, kk], samples_grc[:, kk] = next(counts)
+				if N_syn[ii] == N_syn_stats and ('MF', '{:.2f}'.format(p_mf_ON[jj])) in statistics:
+					statistics[('MF', '{:.2f}'.format(p_mf_ON[jj]))].add(samples_mf[:, kk])
+					statistics[('GrC', '{:.2f}'.format(p_mf_ON[jj]))].add(samples_grc[:, kk])
 			# save as .txt files
 			np.savetxt(basedir+'/'+'MF_samples_'+str(N_syn[ii])+'_'+'{:.2f}'.format(p_mf_ON[jj])+'.txt', samples_mf, fmt='%2.0f')
 			np.savetxt(basedir+'/'+'GrC_samples_'+str(N_syn[ii])+'_'+'{:.2f}'.format(p_mf_ON[jj])+'.txt', samples_grc, fmt='%2.0f')
+			# and as binary .npy files for the analysis scripts (see sample_store.py)
+			sample_store.save_samples(basedir, 'MF', N_syn[ii], p_mf_ON[jj], samples_mf)
+			sample_store.save_samples(basedir, 'GrC', N_syn[ii], p_mf_ON[jj], samples_grc)
 
 			# uncomment the following two lines in order to automatically remove .dat files
 			#os.system('rm '+basedir+'/'+'MF_spikes_'+str(N_syn[ii])+'_'+'{:.2f}'.format(p_mf_ON[jj])+'_*.dat')
 			#os.system('rm '+basedir+'/'+'GrC_spikes_'+str(N_syn[ii])+'_'+'{:.2f}'.format(p_mf_ON[jj])+'_*.dat')
+
+	pool.close()
+	pool.join()
+
+	# Save population statistics, one row per f_mf (as get_spar_cov.py)
+	spar, cov = [], []
+	for f in f_mf_stats:
+		stats_mf = statistics[('MF', '{:.2f}'.format(f))]
+		stats_grc = statistics[('GrC', '{:.2f}'.format(f))]
+		if stats_mf.n_patterns > 1:
+			(spar_mf, active_mf), (spar_gc, active_gc) = stats_mf.get_spar(), stats_grc.get_spar()
+			(var_mf, cov_mf), (var_gc, cov_gc) = stats_mf.get_var_cov(), stats_grc.get_var_cov()
+			spar.append([spar_mf, spar_gc, active_mf, active_gc])
+			cov.append([var_mf, var_gc, cov_mf, cov_gc])
+	filename1 = 'gc_spar_biophys_' + basedir.rstrip('/').split('_')[-1] + '.txt'
+	np.savetxt(basedir + '/' + filename1, spar, delimiter='\t')
+	filename2 = 'gc_cov_biophys_' + basedir.rstrip('/').split('_')[-1] + '.txt'
+	np.savetxt(basedir + '/' + filename2, cov, delimiter='\t')
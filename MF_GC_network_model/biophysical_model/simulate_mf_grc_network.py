@@ -0,0 +1,389 @@
+# Native NumPy simulation of the MF-GC network
+# Alternative backend to jNeuroML for run_mf_grc_network.py: the whole GC population
+# is integrated as arrays in-process, without writing NeuroML/LEMS files or starting a JVM.
+# Cell, synapse and plasticity parameters are read from the files in grc_lemsDefinitions,
+# so the 'orig' and 'ko' conditions use exactly the same definitions as the jNeuroML runs.
+#
+# Model (integrated with forward Euler, as jLEMS does by default):
+# * MFs: refractory Poisson spike generators (MyspikeGeneratorRefPoisson)
+# * GCs: iafRefCell (IaF_GrC_{orig,ko}.nml)
+# * AMPA: TriExpDirectTetraExpSpilloverStpSynapse with Tsodyks-Markram depression
+#   of the direct and spillover components
+# * NMDA: TriExpBlockStpSynapse with Tsodyks-Markram depression/facilitation and Mg block
+# Synaptic waveforms and short-term plasticity only depend on the presynaptic MF, so they are
+# integrated once per MF and projected onto the GCs through conn_mat.
+# simulate_network_batch advances a block of input patterns together as (patterns x cells) matrices.
+
+import numpy as np
+import os
+import re
+import xml.etree.ElementTree as ET
+from scipy import sparse
+
+
+LEMS_DIR = '../../grc_lemsDefinitions/'
+
+# Conversion factors to the units used in this module: ms, mV, nS, pF, mM, K
+UNITS = {'': 1., 's': 1e3, 'ms': 1., 'V': 1e3, 'mV': 1.,
+         'S': 1e9, 'mS': 1e6, 'uS': 1e3, 'nS': 1., 'pS': 1e-3,
+         'F': 1e12, 'uF': 1e6, 'nF': 1e3, 'pF': 1.,
+         'M': 1e3, 'mM': 1., 'uM': 1e-3, 'K': 1.}
+
+FARADAY = 96485.3365  # C/mol
+GAS_CONSTANT = 8.3144621  # J/(K mol)
+
+
+def parse_quantity(value):
+    """
+    Converts a NeuroML/LEMS quantity string (e.g. '3.724 nS') to a float in module units.
+
+    :param value: quantity string
+    :return: float
+    """
+    match = re.match(r'^\s*([-+0-9.eE]+)\s*([A-Za-z_]*)\s*$', value)
+    number, unit = float(match.group(1)), match.group(2)
+    if unit == 'degC':
+        return number + 273.15
+
+    return number * UNITS[unit]
+
+
+def _find(root, tag):
+    # Find first element with given tag, ignoring XML namespaces
+    for element in root.iter():
+        if element.tag.split('}')[-1] == tag:
+            return element
+    raise ValueError('Element {} not found.'.format(tag))
+
+
+def _definition_file(lems_dir, name, condition):
+    # Definition files are named e.g. IaF_GrC_orig.nml and IaF_GrC_KO.nml
+    filename = lems_dir + name.format(condition)
+    if not os.path.exists(filename):
+        filename = lems_dir + name.format(condition.upper())
+
+    return filename
+
+
+def _attributes(element, skip=('id', 'type', 'species')):
+    return dict((k, parse_quantity(v)) for k, v in element.attrib.items() if k not in skip)
+
+
+def load_model_params(condition='orig', lems_dir=LEMS_DIR):
+    """
+    Reads GC, AMPA and NMDA parameters from the NeuroML/LEMS definition files.
+
+    :param condition: which model to load ('orig' or 'ko', default='orig')
+    :param lems_dir: folder containing the definition files
+    :return: dict with parameter dicts 'cell', 'ampa' and 'nmda'
+    """
+    cell = _attributes(_find(ET.parse(_definition_file(lems_dir, 'IaF_GrC_{}.nml', condition)).getroot(), 'iafRefCell'))
+
+    root = ET.parse(_definition_file(lems_dir, 'MFGrC_AMPA_{}.xml', condition)).getroot()
+    ampa = _attributes(_find(root, 'TriExpDirectTetraExpSpilloverStpSynapse'))
+    ampa['directPM'] = _attributes(_find(root, 'directPM'))
+    ampa['spilloverPM'] = _attributes(_find(root, 'spilloverPM'))
+
+    root = ET.parse(_definition_file(lems_dir, 'MFGrC_NMDA_{}.xml', condition)).getroot()
+    nmda = _attributes(_find(root, 'TriExpBlockStpSynapse'))
+    nmda['plasticityMechanism'] = _attributes(_find(root, 'plasticityMechanism'))
+    nmda['blockMechanism'] = _attributes(_find(root, 'blockMechanism'))
+
+    return {'cell': cell, 'ampa': ampa, 'nmda': nmda}
+
+
+def _peak_factor(tau_rise, tau_decay):
+    # Normalisation of a difference of exponentials to unit peak (directFactor/spilloverFactor in LEMS)
+    t_peak = (tau_rise * tau_decay) / (tau_decay - tau_rise) * np.log(tau_decay / tau_rise)
+    return 1. / (-np.exp(-t_peak / tau_rise) + np.exp(-t_peak / tau_decay))
+
+
+def synapse_kernels(p, prefix, n):
+    """
+    Expresses a multi-exponential synaptic waveform as a sum of exponentially decaying states.
+
+    The conductance sum_k amp_k * (B_k - A_k) is rewritten as sum_j weight_j * X_j, where all
+    rise states (A_k) share the same time constant and are merged into a single state.
+
+    :param p: synapse parameter dict
+    :param prefix: 'direct' or 'spillover'
+    :param n: number of decay components
+    :return: time constants (ms) and conductance increments (nS) per unit plasticity factor
+    """
+    tau_rise = p[prefix + 'TauRise']
+    taus = [tau_rise]
+    weights = [0.]
+    for k in range(1, n + 1):
+        tau_decay = p[prefix + 'TauDecay{}'.format(k)]
+        w = p[prefix + 'Amp{}'.format(k)] * _peak_factor(tau_rise, tau_decay)
+        weights[0] -= w
+        taus.append(tau_decay)
+        weights.append(w)
+
+    return np.array(taus), p['scalefactor'] * np.array(weights)
+
+
+def block_factor(v, p):
+    """
+    Mg block of the NMDA synapse (RothmanBlockMechanism).
+
+    :param v: membrane potential (mV)
+    :param p: block mechanism parameter dict
+    :return: block factor
+    """
+    theta = p['z'] * FARADAY / (GAS_CONSTANT * p['T']) * 1e-3  # per mV
+    a = p['C1'] * np.exp(p['deltaBind'] * theta * v) + p['C2'] * np.exp(-p['deltaPerm'] * theta * v)
+
+    return a / (a + p['blockConcentration'] * np.exp(-p['deltaBind'] * theta * v))
+
+
+def generate_mf_spike_steps(rates, duration, dt, minimumISI):
+    """
+    Draws refractory Poisson spike trains for all MFs, quantized to the simulation time step.
+
+    ISIs follow the MyspikeGeneratorRefPoisson definition, minimumISI - (1/rate - minimumISI) * log(1 - u).
+    A generator fires on the first time step at which the time since its last spike exceeds the ISI.
+
+    :param rates: firing rate of each MF (Hz)
+    :param duration: duration of the simulation (ms)
+    :param dt: simulation time step (ms)
+    :param minimumISI: minimum ISI (ms)
+    :return: boolean array (number of time steps x N_mf), True where a MF spikes
+    """
+    n_steps = int(round(duration / dt))
+    rates = np.asarray(rates, float)
+    n_isi = int(duration / minimumISI) + 2
+    u = np.random.uniform(size=(len(rates), n_isi))
+    with np.errstate(divide='ignore'):
+        mean_isi = np.where(rates > 0, 1000. / rates, np.inf)
+    isi = minimumISI - (mean_isi[:, None] - minimumISI) * np.log(1 - u)
+    steps = np.cumsum(np.floor(np.minimum(isi, 2 * duration) / dt) + 1, axis=1)
+    raster = np.zeros((n_steps, len(rates)), bool)
+    mf_ix, k = np.where(steps <= n_steps)
+    raster[steps[mf_ix, k].astype(int) - 1, mf_ix] = True
+
+    return raster
+
+
+def fan_in(conn_mat):
+    """
+    Lists the presynaptic MFs of every GC.
+
+    :param conn_mat: connectivity matrix (N_mf x N_grc), dense or sparse, all GCs with the same number of dendrites
+    :return: integer array (N_syn x N_grc) of MF indices
+    """
+    N_grc = conn_mat.shape[1]
+    if sparse.issparse(conn_mat):
+        conn_mat = sparse.csc_matrix(conn_mat)
+        conn_mat.sort_indices()
+        mf_ix = conn_mat.indices
+        grc_ix = np.repeat(np.arange(N_grc), np.diff(conn_mat.indptr))
+    else:
+        grc_ix, mf_ix = np.nonzero(np.asarray(conn_mat).T)
+    assert (len(mf_ix) % N_grc == 0 and np.all(np.bincount(grc_ix, minlength=N_grc) == len(mf_ix) // N_grc)), \
+        'All GCs must have the same number of dendrites.'
+
+    return mf_ix.reshape(N_grc, -1).T
+
+
+def _project(g_mf, pre):
+    # Sum MF conductances onto GCs; summing dendrite by dendrite keeps every pattern bit-identical
+    # regardless of how many patterns are simulated together
+    g = g_mf[:, pre[0]]
+    for j in range(1, pre.shape[0]):
+        g = g + g_mf[:, pre[j]]
+    return g
+
+
+def _weighted_sum(X, w):
+    g = X[0] * w[0]
+    for k in range(1, len(w)):
+        g = g + X[k] * w[k]
+    return g
+
+
+def patterns_per_block(memory_budget, n_steps, N_mf, N_grc):
+    """
+    Number of patterns that can be simulated together by simulate_network_batch within a memory budget.
+
+    :param memory_budget: memory available for one block (bytes)
+    :param n_steps: number of time steps
+    :param N_mf: number of MFs
+    :param N_grc: number of GCs
+    :return: int
+    """
+    # boolean MF raster, 14 synaptic/plasticity states per MF, GC state and temporaries (float64)
+    bytes_per_pattern = n_steps * N_mf + 8 * (2 * 14 * N_mf + 8 * N_grc)
+
+    return max(1, int(memory_budget // bytes_per_pattern))
+
+
+def simulate_network_batch(conn_mat, mf_raster, params, dt=0.05):
+    """
+    Integrates the GC population for a block of input patterns at once.
+
+    All patterns share connectivity and parameters; state variables are (patterns x cells) matrices,
+    so the per-time step overhead is paid once per block. Each pattern gives exactly the same spikes
+    as when simulated on its own.
+
+    :param conn_mat: connectivity matrix (N_mf x N_grc)
+    :param mf_raster: boolean MF spike raster (number of time steps x patterns x N_mf)
+    :param params: model parameters as returned by load_model_params
+    :param dt: simulation time step (ms, default=0.05)
+    :return: list with GC spike indices and spike times (ms) for each pattern
+    """
+    n_steps, N_patt, N_mf = mf_raster.shape
+    pre = fan_in(conn_mat)
+    N_grc = pre.shape[1]
+    cell, ampa, nmda = params['cell'], params['ampa'], params['nmda']
+
+    # Synaptic waveform states per MF (direct AMPA, spillover AMPA, NMDA)
+    tau_d, w_d = synapse_kernels(ampa, 'direct', 2)
+    tau_s, w_s = synapse_kernels(ampa, 'spillover', 3)
+    tau_n, w_n = synapse_kernels(nmda, 'direct', 2)
+    X_d, X_s, X_n = (np.zeros((len(tau), N_patt, N_mf)) for tau in [tau_d, tau_s, tau_n])
+    decay_d, decay_s, decay_n = ((1. - dt / tau)[:, None, None] for tau in [tau_d, tau_s, tau_n])
+
+    # Short-term plasticity states per MF
+    U_d, tauRec_d = ampa['directPM']['initReleaseProb'], ampa['directPM']['tauRec']
+    U_s, tauRec_s = ampa['spilloverPM']['initReleaseProb'], ampa['spilloverPM']['tauRec']
+    U0_n = nmda['plasticityMechanism']['initReleaseProb']
+    tauRec_n, tauFac_n = nmda['plasticityMechanism']['tauRec'], nmda['plasticityMechanism']['tauFac']
+    R_d, R_s, R_n = np.ones((N_patt, N_mf)), np.ones((N_patt, N_mf)), np.ones((N_patt, N_mf))
+    U_n = U0_n * np.ones((N_patt, N_mf))
+
+    # GC state
+    v = cell['leakReversal'] * np.ones((N_patt, N_grc))
+    refractory_until = -np.ones((N_patt, N_grc))
+    spike_patt, spike_ix, spike_t = [], [], []
+
+    for step in range(n_steps):
+        t = step * dt
+        # Membrane potential
+        g_ampa = _project(_weighted_sum(X_d, w_d) + _weighted_sum(X_s, w_s), pre)
+        g_nmda = _project(_weighted_sum(X_n, w_n), pre)
+        g_syn = g_ampa + g_nmda * block_factor(v, nmda['blockMechanism'])
+        dv = dt * (cell['leakConductance'] * (cell['leakReversal'] - v) + g_syn * (ampa['erev'] - v)) / cell['C']
+        v = np.where(t > refractory_until, v + dv, v)
+        # Synaptic decay and recovery from depression/facilitation
+        X_d *= decay_d
+        X_s *= decay_s
+        X_n *= decay_n
+        R_d += dt * (1. - R_d) / tauRec_d
+        R_s += dt * (1. - R_s) / tauRec_s
+        R_n += dt * (1. - R_n) / tauRec_n
+        U_n += dt * (U0_n - U_n) / tauFac_n
+        t += dt
+        # Presynaptic spikes: increment waveforms with current plasticity factor, then depress
+        spikes = mf_raster[step]
+        if spikes.any():
+            X_d += spikes * R_d * U_d
+            X_s += spikes * R_s * U_s
+            X_n += spikes * R_n * U_n
+            R_d = np.where(spikes, R_d * (1. - U_d), R_d)
+            R_s = np.where(spikes, R_s * (1. - U_s), R_s)
+            R_n = np.where(spikes, R_n * (1. - U_n), R_n)
+            U_n = np.where(spikes, U_n + U0_n * (1. - U_n), U_n)
+        # Postsynaptic spikes
+        fired = v > cell['thresh']
+        if fired.any():
+            v[fired] = cell['reset']
+            refractory_until[fired] = t + cell['refract']
+            patt, ix = np.nonzero(fired)
+            spike_patt.append(patt)
+            spike_ix.append(ix)
+            spike_t.append(t * np.ones(len(ix)))
+
+    if len(spike_ix) == 0:
+        return [(np.zeros(0, int), np.zeros(0)) for k in range(N_patt)]
+
+    # Split spikes by pattern, keeping them in time order
+    spike_patt, spike_ix, spike_t = np.concatenate(spike_patt), np.concatenate(spike_ix), np.concatenate(spike_t)
+    order = np.argsort(spike_patt, kind='mergesort')
+    bounds = np.searchsorted(spike_patt[order], np.arange(N_patt + 1))
+
+    return [(spike_ix[order[bounds[k]:bounds[k + 1]]], spike_t[order[bounds[k]:bounds[k + 1]]])
+            for k in range(N_patt)]
+
+
+def simulate_network(conn_mat, mf_raster, params, dt=0.05):
+    """
+    Integrates the GC population driven by given MF spike trains.
+
+    :param conn_mat: connectivity matrix (N_mf x N_grc)
+    :param mf_raster: boolean MF spike raster (number of time steps x N_mf)
+    :param params: model parameters as returned by load_model_params
+    :param dt: simulation time step (ms, default=0.05)
+    :return: GC spike indices and spike times (ms)
+    """
+    return simulate_network_batch(conn_mat, mf_raster[:, None, :], params, dt)[0]
+
+
+def raster_to_spikes(raster, dt):
+    """
+    Converts a spike raster to time-ordered spike indices and times (ms).
+    """
+    steps, ix = np.where(raster)
+
+    return ix, (steps + 1) * dt
+
+
+def spikes_to_raster(ix, times, n_steps, N, dt):
+    """
+    Converts spike indices and times (ms) to a spike raster.
+    """
+    raster = np.zeros((n_steps, N), bool)
+    steps = np.round(np.asarray(times) / dt).astype(int) - 1
+    keep = (steps >= 0) & (steps < n_steps)
+    raster[steps[keep], np.asarray(ix, int)[keep]] = True
+
+    return raster
+
+
+def write_spike_file(filename, ix, times):
+    """
+    Writes spikes in the jNeuroML event output format (cell index, time in s).
+    The file only appears under its name once it is complete.
+    """
+    np.savetxt(filename + '.tmp', np.column_stack((ix, np.asarray(times) * 1e-3)), fmt=['%d', '%.5f'], delimiter='\t')
+    os.rename(filename + '.tmp', filename)
+
+
+def read_spike_file(filename):
+    """
+    Reads a jNeuroML event output file, returns cell indices and spike times (ms).
+    The file is parsed in one pass (same values as np.loadtxt, several times faster).
+    """
+    file = open(filename, 'rb')
+    data = np.array(file.read().split(), dtype=float).reshape(-1, 2)
+    file.close()
+
+    return data[:, 0].astype(int), data[:, 1] * 1e3
+
+
+def mf_rates(N_mf, mf_indices_ON, ONRate=50.0, OFFRate=0.0):
+    """
+    Firing rate of each MF (Hz) for a given set of active MFs.
+    """
+    rates = OFFRate * np.ones(N_mf)
+    rates[np.asarray(mf_indices_ON, int)] = ONRate
+
+    return rates
+
+
+def run_pattern(conn_mat, mf_indices_ON, params, duration=180.0, dt=0.05, minimumISI=2.0,
+                ONRate=50.0, OFFRate=0.0):
+    """
+    Simulates one input pattern.
+
+    :param conn_mat: connectivity matrix (N_mf x N_grc)
+    :param mf_indices_ON: indices of active MFs
+    :param params: model parameters as returned by load_model_params
+    :return: MF spike indices and times, GC spike indices and times (ms)
+    """
+    mf_raster = generate_mf_spike_steps(mf_rates(conn_mat.shape[0], mf_indices_ON, ONRate, OFFRate),
+                                        duration, dt, minimumISI)
+    mf_ix, mf_t = raster_to_spikes(mf_raster, dt)
+    grc_ix, grc_t = simulate_network(conn_mat, mf_raster, params, dt)
+
+    return mf_ix, mf_t, grc_ix, grc_t
@@ -0,0 +1,211 @@
+# Binary store of MF and GC spike times, one per results folder (condition and MF correlation radius)
+# Replaces the two .dat text files per run written by run_mf_grc_network.py (output = 'store').
+#
+# While simulations run, each worker writes one compressed part file per chunk of runs (spike_parts/part_*.npz).
+# consolidate() then appends the runs of each part, one part at a time, to
+#   MF_spikes.bin, GrC_spikes.bin: raw (cell, time) records (RECORD), grouped by run, times in ms
+#   spikes_index.npz: runIDs and spike file names ('N_syn_f_mf_run_num') of the stored runs in the order they were
+#                     appended, and for each population the offsets of each run's records
+# Records carry no runID: the offsets give the run of each record (part files store the number of records per run).
+# The records are stored uncompressed, so that readers can memory-map them (open_store) and the spikes of a run are
+# a view into the file; consolidating costs the memory of one part, whatever the size of the store.
+# export_dat() writes the usual MF_spikes_*.dat/GrC_spikes_*.dat files from the store.
+
+import numpy as np
+import os
+import simulate_mf_grc_network as sim
+
+
+POPULATIONS = ['MF', 'GrC']
+RECORD = np.dtype([('cell', '<u4'), ('time', '<f4')])
+PART_DIR = 'spike_parts/'
+INDEX_FILE = 'spikes_index.npz'
+
+
+def _save_atomic(filename, save):
+    # The file only appears under its name once it is complete
+    file = open(filename + '.tmp', 'wb')
+    save(file)
+    file.close()
+    os.rename(filename + '.tmp', filename)
+
+
+def _store_file(basedir, population):
+    return basedir + '{}_spikes.bin'.format(population)
+
+
+def _load_index(basedir):
+    # Index of the consolidated store, or an empty index
+    if not os.path.exists(basedir + INDEX_FILE):
+        return dict([('runs', np.zeros(0, np.uint32)), ('names', np.zeros(0, str))] +
+                    [(population + '_offsets', np.zeros(1, np.int64)) for population in POPULATIONS])
+
+    return dict(np.load(basedir + INDEX_FILE))
+
+
+def write_part(basedir, runs):
+    """
+    Writes the spikes of a chunk of runs to a compressed part file.
+
+    :param basedir: results folder of the store
+    :param runs: list of (runID, end_filename, MF indices, MF times, GC indices, GC times), times in ms
+    """
+    if len(runs) == 0:
+        return
+    if not os.path.isdir(basedir + PART_DIR):
+        os.makedirs(basedir + PART_DIR)
+    part = {'runs': np.array([run[0] for run in runs], np.uint32),
+            'names': np.array([run[1] for run in runs])}
+    for k, population in enumerate(POPULATIONS):
+        records = [np.zeros(len(run[2 + 2 * k]), RECORD) for run in runs]
+        for run, rec in zip(runs, records):
+            rec['cell'] = run[2 + 2 * k]
+            rec['time'] = run[3 + 2 * k]
+        part[population] = np.concatenate(records)
+        part[population + '_counts'] = np.array([len(rec) for rec in records], np.int64)
+    filename = basedir + PART_DIR + 'part_{}_{}.npz'.format(part['runs'][0], len(runs))
+    _save_atomic(filename, lambda file: np.savez_compressed(file, **part))
+
+
+def pack_dat_files(basedir, runs, remove=True):
+    """
+    Moves the .dat spike time files of a chunk of runs (as written by jNeuroML) into a part file.
+
+    :param basedir: results folder of the .dat files and the store
+    :param runs: list of (runID, end_filename)
+    :param remove: remove the .dat files once packed (default=True)
+    """
+    spikes = []
+    for runID, end_filename in runs:
+        mf_ix, mf_t = sim.read_spike_file(basedir + 'MF_spikes_' + end_filename + '.dat')
+        grc_ix, grc_t = sim.read_spike_file(basedir + 'GrC_spikes_' + end_filename + '.dat')
+        spikes.append((runID, end_filename, mf_ix, mf_t, grc_ix, grc_t))
+    write_part(basedir, spikes)
+    if remove:
+        for runID, end_filename in runs:
+            for population in POPULATIONS:
+                os.remove(basedir + population + '_spikes_' + end_filename + '.dat')
+
+
+def _part_files(basedir):
+    if not os.path.isdir(basedir + PART_DIR):
+        return []
+    return sorted(basedir + PART_DIR + f for f in os.listdir(basedir + PART_DIR) if f.endswith('.npz'))
+
+
+def completed_runs(basedir):
+    """
+    runIDs with spikes in the store, consolidated or in part files.
+    """
+    runs = set()
+    if os.path.exists(basedir + INDEX_FILE):
+        runs.update(np.load(basedir + INDEX_FILE)['runs'].tolist())
+    for filename in _part_files(basedir):
+        runs.update(np.load(filename)['runs'].tolist())
+
+    return runs
+
+
+def consolidate(basedir):
+    """
+    Appends the runs of all part files to the store of a results folder and removes the part files.
+    Runs stored more than once (e.g. re-run after an interrupted sweep) are kept once.
+
+    :return: number of runs in the store
+    """
+    index = _load_index(basedir)
+    for filename in _part_files(basedir):
+        part = np.load(filename)
+        # Runs of the part that are not in the store yet
+        runs, first = np.unique(part['runs'], return_index=True)
+        new = ~np.isin(runs, index['runs'])
+        first = np.sort(first[new])
+        runs = part['runs'][first]
+        for population in POPULATIONS:
+            records = part[population]
+            counts = part[population + '_counts']
+            part_offsets = np.append(0, np.cumsum(counts))
+            offsets = index[population + '_offsets']
+            file = open(_store_file(basedir, population), 'ab')
+            # Records beyond the index are from an interrupted consolidation
+            file.truncate(offsets[-1] * RECORD.itemsize)
+            for k in first:
+                file.write(records[part_offsets[k]:part_offsets[k + 1]].tobytes())
+            file.close()
+            index[population + '_offsets'] = np.append(offsets, offsets[-1] + np.cumsum(counts[first]))
+        index['runs'] = np.append(index['runs'], runs).astype(np.uint32)
+        index['names'] = np.append(index['names'], part['names'][first])
+        _save_atomic(basedir + INDEX_FILE, lambda file: np.savez(file, **index))
+        os.remove(filename)
+
+    return len(index['runs'])
+
+
+def open_store(basedir):
+    """
+    Opens the consolidated store of a results folder; spike records are memory-mapped.
+
+    :return: dict with runs, names, row of each runID and spike file name ('rows'), records per population
+             ('MF', 'GrC') and offsets per population
+    """
+    index = np.load(basedir + INDEX_FILE)
+    store = {'runs': index['runs'], 'names': index['names']}
+    # Row of each run in the index, looked up by runID or by spike file name
+    store['rows'] = dict(zip(store['runs'].tolist(), range(len(store['runs']))))
+    store['rows'].update(zip(store['names'].tolist(), range(len(store['names']))))
+    for population in POPULATIONS:
+        offsets = index[population + '_offsets']
+        if offsets[-1] > 0:
+            store[population] = np.memmap(_store_file(basedir, population), RECORD, 'r', shape=(offsets[-1],))
+        else:
+            store[population] = np.zeros(0, RECORD)
+        store[population + '_offsets'] = offsets
+
+    return store
+
+
+def read_spikes(store, run, population):
+    """
+    Spikes of one run, as views into the memory-mapped store.
+
+    :param store: store as returned by open_store
+    :param run: runID, or spike file name of the run ('N_syn_f_mf_run_num')
+    :param population: 'MF' or 'GrC'
+    :return: cell indices, spike times (ms)
+    """
+    if not isinstance(run, str):
+        run = int(run)
+    assert (run in store['rows']), 'Run {} is not in the store.'.format(run)
+    k = store['rows'][run]
+    offsets = store[population + '_offsets']
+    records = store[population][offsets[k]:offsets[k + 1]]
+
+    return records['cell'], records['time']
+
+
+def export_dat(basedir, runs=None):
+    """
+    Writes MF_spikes_*.dat and GrC_spikes_*.dat files (jNeuroML format) from the store.
+
+    :param basedir: results folder of the store
+    :param runs: runIDs to export (default: all stored runs)
+    """
+    store = open_store(basedir)
+    if runs is None:
+        runs = store['runs']
+    for runID in runs:
+        end_filename = store['names'][store['rows'][int(runID)]]
+        for population in POPULATIONS:
+            sim.write_spike_file(basedir + population + '_spikes_' + end_filename + '.dat',
+                                 *read_spikes(store, runID, population))
+
+
+if __name__ == '__main__':
+
+    import sys
+
+    # python spike_store.py basedir [dat]: consolidates the part files of basedir, optionally exports .dat files
+    basedir = sys.argv[1].rstrip('/') + '/'
+    print('{} runs in store'.format(consolidate(basedir)))
+    if len(sys.argv) > 2 and sys.argv[2] == 'dat':
+        export_dat(basedir)
@@ -0,0 +1,76 @@
+# Checks of the learning engines in run_learning.py on small random problems
+# run as python -m pytest test_run_learning.py (or python test_run_learning.py)
+
+import numpy as np
+import shutil
+import tempfile
+from run_learning import backprop_nohid, backprop_nohid_stacked, get_targets
+
+
+def make_problems(n_patterns=40, n_in=(12, 20), c=4, seed=0):
+    # Random binary input sets of different sizes and random one-hot targets
+    rng = np.random.RandomState(seed)
+    training_sets = [(rng.uniform(size=(n, n_patterns)) < 0.3).astype(float) for n in n_in]
+    np.random.seed(seed)
+    targets = [get_targets(c, n_patterns), get_targets(c, n_patterns)]
+
+    return training_sets, targets
+
+
+def test_stacked_reproduces_backprop_nohid():
+    training_sets, targets = make_problems()
+    n_epochs, gamma = 20, 0.1
+    input_ix, target_ix, seeds = [0, 1, 0, 1], [0, 0, 1, 1], [3, 4, 5, 6]
+    for batch_size in [1, 8]:
+        rngs = [np.random.RandomState(seed) for seed in seeds]
+        err_rms, err, weights = backprop_nohid_stacked(training_sets, targets, input_ix, target_ix, rngs, n_epochs,
+                                                       gamma, batch_size)
+        for p in range(len(seeds)):
+            np.random.seed(seeds[p])
+            err_rms_p, err_p, w_p = backprop_nohid(training_sets[input_ix[p]], targets[target_ix[p]], n_epochs, gamma,
+                                                   batch_size)
+            assert np.allclose(err_rms[p], err_rms_p, rtol=1e-10, atol=1e-12)
+            assert np.array_equal(err[p], err_p)
+            assert np.allclose(weights[p], w_p, rtol=1e-10, atol=1e-12)
+
+
+def test_resume_matches_uninterrupted(tmpdir):
+    training_sets, targets = make_problems()
+    checkpoint = str(tmpdir) + '/checkpoint_test.npz'
+    np.random.seed(1)
+    err_full, _, w_full = backprop_nohid(training_sets[0], targets[0], 30, 0.1)
+    np.random.seed(1)
+    err_part, _, _ = backprop_nohid(training_sets[0], targets[0], 12, 0.1, checkpoint=checkpoint)
+    err_resumed, _, w_resumed = backprop_nohid(training_sets[0], targets[0], 30, 0.1, checkpoint=checkpoint,
+                                               resume=True)
+    assert np.array_equal(err_part, err_full[:12])
+    assert np.array_equal(err_full, err_resumed)
+    assert np.array_equal(w_full, w_resumed)
+
+
+def test_early_stopping_resumes_to_full_run(tmpdir):
+    training_sets, targets = make_problems()
+    checkpoint = str(tmpdir) + '/checkpoint_test.npz'
+    np.random.seed(2)
+    err_full, _, w_full = backprop_nohid(training_sets[1], targets[1], 400, 0.5)
+    np.random.seed(2)
+    err_early, _, _ = backprop_nohid(training_sets[1], targets[1], 400, 0.5, plateau=(10, 1e-2),
+                                     checkpoint=checkpoint)
+    n_trained = np.sum(~np.isnan(err_early))
+    assert n_trained < 400
+    assert np.all(np.isnan(err_early[n_trained:]))
+    assert np.array_equal(err_early[:n_trained], err_full[:n_trained])
+    err_resumed, _, w_resumed = backprop_nohid(training_sets[1], targets[1], 400, 0.5, checkpoint=checkpoint,
+                                               resume=True)
+    assert np.array_equal(err_full, err_resumed)
+    assert np.array_equal(w_full, w_resumed)
+
+
+if __name__ == '__main__':
+
+    test_stacked_reproduces_backprop_nohid()
+    tmpdir = tempfile.mkdtemp()
+    test_resume_matches_uninterrupted(tmpdir)
+    test_early_stopping_resumes_to_full_run(tmpdir)
+    shutil.rmtree(tmpdir)
+    print('ok')
@@ -1,7 +1,12 @@
 
 import numpy as np
-import pickle as pkl
+import os
 from datetime import datetime
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from scipy import sparse
+from scipy.stats import ks_2samp
+from connectivity import load_connectivity, save_connectivity
 
 
 # Following generates uniformly distributed granule positions of fixed density within ball of diameter diam
@@ -24,38 +29,27 @@ def generate_glom_positions(p_num_glom,glom_density,dx,dy,dz,diam):
 	avg_mf_incube = int(avg_total_glom_incube/avg_glom_per_mf)
 	# Generate the number of glomeruli that each mossy fiber has:
 	num_glom = draw_from_p_num_glom(p_num_glom,avg_mf_incube)
-	glom_mf_id = np.zeros((num_glom.sum()),int) # vector that indexes which mossy fiber is associated with each glomeruli 
-	glom_pos = np.zeros((num_glom.sum(),3)); ix = 0 
-	for k in range(0,avg_mf_incube):
-		glom_mf_id[ix:ix+num_glom[k]] = k
-		# For each mossy fiber, the first glomerulus is randomly (uniformly) positioned
-		glom_pos[ix,:] = np.random.uniform(low=-big_diam/2,high=big_diam/2,size=(3))
-		for j in range(1,int(num_glom[k])):
-			# Distance of each glomerulus belonging to mossy fiber k is exponentially distributed away from the previous glomerulus
-			glom_pos[ix+j] = glom_pos[ix+j-1,:] + [(-1)**np.round(np.random.uniform())*np.random.exponential(scale=dx),(-1)**np.round(np.random.uniform())*np.random.exponential(scale=dy),(-1)**np.round(np.random.uniform())*np.random.exponential(scale=dz)]
-		ix = ix + num_glom[k]
+	glom_mf_id = np.repeat(np.arange(avg_mf_incube),num_glom) # vector that indexes which mossy fiber is associated with each glomeruli 
+	# For each mossy fiber, the first glomerulus is randomly (uniformly) positioned
+	# Distance of each glomerulus belonging to mossy fiber k is exponentially distributed away from the previous glomerulus:
+	# the glomeruli of all mossy fibers are random walks (cumulative sums of steps, one row of steps per mossy fiber)
+	steps = (-1)**np.round(np.random.uniform(size=(avg_mf_incube,num_glom.max(),3)))*np.random.exponential(scale=[dx,dy,dz],size=(avg_mf_incube,num_glom.max(),3))
+	steps[:,0,:] = np.random.uniform(low=-big_diam/2,high=big_diam/2,size=(avg_mf_incube,3))
+	glom_pos = np.cumsum(steps,axis=1)[np.arange(num_glom.max())[None,:] < num_glom[:,None]]
 	# Delete all glomeruli that do not lie within ball of diameter diam:
 	which_glom_in_ball = np.where(np.sqrt(glom_pos[:,0]**2+glom_pos[:,1]**2+glom_pos[:,2]**2)<=(diam)/2)[0]
 	glom_pos = glom_pos[which_glom_in_ball,:]; glom_mf_id = glom_mf_id[which_glom_in_ball]; glom_mf_id = renumber(glom_mf_id)
 	return glom_pos, glom_mf_id
 
 def renumber(glom_mf_id):
-	N_glom = glom_mf_id.shape[0]; mfs = np.unique(glom_mf_id)
-	N_mf = mfs.shape[0]
-	glom_mf_id_new = np.zeros((N_glom),int)
-	count = 0
-	for k in range(N_mf):
-		glom_mf_id_new[np.where(glom_mf_id==mfs[k])[0]] = k
-	return glom_mf_id_new
+	return np.unique(glom_mf_id,return_inverse=True)[1]
 
 def draw_from_p_num_glom(p,numsamples):
-	values = np.arange(1,len(p)+1.)
+	values = np.arange(1,len(p)+1)
 	p_cum = np.cumsum(np.append([0],p[0:-1]))
-	samples = np.zeros((numsamples))
 	randvars = np.random.uniform(0,1,numsamples)
-	for k in range(0,numsamples):
-		samples[k] = values[np.where(randvars[k]>p_cum)[0][-1]]
-	return samples
+	# index of the last entry of p_cum below each random number
+	return values[np.searchsorted(p_cum,randvars)-1]
 
 def get_degreedist(glom_mf_id,N_grc,N_glom,d):
 	ddist = np.zeros((N_glom),int)
@@ -70,163 +64,243 @@ def get_degreedist(glom_mf_id,N_grc,N_glom,d):
 			ddist[gl] = ddist[gl] + 1
 	return ddist
 
+# Glomeruli degrees for adding one dendrite to every granule cell of a valid connectivity matrix: each granule cell
+# chooses one more mossy fiber among those it is not yet connected to, and a random glomerulus of that mossy fiber
+def get_degreedist_increment(conn_mat,glom_mf_id):
+	N_glom, N_grc = conn_mat.shape
+	ddist = np.zeros((N_glom),int)
+	mf_attached = np.zeros((glom_mf_id.max()+1,N_grc),int)
+	np.add.at(mf_attached,glom_mf_id,conn_mat)
+	for g in range(N_grc):
+		mf_chosen = np.random.choice(np.where(mf_attached[:,g] == 0)[0])
+		gl = np.random.choice(np.where(glom_mf_id == mf_chosen)[0])
+		ddist[gl] = ddist[gl] + 1
+	return ddist
+
 # Find granule cell that is closest to being dlen away from a given glomeruli
-# that is also not connected to that mossy fiber or that has more than d connections
-def closest_allowed_grc(attached_grcs,grc_pos,this_glom_pos,conn_mat,d,dlen):
-	N_grc = grc_pos.shape[0]
-	grcs_not_yet_attached = [n for n in range(N_grc) if n not in attached_grcs]
-	grcs_not_yet_full = [n for n in range(N_grc) if conn_mat[:,n].sum() < d]
-	grcs_available = [n for n in grcs_not_yet_full if n in grcs_not_yet_attached]
-	dists_from_glom = np.sqrt(((grc_pos-this_glom_pos)**2).sum(axis=1))
-	dists = np.abs(dists_from_glom-dlen)
-	if len(dists[grcs_available])>0:
-		grc_closest = grcs_available[np.argmin(dists[grcs_available])]
-	else:
-		grc_closest = -1
+# among the available granule cells (not connected to that mossy fiber and with fewer than d connections)
+# dist_dev: deviation from dlen of the distance of each granule cell to the glomerulus (row of the table computed
+# once by alg_connections); ties go to the lowest index
+def closest_allowed_grc(available,dist_dev):
+	if not np.any(available):
+		return -1
+	candidates = np.where(available)[0]
+	grc_closest = candidates[np.argmin(dist_dev[candidates])]
 	return grc_closest
 
 # Checks that connectivity is valid, or throws an error if:
 #   1. no granule cell is connected to multiple glomeruli from the same mossy fiber
 #   2. degree distribution of glomeruli does not match ddist
 #   3. any granule cell has >d connections
+# conn_mat can be dense or sparse; the checks take O(number of connections)
 def check_valid_connectivity(conn_mat,ddist,glom_mf_id,d):
-	N_mf = np.unique(glom_mf_id).shape[0]
-	for mf in range(N_mf):
-		gloms = np.where(glom_mf_id == mf)[0]
-		assert(np.all(conn_mat[gloms,:].sum(axis=0)<=1)),'Mossy fiber '+str(mf)+' has multiple connections to same granule cell.'
-	assert(np.all(conn_mat.sum(axis=1) - ddist==0)),'Glomeruli degree distribution does not match desired distribution.'
-	assert(np.all(conn_mat.sum(axis=0) == d)),'Granule cells do not all have ' +str(d)+ ' dendrites.'
+	conn_mat = sparse.coo_matrix(conn_mat)
+	gl = conn_mat.row[conn_mat.data != 0]; grc = conn_mat.col[conn_mat.data != 0]
+	mf_grc, counts = np.unique(glom_mf_id[gl].astype(np.int64)*conn_mat.shape[1]+grc,return_counts=True)
+	mf_multiple = mf_grc[counts > 1] // conn_mat.shape[1]
+	assert(len(mf_multiple) == 0),'Mossy fiber '+str(mf_multiple[0])+' has multiple connections to same granule cell.'
+	assert(np.all(np.bincount(gl,minlength=conn_mat.shape[0]) - ddist==0)),'Glomeruli degree distribution does not match desired distribution.'
+	assert(np.all(np.bincount(grc,minlength=conn_mat.shape[1]) == d)),'Granule cells do not all have ' +str(d)+ ' dendrites.'
 
 # Connection the following swapping procedure:
-#  1. Choose an incomplete glomerulus (i) and an incomplete granule cell (A) connected to it
+#  1. Choose an incomplete glomerulus (i) and an incomplete granule cell (A)
 #  2. Choose a complete glomerulus (ii) that is not connected to grc A through any mossy fibers
-#  3. Choose a complete granule cell (B) that is connected to glom ii
+#  3. Choose a complete granule cell (B) that is connected to glom ii and not to the mossy fiber of glom i
 #  4. Delete connection ii -> B 
 #  5. Connect i -> B and ii -> A
 # Choose the swap that minimizes (dist(i,B)-dlen)^2 + (dist(ii,A)-dlen)^2
-def optswap(glom_incomplete,grcs_incomplete,grcs_swappable,grc_pos,glom_pos,conn_mat,dlen):
-	N_glom = glom_pos.shape[0]; N_grc = grc_pos.shape[0]
-	# First make list of glomeruli that can be swapped from an eligible granule cell to an incomplete granule cell
-	gloms_swappable = []
-	for j in range(len(grcs_incomplete)):
-		gloms = [];
-		for k in range(len(grcs_swappable)):
-			# glomeruli that are connected to grcs_swappable[j] but not to grcs_incomplete[j] (through any gloms on that mf)
-			gloms.append([gl for gl in range(N_glom) if (conn_mat[gl,grcs_swappable[k]]==1 and conn_mat[np.where(glom_mf_id==glom_mf_id[gl])[0],grcs_incomplete[j]].sum()==0)])
-		gloms_swappable.append(gloms)
-	# Next, make table of 
-	deviation = np.zeros((len(grcs_incomplete),len(grcs_swappable)),float)
-	index_ii = np.zeros((len(grcs_incomplete),len(grcs_swappable)),int)
-	glom_i = glom_pos[glom_incomplete]
-	for i in range(len(grcs_incomplete)):
-		grc_A = grc_pos[grcs_incomplete[i]] 
-		for j in range(len(grcs_swappable)):
-			grc_B = grc_pos[grcs_swappable[j]]
-			dist_iB = np.sqrt(((glom_i - grc_B)**2).sum())
-			gloms = gloms_swappable[i][j]
-			deviation_temp = np.zeros((len(gloms)),float)
-			for k in range(len(gloms)):
-				glom_ii = glom_pos[gloms[k]]
-				dist_iiA = np.sqrt(((glom_ii - grc_A)**2).sum())
-				deviation_temp[k] = (dlen - dist_iB)**2 + (dlen - dist_iiA)**2
-			deviation[i,j] = deviation_temp.min()
-			index_ii[i,j] = deviation_temp.argmin()
+# The deviation of all candidate swaps (glom ii x grc A x grc B) is evaluated at once from the glomerulus-grc
+# distances (dists) and the number of connections of each mossy fiber to each grc (mf_conns, updated in place);
+# ties go to the lowest index of grc A, then grc B, then glom ii
+def optswap(glom_incomplete,grcs_incomplete,grcs_swappable,dists,conn_mat,mf_conns,glom_mf_id,dlen):
+	# Glomeruli connected to grc B (glom x B) whose mossy fiber is not connected to grc A (glom x A)
+	connected_B = conn_mat[:,grcs_swappable] == 1
+	mf_free_A = mf_conns[glom_mf_id][:,grcs_incomplete] == 0
+	# Deviation of each swap (glom ii x A x B), infinite where glom ii cannot be swapped
+	deviation = (dlen - dists[glom_incomplete,grcs_swappable])[None,None,:]**2 + (dlen - dists[:,grcs_incomplete])[:,:,None]**2
+	deviation[~(connected_B[:,None,:] & mf_free_A[:,:,None])] = np.inf
+	index_ii = deviation.argmin(axis=0)
+	deviation = deviation.min(axis=0)
+	assert(np.isfinite(deviation.min())),'Function optswap found no valid swap for glom '+str(glom_incomplete)+'.'
 	# Best swap:
-	index = np.where(deviation == deviation.min())
-	index_A = index[0][0]; index_B = index[1][0]
+	index_A, index_B = np.unravel_index(deviation.argmin(),deviation.shape)
 	opt_grc_A = grcs_incomplete[index_A]
 	opt_grc_B = grcs_swappable[index_B]
-	opt_glom_ii = gloms_swappable[index_A][index_B][index_ii[index_A,index_B]]
+	opt_glom_ii = index_ii[index_A,index_B]
 	# Sanity check on selected gloms and grcs
 	assert(conn_mat[opt_glom_ii,opt_grc_B]==1),'Something is wrong with function optswap: glom ii is not connected to grc B.'
-	assert(conn_mat[glom_incomplete,opt_grc_A]==1 ),'Something is wrong with function optswap: glom i is not connected to grc A.'
+	assert(mf_conns[glom_mf_id[glom_incomplete],opt_grc_B]==0),'Something is wrong with function optswap: mossy fiber of glom i is connected to grc B.'
 	assert(conn_mat[opt_glom_ii,opt_grc_A]==0),'Something is wrong with function optswap: glom ii is connected to grc A.'
 	# Update connectivity matrix to reflect swap
 	conn_mat[opt_glom_ii,opt_grc_B] = 0
 	conn_mat[opt_glom_ii,opt_grc_A] = 1
 	conn_mat[glom_incomplete,opt_grc_B] = 1
+	mf_conns[glom_mf_id[opt_glom_ii],opt_grc_B] -= 1
+	mf_conns[glom_mf_id[opt_glom_ii],opt_grc_A] += 1
+	mf_conns[glom_mf_id[glom_incomplete],opt_grc_B] += 1
 	return conn_mat
 
-def shuffle_conns(grc_pos,glom_pos,d,dlen,gloms_incomplete,conn_mat,ddist):
-	N_grc = grc_pos.shape[0]
+# Distances between all glomeruli and granule cells (glom x grc)
+def get_distances(grc_pos,glom_pos):
+	return np.sqrt(((glom_pos[:,None,:]-grc_pos[None,:,:])**2).sum(axis=2))
+
+def shuffle_conns(grc_pos,glom_pos,glom_mf_id,d,dlen,gloms_incomplete,conn_mat,ddist):
+	dists = get_distances(grc_pos,glom_pos)
+	# Number of connections of each mossy fiber to each granule cell (mf x grc)
+	mf_conns = np.zeros((glom_mf_id.max()+1,grc_pos.shape[0]),int)
+	np.add.at(mf_conns,glom_mf_id,conn_mat)
 	for gl in gloms_incomplete:
 		incomplete_conns = ddist[gl] - conn_mat[gl,:].sum()
 		for conn in range(incomplete_conns):
-			# list of granule cells that are incomplete (have <d dendrites)
-			grcs_incomplete = [n for n in range(N_grc) if conn_mat[:,n].sum() < d]
-			# list of granule cells that could be swapped, i.e., have = d dendrites
-			# and that are not connected to the glomerulus in question
-			grcs_swappable = [n for n in range(N_grc) if (n not in grcs_incomplete and conn_mat[gl,n]==0 )]
+			# granule cells that are incomplete (have <d dendrites)
+			grc_degree = conn_mat.sum(axis=0)
+			grcs_incomplete = np.where(grc_degree < d)[0]
+			# granule cells that could be swapped, i.e., have = d dendrites
+			# and that are not connected to the mossy fiber of the glomerulus in question
+			grcs_swappable = np.where((grc_degree >= d) & (mf_conns[glom_mf_id[gl]] == 0))[0]
 			# find optimal "swap", update connectivity matrix
-			conn_mat = optswap(gl,grcs_incomplete,grcs_swappable,grc_pos,glom_pos,conn_mat,dlen)
+			conn_mat = optswap(gl,grcs_incomplete,grcs_swappable,dists,conn_mat,mf_conns,glom_mf_id,dlen)
 	#
 	return conn_mat
 
 # Connect granule cells and glomeruli according desired degree distribution, to fulfill all desired properties
-def alg_connections(grc_pos,glom_pos,glom_mf_id,d,dlen):
+# conn_mat_start: valid connectivity matrix for d-1 dendrites to start from (warm start); one dendrite is added to
+# every granule cell, the existing connections are only changed by the swaps of shuffle_conns
+# ddist: desired glomerular degrees (summing to N_grc*d), by default drawn with get_degreedist (or
+# get_degreedist_increment for a warm start)
+def alg_connections(grc_pos,glom_pos,glom_mf_id,d,dlen,conn_mat_start=None,ddist=None):
 	N_grc = grc_pos.shape[0]; N_glom = glom_pos.shape[0]
-	ddist = get_degreedist(glom_mf_id,N_grc,N_glom,d)
-	#
-	conn_mat = np.zeros((N_glom,N_grc),int)
-	for conn in range(1,ddist.max()+1):
+	if conn_mat_start is None:
+		conn_mat = np.zeros((N_glom,N_grc),int)
+		if ddist is None:
+			ddist = get_degreedist(glom_mf_id,N_grc,N_glom,d)
+	else:
+		conn_mat = conn_mat_start.copy()
+		if ddist is None:
+			ddist = conn_mat.sum(axis=1) + get_degreedist_increment(conn_mat,glom_mf_id)
+	# Connections each glomerulus still needs
+	ddist_missing = ddist - conn_mat.sum(axis=1)
+	# Number of dendrites of each grc and grcs attached to each mf, updated with every connection
+	grc_degree = conn_mat.sum(axis=0)
+	mf_attached = np.zeros((np.unique(glom_mf_id).shape[0],N_grc),bool)
+	mf_attached[glom_mf_id[np.nonzero(conn_mat)[0]],np.nonzero(conn_mat)[1]] = True
+	# Deviation from dlen of all glomerulus-grc distances (glom x grc)
+	dist_dev = np.abs(get_distances(grc_pos,glom_pos)-dlen)
+	for conn in range(1,ddist_missing.max()+1):
 		for gl in range(N_glom):
-			if conn <= ddist[gl]:
+			if conn <= ddist_missing[gl]:
 				mf = glom_mf_id[gl]
-				# all glom on same mf
-				glom_on_mf = np.where(glom_mf_id==mf)[0]
-				# find all grcs that are attached to that mf
-				attached_grcs = np.where(conn_mat[glom_on_mf].sum(axis=0))[0]
-				this_grc = closest_allowed_grc(attached_grcs,grc_pos,glom_pos[gl,:],conn_mat,d,dlen)
+				# grcs that are not attached to that mf and not yet full
+				available = np.logical_and(~mf_attached[mf],grc_degree < d)
+				this_grc = closest_allowed_grc(available,dist_dev[gl])
 				if this_grc >= 0:
 					conn_mat[gl,this_grc] = 1
+					grc_degree[this_grc] = grc_degree[this_grc] + 1
+					mf_attached[mf,this_grc] = True
 	#
 	# If ddist is not fully satisfied, label which glomeruli are incompletely connected
 	if not np.all(conn_mat.sum(axis=1) - ddist==0):
 		gloms_incomplete = np.where(conn_mat.sum(axis=1) != ddist)[0]
-		conn_mat = shuffle_conns(grc_pos,glom_pos,d,dlen,gloms_incomplete,conn_mat,ddist)
+		conn_mat = shuffle_conns(grc_pos,glom_pos,glom_mf_id,d,dlen,gloms_incomplete,conn_mat,ddist)
 	# Make sure connectivity matrix is valid
 	check_valid_connectivity(conn_mat,ddist,glom_mf_id,d)
 	return conn_mat
 
-# First, set up positions of the glomeruli and granule cells in a sphere
-glom_density = 6.6*10**-4 # per cubic um
-glom_dx = 60; glom_dy = 20; glom_dz = 2;
-grc_density = 1.9*10**-3 # per cubic um
-
-diam = 80 # diameter of ball in um
-dlen = 15 # target length of granule cell dendrites in um
-N_syn_range = range(1,21) # range of dendrites/synapses per cell
-
-# This gives the probability of each mossy fiber having 1, 2, 3, etc. glomeruli
-# Taken from Sultan et al. 
-p_num_glom = np.array([0.0,45.0,17.0,8.0,5.0])
-p_num_glom = p_num_glom / p_num_glom.sum()
-assert ( p_num_glom.sum() == 1)
-
-# Find randomly placed positions of the granule cells and glomeruli
-grc_pos = generate_grc_positions(grc_density,diam)
-glom_pos, glom_mf_id = generate_glom_positions(p_num_glom,glom_density,glom_dx,glom_dy,glom_dz,diam)
-N_glom = glom_pos.shape[0]; N_grc = grc_pos.shape[0]
-
-for d in N_syn_range:
-	# Connect granule cells to each other
-	print('Number of dendrites: '+str(d))
+# Connects and saves the network for d dendrites per granule cell, with its own seed (for a process pool)
+def make_connectivity(d_seed,grc_pos,glom_pos,glom_mf_id,dlen,directory='.'):
+	d, seed = d_seed
+	np.random.seed(seed)
 	startTime = datetime.now()
 	conn_mat = alg_connections(grc_pos,glom_pos,glom_mf_id,d,dlen)
-	print datetime.now() - startTime
-	# Glomerular degrees
-	ddist = conn_mat.sum(axis=1)
-	# Dendritic lengths
-	dlens = np.zeros((d*N_grc),float); ix=0
-	for gl in range(N_glom):
-		for grc in range(N_grc):
-			if conn_mat[gl,grc] == 1:
-				dlens[ix] = np.sqrt(((grc_pos[grc,:]-glom_pos[gl,:])**2).sum())
-				ix = ix+1
-	# Save to file
-	file = open('GCLconnectivity_'+str(d)+'.pkl','w')
-	p = {'conn_mat':conn_mat,'ddist':ddist,'dlens':dlens,'glom_pos':glom_pos,'grc_pos':grc_pos,'glom_mf_id':glom_mf_id}
-	pkl.dump(p,file); file.close()
+	# Save to file (sparse connectivity matrix, see connectivity.py)
+	save_connectivity(os.path.join(directory,'GCLconnectivity_'+str(d)+'.npz'),conn_mat,glom_pos,grc_pos,glom_mf_id)
+	return datetime.now() - startTime
+
+# Connects and saves the networks for all d in N_syn_range (consecutive) in one chain: each network starts from
+# the validated network for one dendrite less
+def make_connectivity_incremental(N_syn_range,seed,grc_pos,glom_pos,glom_mf_id,dlen,directory='.'):
+	assert(np.all(np.diff(N_syn_range) == 1)),'Incremental connectivity needs consecutive numbers of dendrites.'
+	np.random.seed(seed)
+	conn_mat = None; times = []
+	for d in N_syn_range:
+		startTime = datetime.now()
+		conn_mat = alg_connections(grc_pos,glom_pos,glom_mf_id,d,dlen,conn_mat_start=conn_mat)
+		save_connectivity(os.path.join(directory,'GCLconnectivity_'+str(d)+'.npz'),conn_mat,glom_pos,grc_pos,glom_mf_id)
+		times.append(datetime.now() - startTime)
+	return times
+
+# Compares the networks of the incremental and the independent runs in two folders. For each d, writes
+# mean and sd of the dendritic lengths (incremental, independent), the two-sample Kolmogorov-Smirnov statistic of
+# the dendritic lengths, sd of the glomerular degrees (incremental, independent) and the KS statistic of the
+# glomerular degrees (the mean degree is the same by construction)
+def validate_incremental(N_syn_range,dir_incremental,dir_independent,filename):
+	report = np.zeros((len(N_syn_range),9))
+	for k, d in enumerate(N_syn_range):
+		p_inc = load_connectivity(os.path.join(dir_incremental,'GCLconnectivity_'+str(d)+'.npz'))
+		p_ind = load_connectivity(os.path.join(dir_independent,'GCLconnectivity_'+str(d)+'.npz'))
+		report[k] = [d,p_inc['dlens'].mean(),p_ind['dlens'].mean(),p_inc['dlens'].std(),p_ind['dlens'].std(),
+			ks_2samp(p_inc['dlens'],p_ind['dlens'])[0],p_inc['ddist'].std(),p_ind['ddist'].std(),
+			ks_2samp(p_inc['ddist'],p_ind['ddist'])[0]]
+	np.savetxt(filename,report,delimiter='\t',fmt='%.4f',
+		header='d\tdlens mean inc\tdlens mean ind\tdlens sd inc\tdlens sd ind\tdlens KS\tddist sd inc\tddist sd ind\tddist KS')
+	return report
+
+if __name__ == '__main__':
 
+	# First, set up positions of the glomeruli and granule cells in a sphere
+	glom_density = 6.6*10**-4 # per cubic um
+	glom_dx = 60; glom_dy = 20; glom_dz = 2;
+	grc_density = 1.9*10**-3 # per cubic um
 
+	diam = 80 # diameter of ball in um
+	dlen = 15 # target length of granule cell dendrites in um
+	N_syn_range = range(1,21) # range of dendrites/synapses per cell
 
+	# This gives the probability of each mossy fiber having 1, 2, 3, etc. glomeruli
+	# Taken from Sultan et al. 
+	p_num_glom = np.array([0.0,45.0,17.0,8.0,5.0])
+	p_num_glom = p_num_glom / p_num_glom.sum()
+	assert ( p_num_glom.sum() == 1)
+
+	seed = 0 # all connectivity files are reproducible from this seed
+	n_processes = cpu_count()
+	incremental = False # set to True to build each number of dendrites from the network for one dendrite less
+	validate = False # set to True to compare incremental and independent networks (writes incremental_validation.txt)
+
+	# Find randomly placed positions of the granule cells and glomeruli
+	np.random.seed(seed)
+	grc_pos = generate_grc_positions(grc_density,diam)
+	glom_pos, glom_mf_id = generate_glom_positions(p_num_glom,glom_density,glom_dx,glom_dy,glom_dz,diam)
+	# Seed of each number of dendrites, so that results do not depend on the number of processes
+	seeds = np.random.randint(2**31-1,size=len(N_syn_range))
+
+	# Connect granule cells to glomeruli, one process per number of dendrites (largest networks first), or
+	# incrementally in one chain (each number of dendrites starts from the network for one dendrite less)
+	connect = partial(make_connectivity,grc_pos=grc_pos,glom_pos=glom_pos,glom_mf_id=glom_mf_id,dlen=dlen)
+	connect_incremental = partial(make_connectivity_incremental,N_syn_range,seeds[0],grc_pos,glom_pos,glom_mf_id,dlen)
+	jobs = list(zip(N_syn_range,seeds))[::-1]
+	if validate:
+		# Compare incremental and independent networks, written to validation/
+		for directory in ['validation/incremental','validation/independent']:
+			if not os.path.isdir(directory):
+				os.makedirs(directory)
+		startTime = datetime.now()
+		connect_incremental(directory='validation/incremental')
+		print('Incremental: '+str(datetime.now() - startTime))
+		startTime = datetime.now()
+		pool = Pool(n_processes)
+		pool.map(partial(connect,directory='validation/independent'),jobs,chunksize=1)
+		pool.close()
+		pool.join()
+		print('Independent: '+str(datetime.now() - startTime))
+		validate_incremental(N_syn_range,'validation/incremental','validation/independent','incremental_validation.txt')
+	elif incremental:
+		for d, t in zip(N_syn_range,connect_incremental()):
+			print('Number of dendrites: '+str(d)+', '+str(t))
+	else:
+		pool = Pool(n_processes)
+		times = pool.map(connect,jobs,chunksize=1)
+		pool.close()
+		pool.join()
+		for (d, seed_d), t in sorted(zip(jobs,times)):
+			print('Number of dendrites: '+str(d)+', '+str(t))
@@ -0,0 +1,162 @@
+# Connectivity of large balls by domain decomposition, same algorithm as GCL_make_connectivity.py
+# The desired glomerular degrees are drawn for the whole ball with get_degreedist, as in the untiled algorithm.
+# The ball is divided into cubic tiles of side tile_size. Every granule cell belongs to the tile it lies in (its core)
+# and is connected only there, by alg_connections in a separate process, to the glomeruli within tile_size/2 + halo
+# of the tile centre, so that granule cells near a seam also see the glomeruli on the other side.
+# The desired degree of each glomerulus is split between the tiles that see it (allocate_degrees), so that every
+# tile connects exactly d dendrites per core granule cell and the degrees of the stitched network are the desired
+# ones. check_valid_connectivity holds for the stitched network with the desired degrees. The connectivity is
+# assembled and saved as a sparse matrix.
+# run as python GCL_make_connectivity_tiled.py
+
+import numpy as np
+from datetime import datetime
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from scipy import sparse
+from scipy.spatial import cKDTree
+from scipy.sparse.csgraph import maximum_flow
+from scipy.stats import ks_2samp
+from GCL_make_connectivity import generate_grc_positions, generate_glom_positions, renumber, get_degreedist, alg_connections, check_valid_connectivity
+from connectivity import save_connectivity
+
+# Core granule cells and glomeruli (with halo) of each tile
+def get_tiles(grc_pos,glom_pos,diam,tile_size,halo):
+	n_tiles = int(np.ceil(diam/tile_size))
+	tile_of_grc = np.minimum(((grc_pos+diam/2.)//tile_size).astype(int),n_tiles-1)
+	tile_of_grc = np.ravel_multi_index(tile_of_grc.T,(n_tiles,n_tiles,n_tiles))
+	grc_tiles = np.unique(tile_of_grc)
+	tiles = []
+	for tile in grc_tiles:
+		centre = -diam/2. + (np.array(np.unravel_index(tile,(n_tiles,n_tiles,n_tiles)))+0.5)*tile_size
+		gloms = np.where(np.all(np.abs(glom_pos-centre) <= tile_size/2.+halo,axis=1))[0]
+		tiles.append((np.where(tile_of_grc == tile)[0],gloms))
+	return tiles
+
+# Splits the desired degree of each glomerulus between the tiles that contain it, so that each tile gets d
+# connections per core granule cell and no mossy fiber gets more connections in a tile than there are core granule
+# cells (glom x tile, sparse). The split is a maximum flow from the glomeruli (capacity ddist) through the mossy
+# fibers of each tile (capacity number of core granule cells) to the tiles (capacity d x number of core granule
+# cells). The connections of each glomerulus to each tile are limited to its share in proportion to the core granule
+# cells of the tile within radius of it (so that glomeruli connect to nearby tiles), and the limit is raised until
+# all desired degrees are split
+def allocate_degrees(ddist,tiles,grc_pos,glom_pos,glom_mf_id,d,radius):
+	N_glom = len(ddist); N_tiles = len(tiles)
+	gl = np.concatenate([gloms for core, gloms in tiles])
+	tl = np.concatenate([t*np.ones(len(gloms),int) for t, (core, gloms) in enumerate(tiles)])
+	n_core = np.array([len(core) for core, gloms in tiles])
+	# Core granule cells of each tile within radius of each glomerulus (+1, so that every tile gets a share)
+	tile_of_grc = np.zeros(grc_pos.shape[0],int)
+	for t, (core, gloms) in enumerate(tiles):
+		tile_of_grc[core] = t
+	near = cKDTree(grc_pos).query_ball_point(glom_pos,radius)
+	near_gl = np.repeat(np.arange(N_glom),[len(n) for n in near])
+	near_tl = tile_of_grc[np.concatenate([np.array(n,int) for n in near])]
+	weight = 1 + np.bincount(near_gl*N_tiles+near_tl,minlength=N_glom*N_tiles)[gl*N_tiles+tl]
+	share = weight/np.bincount(gl,weights=weight,minlength=N_glom)[gl]
+	mf_tile, mt = np.unique(glom_mf_id[gl].astype(np.int64)*N_tiles+tl,return_inverse=True)
+	N_mt = len(mf_tile)
+	# Nodes: source, glomeruli, mossy fibers of each tile, tiles, sink
+	source = 0; sink = N_glom+N_mt+N_tiles+1
+	rows = np.concatenate([np.zeros(N_glom,int),1+gl,1+N_glom+np.arange(N_mt),1+N_glom+N_mt+np.arange(N_tiles)])
+	cols = np.concatenate([1+np.arange(N_glom),1+N_glom+mt,1+N_glom+N_mt+mf_tile%N_tiles,sink*np.ones(N_tiles,int)])
+	for slack in range(ddist.max()+1):
+		caps = np.minimum(np.ceil(ddist[gl]*share)+slack,ddist[gl])
+		data = np.concatenate([ddist,caps,n_core[mf_tile%N_tiles],d*n_core]).astype(np.int32)
+		flow = maximum_flow(sparse.csr_matrix((data,(rows,cols)),shape=(sink+1,sink+1)),source,sink)
+		if flow.flow_value == ddist.sum():
+			break
+	assert(flow.flow_value == ddist.sum()),'Desired glomerular degrees cannot be split between tiles, increase tile_size or halo.'
+	# Flow from each glomerulus to the mossy fiber nodes, summed per tile
+	flow = sparse.csr_matrix(flow.flow)[1:N_glom+1,N_glom+1:N_glom+N_mt+1].maximum(0)
+	return sparse.csc_matrix(flow.dot(sparse.csr_matrix((np.ones(N_mt),(np.arange(N_mt),mf_tile%N_tiles)),shape=(N_mt,N_tiles))))
+
+# Connects one tile (for a process pool): returns glomerulus and granule cell indices of the connections of its
+# core granule cells, with the glomerular degrees allocated to the tile
+def connect_tile(tile_seed,grc_pos,glom_pos,glom_mf_id,d,dlen):
+	(core, gloms, ddist), seed = tile_seed
+	np.random.seed(seed)
+	assert(np.unique(glom_mf_id[gloms]).shape[0] >= d),'Tile has fewer than '+str(d)+' mossy fibers, increase tile_size or halo.'
+	conn_mat = alg_connections(grc_pos[core],glom_pos[gloms],renumber(glom_mf_id[gloms]),d,dlen,ddist=ddist)
+	gl, grc = np.nonzero(conn_mat)
+	return gloms[gl], core[grc]
+
+# Connects all tiles and stitches them into one sparse connectivity matrix (N_glom x N_grc)
+def alg_connections_tiled(grc_pos,glom_pos,glom_mf_id,d,dlen,diam,tile_size,halo,seed,n_processes=1):
+	N_grc = grc_pos.shape[0]; N_glom = glom_pos.shape[0]
+	# Desired glomerular degrees of the whole ball, same as alg_connections with np.random.seed(seed)
+	np.random.seed(seed)
+	ddist = get_degreedist(glom_mf_id,N_grc,N_glom,d)
+	tiles = get_tiles(grc_pos,glom_pos,diam,tile_size,halo)
+	allocation = allocate_degrees(ddist,tiles,grc_pos,glom_pos,glom_mf_id,d,dlen)
+	tiles = [(core,gloms,allocation[gloms,t].toarray().ravel().astype(int)) for t, (core, gloms) in enumerate(tiles)]
+	# Seed of each tile, so that results do not depend on the number of processes
+	seeds = np.random.RandomState(seed).randint(2**31-1,size=len(tiles))
+	connect = partial(connect_tile,grc_pos=grc_pos,glom_pos=glom_pos,glom_mf_id=glom_mf_id,d=d,dlen=dlen)
+	if n_processes > 1:
+		pool = Pool(n_processes)
+		conns = pool.map(connect,list(zip(tiles,seeds)),chunksize=1)
+		pool.close()
+		pool.join()
+	else:
+		conns = [connect(tile_seed) for tile_seed in zip(tiles,seeds)]
+	gl = np.concatenate([c[0] for c in conns]); grc = np.concatenate([c[1] for c in conns])
+	conn_mat = sparse.csr_matrix((np.ones(len(gl),np.int8),(gl,grc)),shape=(N_glom,N_grc))
+	# Make sure the stitched connectivity matrix is valid and has the desired glomerular degrees
+	check_valid_connectivity(conn_mat,ddist,glom_mf_id,d)
+	return conn_mat
+
+# Compares the tiled with the untiled algorithm for a ball that alg_connections can connect as a whole: mean and sd
+# of dendritic lengths and glomerular degrees, and two-sample Kolmogorov-Smirnov statistics (tiled vs untiled)
+def compare_untiled(grc_pos,glom_pos,glom_mf_id,d,dlen,diam,tile_size,halo,seed,n_processes=1):
+	startTime = datetime.now()
+	conn_tiled = alg_connections_tiled(grc_pos,glom_pos,glom_mf_id,d,dlen,diam,tile_size,halo,seed,n_processes)
+	t_tiled = (datetime.now() - startTime).total_seconds()
+	np.random.seed(seed)
+	startTime = datetime.now()
+	conn_mat = alg_connections(grc_pos,glom_pos,glom_mf_id,d,dlen)
+	t_untiled = (datetime.now() - startTime).total_seconds()
+	results = []
+	for conn in [sparse.coo_matrix(conn_tiled),sparse.coo_matrix(conn_mat)]:
+		dlens = np.sqrt(((grc_pos[conn.col]-glom_pos[conn.row])**2).sum(axis=1))
+		ddist = np.bincount(conn.row,minlength=glom_pos.shape[0])
+		results.append((dlens,ddist))
+	print('Tiled {:.2f} s, untiled {:.2f} s'.format(t_tiled,t_untiled))
+	for k, name in enumerate(['Dendritic length','Glomerular degree']):
+		print('{}: tiled {:.2f} +- {:.2f}, untiled {:.2f} +- {:.2f}, KS statistic {:.3f}'.format(name,
+			results[0][k].mean(),results[0][k].std(),results[1][k].mean(),results[1][k].std(),
+			ks_2samp(results[0][k],results[1][k])[0]))
+
+if __name__ == '__main__':
+
+	# Network parameters as in GCL_make_connectivity.py
+	glom_density = 6.6*10**-4 # per cubic um
+	glom_dx = 60; glom_dy = 20; glom_dz = 2;
+	grc_density = 1.9*10**-3 # per cubic um
+	dlen = 15 # target length of granule cell dendrites in um
+	p_num_glom = np.array([0.0,45.0,17.0,8.0,5.0])
+	p_num_glom = p_num_glom / p_num_glom.sum()
+
+	diam = 300 # diameter of ball in um
+	N_syn_range = [4] # numbers of dendrites/synapses per cell
+	tile_size = 60 # side of the cubic tiles in um
+	halo = 20 # overlap of the tiles in um (should be larger than dlen)
+	seed = 0 # all connectivity files are reproducible from this seed
+	n_processes = cpu_count()
+	compare = False # set to True to compare with the untiled algorithm (only for small diam, e.g. 120)
+
+	np.random.seed(seed)
+	grc_pos = generate_grc_positions(grc_density,diam)
+	glom_pos, glom_mf_id = generate_glom_positions(p_num_glom,glom_density,glom_dx,glom_dy,glom_dz,diam)
+	print('{} glomeruli, {} granule cells'.format(glom_pos.shape[0],grc_pos.shape[0]))
+
+	for d in N_syn_range:
+		print('Number of dendrites: '+str(d))
+		if compare:
+			compare_untiled(grc_pos,glom_pos,glom_mf_id,d,dlen,diam,tile_size,halo,seed+d,n_processes)
+			continue
+		startTime = datetime.now()
+		conn_mat = alg_connections_tiled(grc_pos,glom_pos,glom_mf_id,d,dlen,diam,tile_size,halo,seed+d,n_processes)
+		print(datetime.now() - startTime)
+		# Save to file (sparse connectivity matrix, see connectivity.py)
+		save_connectivity('GCLconnectivity_'+str(d)+'_diam'+str(diam)+'.npz',conn_mat,glom_pos,grc_pos,glom_mf_id)
@@ -0,0 +1,124 @@
+
+# Times GCL_make_connectivity.alg_connections for increasing diameter of the ball, and compares the
+# connectivity with the previous implementation (connectivity matrix summed per granule cell and per mossy fiber
+# for every candidate granule cell, candidate swaps listed one by one), which is only run up to diam_reference
+# run as python benchmark_connectivity.py
+
+import numpy as np
+from datetime import datetime
+import GCL_make_connectivity as GCL
+
+
+# Previous implementation of closest_allowed_grc and the first (greedy) step of alg_connections, as reference
+def closest_allowed_grc_reference(attached_grcs,grc_pos,this_glom_pos,conn_mat,d,dlen):
+	N_grc = grc_pos.shape[0]
+	grcs_not_yet_attached = [n for n in range(N_grc) if n not in attached_grcs]
+	grcs_not_yet_full = [n for n in range(N_grc) if conn_mat[:,n].sum() < d]
+	grcs_available = [n for n in grcs_not_yet_full if n in grcs_not_yet_attached]
+	dists_from_glom = np.sqrt(((grc_pos-this_glom_pos)**2).sum(axis=1))
+	dists = np.abs(dists_from_glom-dlen)
+	if len(dists[grcs_available])>0:
+		grc_closest = grcs_available[np.argmin(dists[grcs_available])]
+	else:
+		grc_closest = -1
+	return grc_closest
+
+# Previous implementation of optswap and shuffle_conns (lists of candidate glomeruli for every pair of grcs),
+# as reference; both read glom_mf_id as a module variable. Swappable grcs B exclude those connected to the mossy
+# fiber of the incomplete glomerulus, as in GCL.shuffle_conns (previously only those connected to the glomerulus)
+def optswap_reference(glom_incomplete,grcs_incomplete,grcs_swappable,grc_pos,glom_pos,conn_mat,dlen):
+	N_glom = glom_pos.shape[0]; N_grc = grc_pos.shape[0]
+	gloms_swappable = []
+	for j in range(len(grcs_incomplete)):
+		gloms = [];
+		for k in range(len(grcs_swappable)):
+			gloms.append([gl for gl in range(N_glom) if (conn_mat[gl,grcs_swappable[k]]==1 and conn_mat[np.where(glom_mf_id==glom_mf_id[gl])[0],grcs_incomplete[j]].sum()==0)])
+		gloms_swappable.append(gloms)
+	deviation = np.zeros((len(grcs_incomplete),len(grcs_swappable)),float)
+	index_ii = np.zeros((len(grcs_incomplete),len(grcs_swappable)),int)
+	glom_i = glom_pos[glom_incomplete]
+	for i in range(len(grcs_incomplete)):
+		grc_A = grc_pos[grcs_incomplete[i]] 
+		for j in range(len(grcs_swappable)):
+			grc_B = grc_pos[grcs_swappable[j]]
+			dist_iB = np.sqrt(((glom_i - grc_B)**2).sum())
+			gloms = gloms_swappable[i][j]
+			deviation_temp = np.zeros((len(gloms)),float)
+			for k in range(len(gloms)):
+				glom_ii = glom_pos[gloms[k]]
+				dist_iiA = np.sqrt(((glom_ii - grc_A)**2).sum())
+				deviation_temp[k] = (dlen - dist_iB)**2 + (dlen - dist_iiA)**2
+			deviation[i,j] = deviation_temp.min()
+			index_ii[i,j] = deviation_temp.argmin()
+	index = np.where(deviation == deviation.min())
+	index_A = index[0][0]; index_B = index[1][0]
+	opt_grc_A = grcs_incomplete[index_A]
+	opt_grc_B = grcs_swappable[index_B]
+	opt_glom_ii = gloms_swappable[index_A][index_B][index_ii[index_A,index_B]]
+	conn_mat[opt_glom_ii,opt_grc_B] = 0
+	conn_mat[opt_glom_ii,opt_grc_A] = 1
+	conn_mat[glom_incomplete,opt_grc_B] = 1
+	return conn_mat
+
+def shuffle_conns_reference(grc_pos,glom_pos,d,dlen,gloms_incomplete,conn_mat,ddist):
+	N_grc = grc_pos.shape[0]
+	for gl in gloms_incomplete:
+		incomplete_conns = ddist[gl] - conn_mat[gl,:].sum()
+		for conn in range(incomplete_conns):
+			grcs_incomplete = [n for n in range(N_grc) if conn_mat[:,n].sum() < d]
+			grcs_swappable = [n for n in range(N_grc) if (n not in grcs_incomplete and conn_mat[glom_mf_id==glom_mf_id[gl],n].sum()==0)]
+			conn_mat = optswap_reference(gl,grcs_incomplete,grcs_swappable,grc_pos,glom_pos,conn_mat,dlen)
+	return conn_mat
+
+def alg_connections_reference(grc_pos,glom_pos,glom_mf_id,d,dlen):
+	N_grc = grc_pos.shape[0]; N_glom = glom_pos.shape[0]
+	ddist = GCL.get_degreedist(glom_mf_id,N_grc,N_glom,d)
+	conn_mat = np.zeros((N_glom,N_grc),int)
+	for conn in range(1,ddist.max()+1):
+		for gl in range(N_glom):
+			if conn <= ddist[gl]:
+				mf = glom_mf_id[gl]
+				glom_on_mf = np.where(glom_mf_id==mf)[0]
+				attached_grcs = np.where(conn_mat[glom_on_mf].sum(axis=0))[0]
+				this_grc = closest_allowed_grc_reference(attached_grcs,grc_pos,glom_pos[gl,:],conn_mat,d,dlen)
+				if this_grc >= 0:
+					conn_mat[gl,this_grc] = 1
+	if not np.all(conn_mat.sum(axis=1) - ddist==0):
+		gloms_incomplete = np.where(conn_mat.sum(axis=1) != ddist)[0]
+		conn_mat = shuffle_conns_reference(grc_pos,glom_pos,d,dlen,gloms_incomplete,conn_mat,ddist)
+	GCL.check_valid_connectivity(conn_mat,ddist,glom_mf_id,d)
+	return conn_mat
+
+def run_timed(function,seed,*args):
+	np.random.seed(seed)
+	startTime = datetime.now()
+	conn_mat = function(*args)
+	return conn_mat, (datetime.now() - startTime).total_seconds()
+
+
+if __name__ == '__main__':
+
+	# Network parameters as in GCL_make_connectivity.py
+	glom_density = 6.6*10**-4 # per cubic um
+	glom_dx = 60; glom_dy = 20; glom_dz = 2;
+	grc_density = 1.9*10**-3 # per cubic um
+	dlen = 15
+	d = 4
+	p_num_glom = np.array([0.0,45.0,17.0,8.0,5.0])
+	p_num_glom = p_num_glom / p_num_glom.sum()
+
+	diams = [40,60,80,100,120]
+	diam_reference = 80 # largest diameter the previous implementation is run for
+
+	for diam in diams:
+		np.random.seed(0)
+		grc_pos = GCL.generate_grc_positions(grc_density,diam)
+		glom_pos, glom_mf_id = GCL.generate_glom_positions(p_num_glom,glom_density,glom_dx,glom_dy,glom_dz,diam)
+		conn_mat, t_conn = run_timed(GCL.alg_connections,1,grc_pos,glom_pos,glom_mf_id,d,dlen)
+		result = 'diam {}: {} glomeruli, {} granule cells; {:.2f} s'.format(
+			diam,glom_pos.shape[0],grc_pos.shape[0],t_conn)
+		if diam <= diam_reference:
+			conn_ref, t_ref = run_timed(alg_connections_reference,1,grc_pos,glom_pos,glom_mf_id,d,dlen)
+			assert(np.array_equal(conn_mat,conn_ref)),'Connectivity differs from previous implementation.'
+			result = result + ', previous implementation {:.2f} s (same connectivity)'.format(t_ref)
+		print(result)
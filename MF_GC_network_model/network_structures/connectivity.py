@@ -0,0 +1,123 @@
+# Sparse MF-GC connectivity files
+# GCLconnectivity_{N_syn}.npz stores the glomerulus x GC connectivity as a compressed sparse row (CSR) matrix
+# (indptr, indices; every connection has weight 1) together with
+#   glom_pos, grc_pos: positions (um)
+#   glom_mf_id: mossy fiber of each glomerulus
+#   ddist: glomerulus degrees
+#   dlens: dendritic lengths, in the order of the connections (by glomerulus, then granule cell)
+# The GCs of a glomerulus are a slice of indices (fan_out); the glomeruli of a GC are a slice of the CSC matrix
+# (fan_in), so lookups take O(degree) instead of a scan over a dense row or column.
+# load_connectivity also reads the legacy files with a dense conn_mat (GCLconnectivity_{N_syn}.pkl and .mat).
+# run as python connectivity.py GCLconnectivity_4.pkl to convert a legacy file to .npz (legacy files without
+# glom_mf_id are saved with one mossy fiber per glomerulus, as they are used by the simulations)
+
+import numpy as np
+import os
+import pickle as pkl
+import scipy.io as io
+import sys
+from scipy import sparse
+
+
+def connectivity_file(N_syn, directory='.'):
+    """
+    Connectivity file for N_syn dendrites per GC: .npz if it exists, otherwise the legacy .pkl or .mat file.
+    """
+    for ext in ['.npz', '.pkl', '.mat']:
+        filename = os.path.join(directory, 'GCLconnectivity_{:.0f}{}'.format(N_syn, ext))
+        if os.path.exists(filename):
+            return filename
+    raise IOError('No connectivity file for N_syn = {:.0f} in {}.'.format(N_syn, directory))
+
+
+def save_connectivity(filename, conn_mat, glom_pos, grc_pos, glom_mf_id, ddist=None, dlens=None):
+    """
+    Saves connectivity as .npz with a sparse connectivity matrix.
+
+    :param filename: name of the .npz file
+    :param conn_mat: connectivity matrix (N_glom x N_grc), dense or sparse
+    :param glom_pos: glomerulus positions (N_glom x 3)
+    :param grc_pos: granule cell positions (N_grc x 3)
+    :param glom_mf_id: mossy fiber of each glomerulus
+    :param ddist: glomerulus degrees (default: computed from conn_mat)
+    :param dlens: dendritic lengths in CSR order (default: computed from the positions)
+    """
+    conn_mat = _as_csr(conn_mat)
+    if ddist is None:
+        ddist = np.diff(conn_mat.indptr)
+    if dlens is None:
+        dlens = dendrite_lengths(conn_mat, glom_pos, grc_pos)
+    file = open(filename, 'wb')
+    np.savez_compressed(file, indptr=conn_mat.indptr, indices=conn_mat.indices, shape=conn_mat.shape,
+                        glom_pos=glom_pos, grc_pos=grc_pos, glom_mf_id=glom_mf_id, ddist=ddist, dlens=dlens)
+    file.close()
+
+
+def load_connectivity(filename):
+    """
+    Loads a connectivity file (.npz, or legacy .pkl/.mat with a dense conn_mat).
+
+    :return: dict with conn_mat (CSR matrix, N_glom x N_grc), glom_pos, grc_pos, glom_mf_id (None if not stored
+             in a legacy file), ddist and dlens
+    """
+    if filename.endswith('.npz'):
+        f = np.load(filename)
+        p = dict((key, f[key]) for key in f.files)
+        shape = tuple(p.pop('shape'))
+        indices, indptr = p.pop('indices'), p.pop('indptr')
+        p['conn_mat'] = sparse.csr_matrix((np.ones(len(indices), np.int8), indices, indptr), shape=shape)
+    else:
+        if filename.endswith('.mat'):
+            p = io.loadmat(filename)
+        else:
+            file = open(filename, 'rb')
+            p = pkl.load(file, encoding='latin1') if sys.version_info[0] > 2 else pkl.load(file)
+            file.close()
+        p = {'conn_mat': _as_csr(p['conn_mat']), 'glom_pos': p['glom_pos'], 'grc_pos': p['grc_pos'],
+             'glom_mf_id': np.ravel(p['glom_mf_id']) if 'glom_mf_id' in p else None,
+             'ddist': np.ravel(p['ddist']), 'dlens': np.ravel(p['dlens'])}
+
+    return p
+
+
+def _as_csr(conn_mat):
+    conn_mat = sparse.csr_matrix(conn_mat, dtype=np.int8)
+    conn_mat.eliminate_zeros()
+    conn_mat.sort_indices()
+    return conn_mat
+
+
+def fan_out(conn_mat, gl):
+    """
+    Granule cells connected to glomerulus gl.
+
+    :param conn_mat: connectivity matrix in CSR format
+    """
+    return conn_mat.indices[conn_mat.indptr[gl]:conn_mat.indptr[gl + 1]]
+
+
+def fan_in(conn_mat_csc, grc):
+    """
+    Glomeruli connected to granule cell grc.
+
+    :param conn_mat_csc: connectivity matrix in CSC format (conn_mat.tocsc())
+    """
+    return conn_mat_csc.indices[conn_mat_csc.indptr[grc]:conn_mat_csc.indptr[grc + 1]]
+
+
+def dendrite_lengths(conn_mat, glom_pos, grc_pos):
+    """
+    Length of each dendrite (glomerulus-granule cell distance), in CSR order.
+    """
+    conn_mat = _as_csr(conn_mat)
+    gl = np.repeat(np.arange(conn_mat.shape[0]), np.diff(conn_mat.indptr))
+    return np.sqrt(((grc_pos[conn_mat.indices, :] - glom_pos[gl, :])**2).sum(axis=1))
+
+
+if __name__ == '__main__':
+
+    for filename in sys.argv[1:]:
+        p = load_connectivity(filename)
+        save_connectivity(os.path.splitext(filename)[0] + '.npz', p['conn_mat'], p['glom_pos'], p['grc_pos'],
+                          p['glom_mf_id'] if p['glom_mf_id'] is not None else np.arange(p['conn_mat'].shape[0]),
+                          p['ddist'], p['dlens'])
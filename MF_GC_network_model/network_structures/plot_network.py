@@ -1,31 +1,28 @@
 import numpy as np
-import pickle as pkl
 import matplotlib
 matplotlib.use('TkAgg')
 from matplotlib import pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+import connectivity
 
 
-file = open('GCLconnectivity_4.pkl')
-p = pkl.load(file)
-file.close()
+p = connectivity.load_connectivity(connectivity.connectivity_file(4))
 conn_mat = p['conn_mat']
 grc_pos = p['grc_pos']
 glom_pos = p['glom_pos']
 N_mf, N_grc = conn_mat.shape
-assert (np.all(conn_mat.sum(axis=0) == 4)), 'Connectivity matrix is incorrect.'
+assert (np.all(np.bincount(conn_mat.indices, minlength=N_grc) == 4)), 'Connectivity matrix is incorrect.'
 
 
 fig = plt.figure()
 ax = fig.add_subplot(111, projection='3d')
 
 for k1 in range(N_mf):
-    for k2 in range(N_grc):
-        if conn_mat[k1, k2] == 1:
-            ax.plot([glom_pos[k1, 0], grc_pos[k2, 0]],
-                    [glom_pos[k1, 1], grc_pos[k2, 1]],
-                    [glom_pos[k1, 2], grc_pos[k2, 2]],
-                    color='grey', alpha=0.6)
+    for k2 in connectivity.fan_out(conn_mat, k1):
+        ax.plot([glom_pos[k1, 0], grc_pos[k2, 0]],
+                [glom_pos[k1, 1], grc_pos[k2, 1]],
+                [glom_pos[k1, 2], grc_pos[k2, 2]],
+                color='grey', alpha=0.6)
 
 ax.plot(grc_pos[:, 0], grc_pos[:, 1], grc_pos[:, 2], c='b', marker='o', linestyle='')
 ax.plot(glom_pos[:, 0], glom_pos[:, 1], glom_pos[:, 2], c='r', marker='o', linestyle='')
@@ -0,0 +1,28 @@
+# Tests of the connectivity algorithm (GCL_make_connectivity.py)
+# run as python -m pytest test_connectivity.py, or python test_connectivity.py
+
+import numpy as np
+from GCL_make_connectivity import shuffle_conns, check_valid_connectivity
+
+# Glom i (0) is missing one connection and grc A (0) one dendrite. Grc B (1) is not connected to glom i, but to
+# glom 1, which belongs to the same mossy fiber as glom i, and to glom 2. Swapping B from glom 2 to glom i has the
+# smallest deviation from dlen, but would connect the mossy fiber of glom i twice to B; shuffle_conns has to
+# swap grc C (2) instead
+def test_swap_excludes_grc_on_mossy_fiber_of_glom():
+	d = 2; dlen = 10
+	glom_mf_id = np.array([0,0,1,2])
+	ddist = np.array([1,1,2,2])
+	glom_pos = np.array([[0.,0,0],[50,0,0],[0,40,0],[0,-50,0]])
+	grc_pos = np.array([[0.,30,0],[10,0,0],[-20,0,0]])
+	conn_mat = np.zeros((4,3),int)
+	conn_mat[[1,2],1] = 1
+	conn_mat[[2,3],2] = 1
+	conn_mat[3,0] = 1
+	conn_mat = shuffle_conns(grc_pos,glom_pos,glom_mf_id,d,dlen,[0],conn_mat,ddist)
+	assert(conn_mat[0,1] == 0)
+	assert(conn_mat[0,2] == 1 and conn_mat[2,0] == 1)
+	check_valid_connectivity(conn_mat,ddist,glom_mf_id,d)
+
+if __name__ == '__main__':
+	test_swap_excludes_grc_on_mossy_fiber_of_glom()
+	print('ok')
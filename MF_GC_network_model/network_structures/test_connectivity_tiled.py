@@ -0,0 +1,46 @@
+# Tests of the tiled connectivity algorithm (GCL_make_connectivity_tiled.py) against the untiled one
+# run as python -m pytest test_connectivity_tiled.py, or python test_connectivity_tiled.py
+
+import numpy as np
+from scipy import sparse
+from GCL_make_connectivity import generate_grc_positions, generate_glom_positions, get_degreedist, alg_connections
+from GCL_make_connectivity_tiled import alg_connections_tiled
+
+# Network parameters as in GCL_make_connectivity.py
+glom_density = 6.6*10**-4; glom_dx = 60; glom_dy = 20; glom_dz = 2
+grc_density = 1.9*10**-3
+dlen = 15
+p_num_glom = np.array([0.0,45.0,17.0,8.0,5.0])
+p_num_glom = p_num_glom / p_num_glom.sum()
+d = 4
+
+def make_ball(diam,seed=0):
+	np.random.seed(seed)
+	grc_pos = generate_grc_positions(grc_density,diam)
+	glom_pos, glom_mf_id = generate_glom_positions(p_num_glom,glom_density,glom_dx,glom_dy,glom_dz,diam)
+	return grc_pos, glom_pos, glom_mf_id
+
+# For a ball that fits in one tile, the glomerular degrees are the same as for the untiled algorithm
+def test_one_tile_matches_untiled():
+	diam = 60; seed = 5
+	grc_pos, glom_pos, glom_mf_id = make_ball(diam)
+	conn_tiled = alg_connections_tiled(grc_pos,glom_pos,glom_mf_id,d,dlen,diam,diam,20,seed)
+	np.random.seed(seed)
+	conn_mat = alg_connections(grc_pos,glom_pos,glom_mf_id,d,dlen)
+	assert(np.array_equal(np.asarray(conn_tiled.sum(axis=1)).ravel(),conn_mat.sum(axis=1)))
+	assert(np.array_equal(np.asarray(conn_tiled.sum(axis=0)).ravel(),conn_mat.sum(axis=0)))
+
+# With several tiles, the stitched network has the glomerular degrees drawn for the whole ball
+def test_tiles_keep_desired_degrees():
+	diam = 100; seed = 5
+	grc_pos, glom_pos, glom_mf_id = make_ball(diam)
+	conn_tiled = sparse.coo_matrix(alg_connections_tiled(grc_pos,glom_pos,glom_mf_id,d,dlen,diam,40,20,seed))
+	np.random.seed(seed)
+	ddist = get_degreedist(glom_mf_id,grc_pos.shape[0],glom_pos.shape[0],d)
+	assert(np.array_equal(np.bincount(conn_tiled.row,minlength=glom_pos.shape[0]),ddist))
+	assert(np.all(np.bincount(conn_tiled.col,minlength=grc_pos.shape[0]) == d))
+
+if __name__ == '__main__':
+	test_one_tile_matches_untiled()
+	test_tiles_keep_desired_degrees()
+	print('ok')